@@ -100,7 +100,13 @@ MAIN_KEYMAP_PATH_4 := $(KEYBOARD_PATH_4)/keymaps/$(KEYMAP)
 MAIN_KEYMAP_PATH_5 := $(KEYBOARD_PATH_5)/keymaps/$(KEYMAP)
 
 # Pull in rules from info.json
-INFO_RULES_MK = $(shell $(QMK_BIN) generate-rules-mk --quiet --escape --keyboard $(KEYBOARD) --output $(KEYBOARD_OUTPUT)/src/rules.mk)
+#
+# generate-all writes rules.mk, info_config.h, default_keyboard.h and layouts.h
+# from a single info.json pass. Files whose content did not change are left
+# alone, so their mtime only moves when they really change and objects that
+# include them are not rebuilt. The per-file recipes below only run when a
+# header is missing, or older than an info.json it was not rewritten for.
+INFO_RULES_MK = $(shell $(QMK_BIN) generate-all --quiet --escape --keyboard $(KEYBOARD) --output $(KEYBOARD_OUTPUT)/src)
 include $(INFO_RULES_MK)
 
 # Check for keymap.json first, so we can regenerate keymap.c
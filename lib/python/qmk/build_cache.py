@@ -0,0 +1,228 @@
+"""A cache of `qmk multibuild` results, so that targets whose inputs have not changed are not built again.
+
+Results are keyed by a fingerprint of everything that goes into building a target: the core directories and makefiles, the toolchain version, the keyboard's folders, the keymap and the keymap's userspace. Each result is stored with `qmk.cache` in the `firmware` namespace, next to a copy of the firmware file that was built. Artifacts are evicted least recently used first once the cache grows past its size limit.
+"""
+import hashlib
+import os
+import shutil
+from functools import lru_cache
+from pathlib import Path
+
+from milc import cli
+
+import qmk.keyboard
+from qmk.build_plan import target_hardware
+from qmk.cache import CACHE_DIR, cache_get, cache_put, files_digest, library_digest
+from qmk.constants import QMK_FIRMWARE
+from qmk.makefile import parse_rules_mk_file
+
+FIRMWARE_CACHE = 'firmware'
+FIRMWARE_CACHE_DIR = CACHE_DIR / FIRMWARE_CACHE
+
+# Bump this to rebuild every target once the way fingerprints are computed changes.
+FIRMWARE_CACHE_VERSION = 2
+
+# Files and directories every target is built from, relative to qmk_firmware
+CORE_PATHS = 'Makefile', '*.mk', 'data', 'drivers', 'layouts/default', 'lib', 'platforms', 'quantum', 'tmk_core'
+
+# The compilers whose version goes into the fingerprint of each platform
+TOOLCHAINS = {
+    'arm': 'arm-none-eabi-gcc',
+    'avr': 'avr-gcc',
+}
+
+FIRMWARE_SUFFIXES = '.bin', '.hex', '.uf2'
+
+
+def _walk_files(directory, skip_dir=None):
+    """Returns every file below `directory`, sorted, leaving out directories for which `skip_dir(path)` is true.
+    """
+    files = []
+
+    for root, dirs, filenames in os.walk(directory):
+        dirs[:] = sorted(name for name in dirs if not (skip_dir and skip_dir(os.path.join(root, name))))
+        files.extend(os.path.join(root, filename) for filename in sorted(filenames))
+
+    return files
+
+
+@lru_cache(maxsize=None)
+def _directory_digest(directory):
+    """Returns a digest of the names and contents of every file below `directory`.
+    """
+    return files_digest(_walk_files(directory))
+
+
+@lru_cache(maxsize=None)
+def core_digest():
+    """Returns a digest of the files every target is built from, and of the qmk python library that generates some of them.
+    """
+    paths = []
+
+    # Paths are relative to qmk_firmware, so that a checkout in another place has the same fingerprints
+    for pattern in CORE_PATHS:
+        for path in sorted(Path('.').glob(pattern)):
+            paths.extend(_walk_files(path) if path.is_dir() else [str(path)])
+
+    return hashlib.sha1(f'{library_digest()}\0{files_digest(paths)}'.encode('utf-8')).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def toolchain_version(platform):
+    """Returns the version banner of the compiler for `platform`, or 'missing' if it is not installed.
+    """
+    try:
+        compiler = cli.run([TOOLCHAINS[platform], '--version'])
+
+    except OSError:
+        return 'missing'
+
+    return compiler.stdout.split('\n', 1)[0]
+
+
+def _is_keyboard_level(path):
+    """Returns True if `path` holds the files of a keyboard or one of its revisions, or keymaps, rather than files its parent is built from.
+    """
+    return os.path.basename(path) == 'keymaps' or any(os.path.exists(os.path.join(path, name)) for name in ('rules.mk', 'info.json', 'config.h'))
+
+
+@lru_cache(maxsize=None)
+def _keyboard_level_digest(folder):
+    """Returns a digest of the files in one folder of a keyboard, including subdirectories that are not keyboards or keymaps.
+    """
+    return files_digest(_walk_files(Path('keyboards') / folder, skip_dir=_is_keyboard_level))
+
+
+def firmware_fingerprint(keyboard, keymap, keymap_dir):
+    """Returns the cache key for building `keymap`, found in `keymap_dir`, for `keyboard`.
+    """
+    keymap_dir = Path(os.path.relpath(keymap_dir, QMK_FIRMWARE))
+    rules = parse_rules_mk_file(keymap_dir / 'rules.mk', dict(qmk.keyboard.rules_mk(keyboard)))
+    user_dir = Path('users') / rules.get('USER_NAME', keymap)
+    folders = []
+    parent = ''
+
+    for part in keyboard.split('/'):
+        parent = f'{parent}/{part}' if parent else part
+        folders.append(f'{parent}:{_keyboard_level_digest(parent)}')
+
+    fingerprint = [
+        f'version={FIRMWARE_CACHE_VERSION}',
+        f'core={core_digest()}',
+        f'toolchain={toolchain_version(target_hardware(keyboard)[1])}',
+        f'target={keyboard}:{keymap}',
+        *folders,
+        f'keymap={keymap_dir}:{_directory_digest(keymap_dir)}',
+        f'user={user_dir}:{_directory_digest(user_dir)}',
+    ]
+
+    return hashlib.sha1('\0'.join(fingerprint).encode('utf-8')).hexdigest()
+
+
+def firmware_file(keyboard, keymap, since=None):
+    """Returns the firmware file a build leaves in qmk_firmware, or None if there is none newer than `since`.
+    """
+    target = f'{keyboard.replace("/", "_")}_{keymap}'
+
+    for suffix in FIRMWARE_SUFFIXES:
+        path = Path(QMK_FIRMWARE) / f'{target}{suffix}'
+
+        if path.exists() and (since is None or path.stat().st_mtime >= since):
+            return path
+
+    return None
+
+
+def cached_build(fingerprint):
+    """Returns the cached result for `fingerprint`, or None.
+
+    The result is marked as recently used, so that it is evicted last. A result whose firmware file has gone missing, eg because another process evicted it, is removed and treated as a miss.
+    """
+    build = cache_get(FIRMWARE_CACHE, fingerprint)
+
+    if build and build['artifact']:
+        try:
+            os.utime(FIRMWARE_CACHE_DIR / f'{fingerprint}{build["artifact"]}')
+
+        except OSError:
+            _remove_files([FIRMWARE_CACHE_DIR / f'{fingerprint}.json'])
+            return None
+
+    return build
+
+
+def restore_firmware(fingerprint, build, keyboard, keymap):
+    """Copy the cached firmware for a result to where a build would have left it.
+
+    Returns False if the cached firmware could not be copied, in which case the target has to be built.
+    """
+    if build['artifact']:
+        target = f'{keyboard.replace("/", "_")}_{keymap}'
+
+        try:
+            shutil.copyfile(FIRMWARE_CACHE_DIR / f'{fingerprint}{build["artifact"]}', Path(QMK_FIRMWARE) / f'{target}{build["artifact"]}')
+
+        except OSError as e:
+            cli.log.debug('Could not restore the cached firmware for %s:%s: %s', keyboard, keymap, e)
+            return False
+
+    return True
+
+
+def store_build(fingerprint, build, firmware=None, build_log=None):
+    """Cache the result of a build, along with a copy of its `firmware` file and the `build_log` of a failed build.
+    """
+    artifact = None
+
+    if firmware:
+        artifact = firmware.suffix
+        FIRMWARE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(firmware, FIRMWARE_CACHE_DIR / f'{fingerprint}{artifact}')
+
+    cache_put(FIRMWARE_CACHE, fingerprint, {**build, 'artifact': artifact, 'log': build_log})
+
+
+def _remove_files(paths):
+    """Remove `paths`, skipping any that another process has already removed.
+    """
+    for path in paths:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def evict_firmware_cache(max_bytes):
+    """Remove the least recently used results until the firmware cache takes up no more than `max_bytes`.
+
+    Returns the number of results removed. Files another process removes at the same time are skipped.
+    """
+    entries = {}
+
+    if not FIRMWARE_CACHE_DIR.is_dir():
+        return 0
+
+    for entry in os.scandir(FIRMWARE_CACHE_DIR):
+        fingerprint = entry.name.split('.', 1)[0]
+
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue
+
+        last_used, size, files = entries.get(fingerprint, (0, 0, []))
+        entries[fingerprint] = max(last_used, stat.st_mtime), size + stat.st_size, files + [entry.path]
+
+    total_size = sum(size for _, size, _ in entries.values())
+    evicted = 0
+
+    for last_used, size, files in sorted(entries.values()):
+        if total_size <= max_bytes:
+            break
+
+        # Remove the result before its firmware, so an interrupted eviction never leaves a result without its firmware
+        _remove_files(sorted(files, key=lambda path: not path.endswith('.json')))
+        total_size -= size
+        evicted += 1
+
+    return evicted
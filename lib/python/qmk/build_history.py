@@ -0,0 +1,142 @@
+"""A record of the targets built by `qmk multibuild`, used to report on past runs.
+
+Every target of every run is appended to `.build/multibuild_history.jsonl` as one JSON object with these keys:
+
+    run: an id shared by every target of one run, which sorts in the order runs were started
+    keyboard, keymap: the target that was built
+    start: when the build started, in seconds since the epoch
+    seconds: the wall time of the build
+    returncode: the exit status of make
+    warnings, errors: how many files were compiled with warnings or errors
+    size: the size of the firmware in bytes, or None if it was not built
+
+Only the most recent `BUILD_HISTORY_RUNS` runs are kept.
+"""
+import json
+import os
+import re
+from pathlib import Path
+from statistics import median
+
+from qmk.constants import BUILD_DIR
+
+BUILD_HISTORY_FILE = Path(BUILD_DIR) / 'multibuild_history.jsonl'
+BUILD_HISTORY_RUNS = 20
+
+# The last row of `size --target=ihex <firmware>.hex`, which is printed after every successful build
+_firmware_size_re = re.compile(r'^\s*\d+\s+\d+\s+\d+\s+(\d+)\s+[0-9a-f]+\s+\S+\.hex\s*$', re.MULTILINE)
+
+
+def parse_build_log(build_log):
+    """Returns the number of `warnings` and `errors` and the firmware `size` found in the output of a build.
+    """
+    sizes = _firmware_size_re.findall(build_log)
+
+    return {
+        'warnings': build_log.count('[WARNINGS]'),
+        'errors': build_log.count('[ERRORS]'),
+        'size': int(sizes[-1]) if sizes else None,
+    }
+
+
+def load_build_history():
+    """Returns every recorded build, oldest run first.
+
+    Lines that can not be parsed, such as one cut short by an interrupted run, are skipped.
+    """
+    history = []
+
+    try:
+        with BUILD_HISTORY_FILE.open(encoding='utf-8') as fd:
+            for line in fd:
+                try:
+                    history.append(json.loads(line))
+
+                except ValueError:
+                    continue
+
+    except OSError:
+        return []
+
+    return sorted(history, key=lambda build: build['run'])
+
+
+def record_builds(builds):
+    """Add the builds of one run to the history, dropping the oldest runs when there are more than `BUILD_HISTORY_RUNS`.
+    """
+    if not builds:
+        return
+
+    BUILD_HISTORY_FILE.parent.mkdir(parents=True, exist_ok=True)
+
+    with BUILD_HISTORY_FILE.open('a', encoding='utf-8') as fd:
+        fd.write(''.join(json.dumps(build) + '\n' for build in builds))
+
+    history = load_build_history()
+    runs = sorted({build['run'] for build in history})
+
+    if len(runs) > BUILD_HISTORY_RUNS:
+        kept_runs = set(runs[-BUILD_HISTORY_RUNS:])
+        tmp_file = BUILD_HISTORY_FILE.parent / f'{BUILD_HISTORY_FILE.name}.{os.getpid()}'
+        tmp_file.write_text(''.join(json.dumps(build) + '\n' for build in history if build['run'] in kept_runs), encoding='utf-8')
+        tmp_file.replace(BUILD_HISTORY_FILE)
+
+
+def target_builds(history):
+    """Returns a dictionary mapping each `(keyboard, keymap)` target in `history` to its builds, oldest first.
+    """
+    targets = {}
+
+    for build in history:
+        targets.setdefault((build['keyboard'], build['keymap']), []).append(build)
+
+    return targets
+
+
+def slowest_targets(history, count):
+    """Returns `(target, median seconds, builds)` for the `count` targets whose successful builds took longest.
+    """
+    slowest = []
+
+    for target, builds in target_builds(history).items():
+        seconds = [build['seconds'] for build in builds if build['returncode'] == 0]
+
+        if seconds:
+            slowest.append((target, median(seconds), len(seconds)))
+
+    return sorted(slowest, key=lambda item: item[1], reverse=True)[:count]
+
+
+def regressed_targets(history, count):
+    """Returns `(target, median seconds before, seconds now)` for the `count` targets whose last build slowed down the most.
+
+    The last build is compared with the median of the earlier successful builds. Targets whose last build failed are left out.
+    """
+    regressed = []
+
+    for target, builds in target_builds(history).items():
+        last_build = builds[-1]
+        earlier = [build['seconds'] for build in builds[:-1] if build['returncode'] == 0]
+
+        if last_build['returncode'] == 0 and earlier:
+            before = median(earlier)
+
+            if last_build['seconds'] > before:
+                regressed.append((target, before, last_build['seconds']))
+
+    return sorted(regressed, key=lambda item: item[2] / max(item[1], 0.001), reverse=True)[:count]
+
+
+def flaky_targets(history, count):
+    """Returns `(target, result changes, failures, builds)` for the `count` targets whose result changed most often between runs.
+    """
+    flaky = []
+
+    for target, builds in target_builds(history).items():
+        failed = [build['returncode'] != 0 for build in builds]
+        changes = sum(before != after for before, after in zip(failed, failed[1:]))
+
+        if changes:
+            flaky.append((target, changes, sum(failed), len(builds)))
+
+    return sorted(flaky, key=lambda item: (item[1], item[2]), reverse=True)[:count]
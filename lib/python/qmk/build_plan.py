@@ -0,0 +1,119 @@
+"""Plan `qmk multibuild` runs using predicted build durations.
+
+A target's duration is predicted from its own successful builds in the build history. Targets that have never been built successfully are predicted from the builds of other targets with the same MCU or platform, or from `DEFAULT_BUILD_SECONDS` when there are none.
+"""
+import hashlib
+import heapq
+from statistics import median
+
+import qmk.keyboard
+from qmk.build_history import target_builds
+from qmk.constants import CHIBIOS_PROCESSORS
+
+# Rough single core build times, used until the history has builds for a platform
+DEFAULT_BUILD_SECONDS = {
+    'avr': 15.0,
+    'arm': 40.0,
+}
+
+
+def target_hardware(keyboard):
+    """Returns the `(MCU, platform)` of a keyboard, where the platform is 'arm' or 'avr'.
+
+    Keyboards without an MCU are built for the default atmega32u4, so they are counted as 'avr'.
+    """
+    mcu = qmk.keyboard.rules_mk(keyboard).get('MCU')
+
+    return mcu, 'arm' if mcu in CHIBIOS_PROCESSORS else 'avr'
+
+
+def predict_durations(targets, history):
+    """Returns a dictionary mapping each `(keyboard, keymap)` in `targets` to its predicted build time in seconds.
+    """
+    recorded = {}
+    hardware = {}
+    mcu_seconds = {}
+    platform_seconds = {}
+
+    for target, builds in target_builds(history).items():
+        seconds = [build['seconds'] for build in builds if build['returncode'] == 0]
+
+        if seconds:
+            recorded[target] = median(seconds)
+
+    for target in set(recorded) | set(targets):
+        hardware[target] = target_hardware(target[0])
+
+    for target, seconds in recorded.items():
+        mcu, platform = hardware[target]
+        mcu_seconds.setdefault(mcu, []).append(seconds)
+        platform_seconds.setdefault(platform, []).append(seconds)
+
+    durations = {}
+
+    for target in targets:
+        mcu, platform = hardware[target]
+
+        if target in recorded:
+            durations[target] = recorded[target]
+        elif mcu in mcu_seconds:
+            durations[target] = median(mcu_seconds[mcu])
+        elif platform in platform_seconds:
+            durations[target] = median(platform_seconds[platform])
+        else:
+            durations[target] = DEFAULT_BUILD_SECONDS[platform]
+
+    return durations
+
+
+def longest_first(durations):
+    """Returns the targets in `durations` ordered by predicted duration, longest first.
+    """
+    return sorted(durations, key=lambda target: (-durations[target], target))
+
+
+def predict_schedule(durations, order, jobs):
+    """Predict how `jobs` parallel make jobs that start the targets in `order` would run.
+
+    Each target is assumed to use one job for its whole build. Returns the predicted wall time in seconds and the critical path, the targets built one after the other by the job that finishes last.
+    """
+    paths = [[] for _ in range(jobs)]
+    finish_times = [(0.0, job) for job in range(jobs)]
+
+    for target in order:
+        finish_time, job = heapq.heappop(finish_times)
+        paths[job].append(target)
+        heapq.heappush(finish_times, (finish_time + durations[target], job))
+
+    wall_time, job = max(finish_times)
+
+    return wall_time, paths[job]
+
+
+def shard_targets(durations, count):
+    """Split the targets in `durations` into `count` shards with about the same total predicted duration.
+
+    Targets are handed out longest first, each to the shard with the least work so far. The result only depends on `durations`, so every node given the same build history computes the same shards. Returns a list of `count` sorted lists of targets.
+    """
+    shards = [[] for _ in range(count)]
+    totals = [(0.0, index) for index in range(count)]
+
+    for target in longest_first(durations):
+        total, index = heapq.heappop(totals)
+        shards[index].append(target)
+        heapq.heappush(totals, (total + durations[target], index))
+
+    return [sorted(shard) for shard in shards]
+
+
+def plan_digest(durations):
+    """Returns a digest of the predicted `durations` that `shard_targets()` splits the targets by.
+
+    Nodes with the same digest and shard count compute the same shards.
+    """
+    hasher = hashlib.sha1()
+
+    for target, seconds in sorted(durations.items()):
+        hasher.update(f'{target}\0{seconds!r}\n'.encode('utf-8'))
+
+    return hasher.hexdigest()
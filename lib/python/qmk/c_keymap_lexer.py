@@ -0,0 +1,289 @@
+"""A lexer for the keymaps array of keymap.c files.
+
+`iter_keymap_tokens()` yields the tokens `qmk.keymap` reads layers from, split and classified the same way pygments' `CLexer` does it. Only the keymaps array itself is split into tokens. Before it, the lexer only looks for the words of the array's declaration and for brackets, skipping over comments, literals and preprocessor directives. Inside the array, anything pygments would handle in a way this lexer doesn't follow raises CLexerUnsupportedError, so the caller can use pygments instead.
+
+Tokens are `(kind, text)` tuples. The kinds are 'name', 'keyword', 'type', 'punct' and 'integer' for pygments' Name, Keyword, Keyword.Type, Punctuation and Number.Integer tokens, and 'other' for everything else.
+"""
+import re
+
+from qmk.errors import CLexerUnsupportedError
+
+# Identifiers pygments classifies as Keyword
+_keywords = frozenset((
+    '_Alignas', '_Alignof', '_Generic', '_Imaginary', '_Noreturn', '_Pragma', '_Static_assert', '_Thread_local', 'alignas', 'alignof', 'asm', 'auto', 'break', 'case', 'complex', 'const', 'continue', 'default', 'do', 'else', 'enum', 'extern', 'for', 'goto',
+    'if', 'imaginary', 'noreturn', 'register', 'restricted', 'return', 'sizeof', 'static', 'static_assert', 'struct', 'switch', 'thread_local', 'typedef', 'union', 'volatile', 'while'
+))
+
+# Keywords that change how pygments classifies the identifiers after them
+_context_keywords = frozenset(('case', 'struct', 'union'))
+
+# Identifiers pygments classifies as Keyword.Reserved, before it looks for a function definition
+_reserved = frozenset((
+    '__asm', '__assume', '__based', '__cdecl', '__declspec', '__except', '__fastcall', '__finally', '__forceinline', '__identifier', '__inline', '__leave', '__m128', '__m128d', '__m128i', '__m64', '__noop', '__raise', '__stdcall', '__try', '__unaligned',
+    '__w64', '_inline', 'inline', 'naked', 'restrict', 'thread'
+))
+
+# Identifiers pygments classifies as Keyword.Type, or Keyword.Reserved for the `__int8` family, after it looks for a function definition
+_types = frozenset(('_Atomic', '_BitInt', '_Bool', '_Complex', '__int128', 'bool', 'char', 'double', 'float', 'int', 'long', 'short', 'signed', 'unsigned', 'void'))
+_reserved_types = frozenset(('__int8', '__int16', '__int32', '__int64', '__wchar_t'))
+
+# Names pygments turns into Keyword.Type after reading them
+_type_names = frozenset((
+    'DIR', 'FILE', 'atomic_bool', 'atomic_char', 'atomic_char16_t', 'atomic_char32_t', 'atomic_int', 'atomic_int_fast16_t', 'atomic_int_fast32_t', 'atomic_int_fast64_t', 'atomic_int_fast8_t', 'atomic_int_least16_t', 'atomic_int_least32_t',
+    'atomic_int_least64_t', 'atomic_int_least8_t', 'atomic_intmax_t', 'atomic_intptr_t', 'atomic_llong', 'atomic_long', 'atomic_ptrdiff_t', 'atomic_schar', 'atomic_short', 'atomic_size_t', 'atomic_uchar', 'atomic_uint', 'atomic_uint_fast16_t',
+    'atomic_uint_fast32_t', 'atomic_uint_fast64_t', 'atomic_uint_fast8_t', 'atomic_uint_least16_t', 'atomic_uint_least32_t', 'atomic_uint_least64_t', 'atomic_uint_least8_t', 'atomic_uintmax_t', 'atomic_uintptr_t', 'atomic_ullong', 'atomic_ulong',
+    'atomic_ushort', 'atomic_wchar_t', 'clock_t', 'clockid_t', 'cpu_set_t', 'cpumask_t', 'dev_t', 'div_t', 'fpos_t', 'gid_t', 'id_t', 'ino_t', 'int16_t', 'int32_t', 'int64_t', 'int8_t', 'int_fast16_t', 'int_fast32_t', 'int_fast64_t', 'int_fast8_t',
+    'int_least16_t', 'int_least32_t', 'int_least64_t', 'int_least8_t', 'intmax_t', 'intptr_t', 'jmp_buf', 'key_t', 'ldiv_t', 'mbstate_t', 'mode_t', 'nfds_t', 'off_t', 'pid_t', 'ptrdiff_t', 'rlim_t', 'sig_atomic_t', 'sig_t', 'sighandler_t', 'siginfo_t',
+    'sigset_t', 'sigval_t', 'size_t', 'socklen_t', 'ssize_t', 'time_t', 'timer_t', 'uid_t', 'uint16_t', 'uint32_t', 'uint64_t', 'uint8_t', 'uint_fast16_t', 'uint_fast32_t', 'uint_fast64_t', 'uint_fast8_t', 'uint_least16_t', 'uint_least32_t',
+    'uint_least64_t', 'uint_least8_t', 'uintmax_t', 'uintptr_t', 'va_list', 'wchar_t', 'wctrans_t', 'wctype_t', 'wint_t'
+))
+
+# Identifiers pygments classifies as Name.Builtin
+_builtins = frozenset(('NULL', 'false', 'true'))
+
+_special_identifiers = _keywords | _reserved | _types | _reserved_types | _type_names | _builtins
+
+# The words of `const uint16_t PROGMEM keymaps[][MATRIX_ROWS][MATRIX_COLS]`, in order, and the kind of token each one is
+_signature = (('keyword', 'const'), ('type', 'uint16_t'), ('name', 'PROGMEM'), ('name', 'keymaps'), ('name', 'MATRIX_ROWS'), ('name', 'MATRIX_COLS'))
+_signature_kinds = dict((word, kind) for kind, word in _signature)
+
+_brackets = {')': '(', ']': '[', '}': '{'}
+
+# The regular expressions below are taken from pygments' CFamilyLexer, with loops unrolled and groups made non-capturing
+_ws1 = r'\s*(?:/[*].*?[*]/\s*)?'
+_ident = r'(?!\d)(?:[\w$]|\\u[0-9a-fA-F]{4}|\\U[0-9a-fA-F]{8})+'
+_namespaced_ident = r'(?!\d)(?:[\w$]|\\u[0-9a-fA-F]{4}|\\U[0-9a-fA-F]{8}|::)+'
+_comment_single = r'//[^\n]*(?:(?<=\\)\n[^\n]*)*\n'
+_comment_multiline = r'/(?:\\\n)?[*][^*]*(?:[*](?!(?:\\\n)?/)[^*]*)*[*](?:\\\n)?/'
+_comment = rf'{_comment_single}|{_comment_multiline}|/(?:\\\n)?[*][\s\S]*'
+_possible_comments = rf'\s*(?:(?:(?:{_comment_single})|(?:{_comment_multiline}))\s*)*'
+_directive = rf'(?:{_ws1}include{_ws1}(?:"[^"]+"|<[^>]+>)[^\n]*)?[^/\n]*(?:(?:/[*][\s\S]*?[*]/|/(?!/)|(?<=\\)\n)[^/\n]*)*(?://[^\n]*\n|\n)'
+_string = r'(?:[LuU]|u8)?"[^"\\\n]*(?:\\[\s\S][^"\\\n]*)*"'
+_char = r"(?:[LuU]|u8)?'(?:\\.|\\[0-7]{1,3}|\\x[a-fA-F0-9]{1,2}|[^\\'\n])'"
+_hexpart = r"[0-9a-fA-F](?:'?[0-9a-fA-F])*"
+_decpart = r"\d(?:'?\d)*"
+_intsuffix = r'(?:[uU][lL]{0,2}|[lL]{1,2}[uU]?)?'
+_other_number = '|'.join((
+    rf'0[xX](?:{_hexpart}\.{_hexpart}|\.{_hexpart}|{_hexpart})[pP][+-]?{_hexpart}[lL]?',
+    rf'-?(?:{_decpart}\.{_decpart}|\.{_decpart}|{_decpart})[eE][+-]?{_decpart}[fFlL]?',
+    rf'-?(?:{_decpart}\.(?:{_decpart})?|\.{_decpart})[fFlL]?|{_decpart}[fFlL]',
+    rf'-?0[xX]{_hexpart}{_intsuffix}',
+    rf"-?0[bB][01](?:'?[01])*{_intsuffix}",
+    rf"-?0(?:'?[0-7])+{_intsuffix}",
+))
+
+# What comes before the keymaps array: only the words of its declaration, brackets, and whatever could hide them
+_search_regex = re.compile(
+    '|'.join((
+        rf'(?P<if0>^{_ws1}#if\s+0)',
+        rf'(?P<directive>^{_ws1}#{_directive})',
+        rf'(?P<comment>{_comment})',
+        r'(?P<string>"[^"\\\n]*(?:\\[\s\S][^"\\\n]*)*")',
+        r'(?P<unterminated>")',
+        rf'(?P<char>{_char})',
+        r'(?P<word>(?<![\w$])(?:const|uint16_t|PROGMEM|keymaps|MATRIX_ROWS|MATRIX_COLS)(?![\w$]))',
+        r'(?P<bracket>[][(){}])',
+    )),
+    re.MULTILINE,
+)
+
+# Every token of the keymaps array. The most common kinds come first, except where pygments would read the same text as a different kind.
+_token_regex = re.compile(
+    '|'.join((
+        rf'(?P<if0>^{_ws1}#if\s+0)',
+        rf'(?P<directive>^{_ws1}#{_directive})',
+        rf'(?P<label>^[ \t]*(?!(?:public|private|protected|default)\b){_ident}\s*:(?!:))',
+        r'(?P<punct>[][(),{};]|\.(?!\d))',
+        rf'(?P<space>[^\S\n]+|\n[^\S\n]*(?![\s/#]|{_ident}\s*:)|\n|\\\n|{_comment})',
+        rf'(?P<string>{_string})',
+        r'(?P<unterminated>(?:[LuU]|u8)?")',
+        rf'(?P<char>{_char})',
+        rf'(?P<identifier>{_ident})',
+        rf'(?P<number>{_other_number})',
+        rf'(?P<integer>-?{_decpart}{_intsuffix})',
+        r'(?P<other>[\s\S])',
+    )),
+    re.MULTILINE,
+)
+
+# pygments' function definitions and declarations, which it looks for where a statement can start
+_function_regex = re.compile(
+    rf'{_namespaced_ident}(?:[&*\s])+{_possible_comments}{_namespaced_ident}{_possible_comments}\([^;"\')]*?\){_possible_comments}(?:[^;{{/"\']*\{{|[^;/"\']*;)',
+    re.MULTILINE,
+)
+
+# The lines of an `#if 0` block that open and close conditionals, as pygments reads them
+_if0_regex = re.compile(r'(?P<push>^\s*#if.*?(?<!\\)\n)|(?P<pop>^\s*#el(?:se|if).*\n|^\s*#endif.*?(?<!\\)\n)|.*?\n', re.MULTILINE)
+
+
+def _normalize(text):
+    """Returns `text` the way pygments reads it, without a BOM, with Unix line endings and one trailing newline.
+    """
+    if text.startswith('\ufeff'):
+        text = text[1:]
+
+    text = text.replace('\r\n', '\n').replace('\r', '\n').strip('\n')
+
+    return text + '\n'
+
+
+def _skip_if0(text, pos):
+    """Returns where the `#if 0` block that `pos` is inside of ends.
+    """
+    depth = 1
+
+    while depth:
+        match = _if0_regex.match(text, pos)
+
+        if not match:
+            return len(text)
+
+        pos = match.end()
+
+        if match.lastgroup == 'push':
+            depth += 1
+
+        elif match.lastgroup == 'pop':
+            depth -= 1
+
+    return pos
+
+
+def _identifier_kind(text, pos, value, statement_start):
+    """Returns the kind of the identifier `value` at `pos`, and whether a statement can still start after it.
+    """
+    if '$' in value or '\\' in value:
+        raise CLexerUnsupportedError(f'Unusual identifier {value}')
+
+    if value in _keywords:
+        if value in _context_keywords:
+            raise CLexerUnsupportedError(f'Keyword {value} in keymaps array')
+
+        return 'keyword', statement_start
+
+    if value in _reserved:
+        return 'other', statement_start
+
+    if statement_start and _function_regex.match(text, pos):
+        raise CLexerUnsupportedError(f'Function definition at {value}')
+
+    if value in _types:
+        return 'type', statement_start
+
+    if value in _reserved_types:
+        return 'other', statement_start
+
+    if value in _builtins:
+        return 'other', False
+
+    return ('type' if value in _type_names else 'name'), False
+
+
+def _keymap_array(text, pos, closable):
+    """Yields every token from `pos`, just inside the opening brace of the keymaps array, to its closing brace.
+
+    Returns the position after the closing brace. If `closable` is False, or the brackets inside the array don't match up, the array is treated as never closing: every token up to the end of `text` is yielded and None is returned.
+    """
+    brackets = ['{']
+    statement_start = True  # Whether pygments is between statements, where it looks for function definitions
+
+    while pos < len(text):
+        for match in _token_regex.finditer(text, pos):
+            kind = match.lastgroup
+            value = match.group()
+
+            # Ordered by how often each kind turns up in keymaps
+            if kind == 'punct':
+                statement_start = value in '{;'
+                yield 'punct', value
+
+                if brackets is None or value not in '()[]{}':
+                    continue
+
+                if value in '([{':
+                    brackets.append(value)
+
+                elif brackets and brackets[-1] == _brackets[value]:
+                    brackets.pop()
+
+                    if not brackets and closable:
+                        return match.end()
+
+                else:
+                    brackets = None
+
+            elif kind == 'identifier':
+                if statement_start or value in _special_identifiers or '$' in value or '\\' in value:
+                    kind, statement_start = _identifier_kind(text, match.start(), value, statement_start)
+                    yield kind, value
+
+                else:
+                    yield 'name', value
+
+            elif kind in ('space', 'directive', 'label'):
+                yield 'other', value
+
+            elif kind == 'if0':
+                pos = _skip_if0(text, match.end())
+                yield 'other', text[match.start():pos]
+                break
+
+            elif kind == 'unterminated':
+                raise CLexerUnsupportedError('Unterminated string in keymaps array')
+
+            else:
+                statement_start = False
+                yield ('integer' if kind == 'integer' else 'other'), value
+
+        else:
+            break
+
+    return None
+
+
+def iter_keymap_tokens(text):
+    """Yields `(kind, text)` for the tokens of keymap.c `text` that can affect which layers pygments' tokens would give.
+
+    That is the words of the keymaps array declaration and every bracket before the array, and every token of the array itself. Raises CLexerUnsupportedError when pygments could split up the array differently.
+    """
+    text = _normalize(text)
+    pos = depth = certainty = 0
+
+    while True:
+        match = _search_regex.search(text, pos)
+
+        if not match:
+            return
+
+        kind = match.lastgroup
+        value = match.group()
+        pos = match.end()
+
+        if kind == 'if0':
+            pos = _skip_if0(text, pos)
+
+        elif kind == 'unterminated':
+            raise CLexerUnsupportedError('Unterminated string before keymaps array')
+
+        elif kind == 'word':
+            yield _signature_kinds[value], value
+
+            if certainty < len(_signature) and value == _signature[certainty][1]:
+                certainty += 1
+
+        elif kind == 'bracket':
+            yield 'punct', value
+
+            if value not in '([{':
+                depth -= 1
+
+            elif value == '{' and certainty == len(_signature):
+                pos = yield from _keymap_array(text, pos, closable=depth == 0)
+
+                if pos is None:
+                    return
+
+                certainty = 0
+
+            else:
+                depth += 1
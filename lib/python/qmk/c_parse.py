@@ -1,16 +1,35 @@
 """Functions for working with config.h files.
 """
+from collections.abc import Mapping
+from functools import lru_cache
+import operator
+import os
 from pathlib import Path
 import re
 
 from milc import cli
 
-from qmk.comment_remover import comment_remover
+from qmk.c_tokenizer import iter_directives
+from qmk.cache import memoize_content
 
-default_key_entry = {'x': -1, 'y': 0, 'w': 1}
 single_comment_regex = re.compile(r'\s+/[/*].*$')
 multi_comment_regex = re.compile(r'/\*(.|\n)*?\*/', re.MULTILINE)
 
+# Macros the build system can define on the command line. Unless they are passed to parse_config_h_file() in `predefined`, conditions that use them can't be decided.
+external_macro_regex = re.compile(r'\w+_ENABLE$|CONVERT_TO_\w+$|__\w+__$')
+
+conditional_directives = ('if', 'ifdef', 'ifndef', 'elif', 'else', 'endif')
+max_macro_expansions = 10
+
+_defined_regex = re.compile(r'\bdefined\s*(?:\(\s*([A-Za-z_]\w*)\s*\)|([A-Za-z_]\w*))')
+_identifier_regex = re.compile(r'\b[A-Za-z_]\w*')
+_c_token_regex = re.compile(r'\s*(?:(0[xX][0-9a-fA-F]+|[1-9][0-9]*|0[0-7]*)([uUlL]*)\b|(&&|\|\||<<|>>|<=|>=|==|!=|[-+*/%<>&^|!~?:()]))')
+
+# The binary operators of C, and how tightly each binds
+_c_precedence = {'*': 10, '/': 10, '%': 10, '+': 9, '-': 9, '<<': 8, '>>': 8, '<': 7, '<=': 7, '>': 7, '>=': 7, '==': 6, '!=': 6, '&': 5, '^': 4, '|': 3, '&&': 2, '||': 1}
+_c_comparisons = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge, '==': operator.eq, '!=': operator.ne}
+_c_arithmetic = {'*': operator.mul, '+': operator.add, '-': operator.sub, '&': operator.and_, '^': operator.xor, '|': operator.or_}
+
 
 def strip_line_comment(string):
     """Removes comments from a single line string.
@@ -45,113 +64,462 @@ def find_layouts(file):
     aliases = {}  # Populated with all `#define`s that aren't functions
     parsed_layouts = {}
 
+    nested = set()  # Layouts whose only definitions so far are indented
+
     # Search the file for LAYOUT macros and aliases
-    file_contents = file.read_text(encoding='utf-8')
-    file_contents = comment_remover(file_contents)
-    file_contents = file_contents.replace('\\\n', '')
-
-    for line in file_contents.split('\n'):
-        if line.startswith('#define') and '(' in line and 'LAYOUT' in line:
-            # We've found a LAYOUT macro
-            macro_name, layout, matrix = _parse_layout_macro(line.strip())
-
-            # Reject bad macro names
-            if macro_name.startswith('LAYOUT_kc') or not macro_name.startswith('LAYOUT'):
-                continue
-
-            # Parse the matrix data
-            matrix_locations = _parse_matrix_locations(matrix, file, macro_name)
-
-            # Parse the layout entries into a basic structure
-            default_key_entry['x'] = -1  # Set to -1 so _default_key(key) will increment it to 0
-            layout = layout.strip()
-            parsed_layout = [_default_key(key) for key in layout.split(',')]
-
-            for i, key in enumerate(parsed_layout):
-                if 'label' not in key:
-                    cli.log.error('Invalid LAYOUT macro in %s: Empty parameter name in macro %s at pos %s.', file, macro_name, i)
-                elif key['label'] in matrix_locations:
-                    key['matrix'] = matrix_locations[key['label']]
-
-            parsed_layouts[macro_name] = {
-                'key_count': len(parsed_layout),
-                'layout': parsed_layout,
-                'filename': str(file),
-            }
-
-        elif '#define' in line:
-            # Attempt to extract a new layout alias
-            try:
-                _, pp_macro_name, pp_macro_text = line.strip().split(' ', 2)
-                aliases[pp_macro_name] = pp_macro_text
-            except ValueError:
-                continue
+    for define in iter_directives(file.read_text(encoding='utf-8')):
+        if define.directive != 'define' or not define.name:
+            continue
+
+        if define.params is None:
+            aliases[define.name] = define.value
+
+        # Reject bad macro names
+        elif define.name.startswith('LAYOUT') and not define.name.startswith('LAYOUT_kc'):
+            # Indented definitions are almost always alternatives inside an #if block, so one at the start of a line takes precedence
+            if define.column == 1:
+                parsed_layouts[define.name] = _parse_layout_macro(define, file)
+                nested.discard(define.name)
+
+            elif define.name not in parsed_layouts or define.name in nested:
+                parsed_layouts[define.name] = _parse_layout_macro(define, file)
+                nested.add(define.name)
 
     return parsed_layouts, aliases
 
 
-def parse_config_h_file(config_h_file, config_h=None):
-    """Extract defines from a config.h file.
-    """
-    if not config_h:
-        config_h = {}
+@memoize_content('config_h_files')
+def _config_h_directives(config_h_file):
+    """Returns the directives in a config.h file that `parse_config_h_file()` acts on, in the order they appear.
 
+    Each directive is a tuple of `(directive, argument, value)`. Problems found while parsing are returned as `('error', line, message)` entries so they are reported every time the file is used. The result is shared by every file with the same contents, so it must not be modified.
+    """
+    directives = []
     config_h_file = Path(config_h_file)
 
     if config_h_file.exists():
-        config_h_text = config_h_file.read_text(encoding='utf-8')
-        config_h_text = config_h_text.replace('\\\n', '')
-        config_h_text = strip_multiline_comment(config_h_text)
+        for define in iter_directives(config_h_file.read_text(encoding='utf-8')):
+            if define.directive == 'define':
+                if not define.name:
+                    directives.append(('error', define.line, 'Incomplete #define!'))
+                else:
+                    directives.append(('define', define.full_name, ' '.join(define.value.split()) or True))
+
+            elif define.directive == 'undef':
+                if define.name and not define.value:
+                    directives.append(('undef', define.name, None))
+                else:
+                    directives.append(('error', define.line, 'Incomplete #undef!'))
 
-        for linenum, line in enumerate(config_h_text.split('\n')):
-            line = strip_line_comment(line).strip()
+            elif define.directive in ('ifdef', 'ifndef'):
+                # Without a name the block is still opened, but its condition can't be decided
+                directives.append((define.directive, define.name, None) if define.name else ('if', '', None))
 
-            if not line:
-                continue
+            elif define.directive in ('if', 'elif'):
+                directives.append((define.directive, define.value, None))
 
-            line = line.split()
+            elif define.directive in ('else', 'endif'):
+                directives.append((define.directive, None, None))
 
-            if line[0] == '#define':
-                if len(line) == 1:
-                    cli.log.error('%s: Incomplete #define! On or around line %s' % (config_h_file, linenum))
-                elif len(line) == 2:
-                    config_h[line[1]] = True
-                else:
-                    config_h[line[1]] = ' '.join(line[2:])
-
-            elif line[0] == '#undef':
-                if len(line) == 2:
-                    if line[1] in config_h:
-                        if config_h[line[1]] is True:
-                            del config_h[line[1]]
-                        else:
-                            config_h[line[1]] = False
-                else:
-                    cli.log.error('%s: Incomplete #undef! On or around line %s' % (config_h_file, linenum))
+            elif define.directive == 'include' and define.value.startswith('"'):
+                directives.append(('include', define.value.strip('"'), None))
+
+    return directives
+
+
+def _macro_value(name, config_h, predefined):
+    """Returns the value of macro `name`, True if it is defined without a value, False if it is not defined, or None if only the build system knows.
+    """
+    for macros in config_h, predefined:
+        if name in macros:
+            return macros[name]
+
+    return None if external_macro_regex.match(name) else False
+
+
+def _evaluate_condition(expression, config_h, predefined):
+    """Returns the result of an `#if` expression, or None if it can not be decided.
+    """
+    undecided = False
+
+    def defined(match):
+        nonlocal undecided
+        value = _macro_value(match.group(1) or match.group(2), config_h, predefined)
+        undecided = undecided or value is None
+
+        return '1' if value else '0'
+
+    def expand(match):
+        nonlocal undecided
+        value = _macro_value(match.group(), config_h, predefined)
+
+        if isinstance(value, str):
+            return f'({value})'
+
+        # Macros without a value can't be used in an expression, and unknown ones might be defined by the build system
+        undecided = undecided or value is not False
+
+        return '0'
+
+    for _ in range(max_macro_expansions):
+        expanded = _identifier_regex.sub(expand, _defined_regex.sub(defined, expression))
+
+        if expanded == expression:
+            break
+
+        expression = expanded
+
+    if undecided or _identifier_regex.search(expression):
+        return None
+
+    return evaluate_c_condition(expression)
 
-    return config_h
 
+def _c_integer(value, unsigned):
+    """Returns `value` wrapped to the 64 bit signed or unsigned integer the preprocessor computes with, as a `(value, unsigned)` tuple.
+    """
+    value &= (1 << 64) - 1
+
+    if not unsigned and value >= 1 << 63:
+        value -= 1 << 64
+
+    return value, unsigned
 
-def _default_key(label=None):
-    """Increment x and return a copy of the default_key_entry.
+
+def _c_tokens(expression):
+    """Returns the numbers and operators in a C integer constant expression. Numbers are returned as `(value, unsigned)` tuples.
     """
-    default_key_entry['x'] += 1
-    new_key = default_key_entry.copy()
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+
+    while position < len(expression):
+        match = _c_token_regex.match(expression, position)
+
+        if not match:
+            raise SyntaxError(f'Unexpected {expression[position:]!r}')
+
+        number, suffix, punctuator = match.groups()
+        position = match.end()
+
+        if punctuator:
+            tokens.append(punctuator)
+            continue
+
+        value = int(number, 16 if number[:2] in ('0x', '0X') else 8 if number.startswith('0') else 10)
+
+        if value >= 1 << 64:
+            raise OverflowError(number)
 
-    if label:
-        new_key['label'] = label
+        # Constants too large for a signed integer are unsigned, as are the ones with a `u` suffix
+        tokens.append((value, 'u' in suffix.lower() or value >= 1 << 63))
 
-    return new_key
+    return tokens
 
 
-def _parse_layout_macro(layout_macro):
-    """Split the LAYOUT macro into its constituent parts
+class _CExpression:
+    """Evaluates a C integer constant expression with the precedence, truncating division and 64 bit wrapping of the preprocessor.
+
+    Operands that are not evaluated, like the right side of `0 && x`, may divide by zero.
     """
-    layout_macro = layout_macro.replace('\\', '').replace(' ', '').replace('\t', '').replace('#define', '')
-    macro_name, layout = layout_macro.split('(', 1)
-    layout, matrix = layout.split(')', 1)
+    def __init__(self, expression):
+        self.tokens = _c_tokens(expression)
+        self.index = 0
+        self.skipped = 0
+
+    def take(self, expected=None):
+        if self.index >= len(self.tokens) or (expected and self.tokens[self.index] != expected):
+            raise SyntaxError(f'Expected {expected or "an operand"}')
+
+        self.index += 1
+
+        return self.tokens[self.index - 1]
+
+    def peek(self):
+        return self.tokens[self.index] if self.index < len(self.tokens) else None
+
+    def evaluate(self):
+        value = self.conditional()
+
+        if self.peek() is not None:
+            raise SyntaxError(f'Unexpected {self.peek()!r}')
+
+        return value
+
+    def operand(self, evaluated, parse, *args):
+        """Parse an operand with `parse`, noting whether its value is used.
+        """
+        self.skipped += not evaluated
+
+        try:
+            return parse(*args)
+
+        finally:
+            self.skipped -= not evaluated
+
+    def conditional(self):
+        condition = self.binary(1)
+
+        if self.peek() != '?':
+            return condition
+
+        self.take('?')
+        if_true = self.operand(condition[0], self.conditional)
+        self.take(':')
+        if_false = self.operand(not condition[0], self.conditional)
+
+        return _c_integer((if_true if condition[0] else if_false)[0], if_true[1] or if_false[1])
+
+    def binary(self, min_precedence):
+        left = self.unary()
+
+        while _c_precedence.get(self.peek(), 0) >= min_precedence:
+            op = self.take()
+
+            if op in ('&&', '||'):
+                right = self.operand(bool(left[0]) == (op == '&&'), self.binary, _c_precedence[op] + 1)
+                left = int(bool(left[0]) and bool(right[0]) if op == '&&' else bool(left[0]) or bool(right[0])), False
+
+            else:
+                left = self.apply(op, left, self.binary(_c_precedence[op] + 1))
+
+        return left
+
+    def unary(self):
+        token = self.take()
+
+        if isinstance(token, tuple):
+            return token
+
+        if token == '(':
+            value = self.conditional()
+            self.take(')')
+
+            return value
+
+        if token in ('-', '+', '~', '!'):
+            value, unsigned = self.unary()
+
+            if token == '!':
+                return int(not value), False
+
+            return _c_integer({'-': -value, '+': value, '~': ~value}[token], unsigned)
+
+        raise SyntaxError(f'Unexpected {token!r}')
+
+    def apply(self, op, left, right):
+        """Returns the result of binary operator `op`, after the usual arithmetic conversions.
+        """
+        if op in ('<<', '>>'):
+            if not 0 <= right[0] < 64:
+                raise ArithmeticError(f'Shift by {right[0]}')
+
+            return _c_integer(left[0] << right[0] if op == '<<' else left[0] >> right[0], left[1])
+
+        unsigned = left[1] or right[1]
+        left, right = _c_integer(left[0], unsigned)[0], _c_integer(right[0], unsigned)[0]
+
+        if op in _c_comparisons:
+            return int(_c_comparisons[op](left, right)), False
+
+        if op in _c_arithmetic:
+            return _c_integer(_c_arithmetic[op](left, right), unsigned)
+
+        if right == 0:
+            if self.skipped:
+                return 0, unsigned
+
+            raise ZeroDivisionError(f'{left} {op} 0')
+
+        # C division truncates toward zero, and the remainder takes the sign of the dividend
+        if op == '/':
+            return _c_integer(abs(left) // abs(right) * (1 if (left < 0) == (right < 0) else -1), unsigned)
+
+        return _c_integer(abs(left) % abs(right) * (-1 if left < 0 else 1), unsigned)
+
+
+def evaluate_c_condition(expression):
+    """Returns the truth of a C integer constant expression without any identifiers in it, or None if it can't be evaluated.
+    """
+    try:
+        return bool(_CExpression(expression).evaluate()[0])
+
+    except (ArithmeticError, SyntaxError):
+        return None
+
+
+def _update_conditionals(conditionals, directive, argument, config_h, predefined):
+    """Update the stack of open conditionals for an `#if`, `#ifdef`, `#ifndef`, `#elif`, `#else` or `#endif`.
+
+    Each entry is a list of `[enclosing block is read, a branch has been taken, this branch is read]`. A branch whose condition can not be decided is read, but does not stop the branches after it from being read as well.
+    """
+    reading = not conditionals or conditionals[-1][2]
+
+    if directive in ('if', 'ifdef', 'ifndef'):
+        result = _condition(directive, argument, config_h, predefined) if reading else False
+        conditionals.append([reading, result is True, reading and result is not False])
+
+    elif not conditionals:
+        return
+
+    elif directive == 'elif':
+        enclosing, taken, _ = conditionals[-1]
+        result = _condition(directive, argument, config_h, predefined) if enclosing and not taken else False
+        conditionals[-1] = [enclosing, taken or result is True, enclosing and not taken and result is not False]
+
+    elif directive == 'else':
+        enclosing, taken, _ = conditionals[-1]
+        conditionals[-1] = [enclosing, True, enclosing and not taken]
+
+    elif directive == 'endif':
+        conditionals.pop()
+
+
+def _condition(directive, argument, config_h, predefined):
+    """Returns True, False or None (undecided) for the condition of an `#if`, `#ifdef`, `#ifndef` or `#elif`.
+    """
+    if directive in ('if', 'elif'):
+        return _evaluate_condition(argument, config_h, predefined)
+
+    value = _macro_value(argument, config_h, predefined)
+
+    if value is None:
+        return None
+
+    return (value is not False) == (directive == 'ifdef')
+
+
+@lru_cache(maxsize=None)
+def _find_include(name, config_h_dir, include_dirs):
+    """Returns the file read by `#include "name"` in a file in `config_h_dir`, if it is in one of `include_dirs`.
+    """
+    for directory in (config_h_dir, *include_dirs):
+        include_file = os.path.normpath(os.path.join(directory, name))
+
+        if os.path.dirname(include_file) in include_dirs and os.path.isfile(include_file):
+            return Path(include_file)
+
+    return None
+
+
+@lru_cache(maxsize=None)
+def _normalize_dirs(include_dirs):
+    return tuple(os.path.normpath(include_dir) for include_dir in include_dirs)
+
+
+class _RecordingMacros(Mapping):
+    """A read-only view of the predefined macros that records every macro looked up in it in `dependencies`.
+    """
+    def __init__(self, macros, dependencies):
+        self.macros = macros
+        self.dependencies = dependencies
+
+    def __contains__(self, name):
+        self.dependencies[('macro', name, None)] = name in self.macros, self.macros.get(name)
+
+        return name in self.macros
+
+    def __getitem__(self, name):
+        return self.macros[name]
+
+    def __iter__(self):
+        return iter(self.macros)
+
+    def __len__(self):
+        return len(self.macros)
+
+
+def config_h_dependency(dependency, predefined=None, include_dirs=()):
+    """Returns the current value of a dependency recorded by `parse_config_h_file()`.
+
+    The result for a file is the same as long as the value of every dependency recorded for it is.
+    """
+    kind, name, config_h_dir = dependency
+
+    if kind == 'macro':
+        predefined = predefined or {}
+        return name in predefined, predefined.get(name)
+
+    return _find_include(name, config_h_dir, _normalize_dirs(tuple(map(str, include_dirs))))
+
+
+def _read_config_h(config_h_file, config_h, predefined, include_dirs, included, dependencies):
+    """Apply the directives in `config_h_file` to `config_h`, skipping the branches of conditionals that are not taken.
+    """
+    included.add(config_h_file)
+    conditionals = []
+
+    for directive, argument, value in _config_h_directives(config_h_file):
+        if directive in conditional_directives:
+            _update_conditionals(conditionals, directive, argument, config_h, predefined)
+
+        elif conditionals and not conditionals[-1][2]:
+            continue
+
+        elif directive == 'error':
+            cli.log.error('%s: %s On or around line %s', config_h_file, value, argument)
+
+        elif directive == 'define':
+            config_h[argument] = value
+
+        elif directive == 'undef' and argument in config_h:
+            if config_h[argument] is True:
+                del config_h[argument]
+            else:
+                config_h[argument] = False
+
+        elif directive == 'include':
+            config_h_dir = os.path.normpath(config_h_file.parent)
+            include_file = _find_include(argument, config_h_dir, include_dirs)
+            dependencies[('include', argument, config_h_dir)] = include_file
+
+            if include_file and include_file not in included:
+                _read_config_h(include_file, config_h, predefined, include_dirs, included, dependencies)
+
+
+def parse_config_h_file(config_h_file, config_h=None, predefined=None, include_dirs=(), dependencies=None):
+    """Extract defines from a config.h file.
+
+    Conditionals are evaluated the way the C preprocessor would, looking macros up in `config_h` and then in `predefined`, which holds the macros the build system defines (False for ones it is known not to define). When a condition can't be decided, because it uses a macro the build system might define or an expression that can't be evaluated here, every branch of it is read. Quoted `#include`s are followed into files in `include_dirs`.
+
+    If `dependencies` is given, every macro looked up in `predefined` and every `#include` looked up in `include_dirs` is added to it, with its value as returned by `config_h_dependency()`.
+    """
+    if not config_h:
+        config_h = {}
+
+    if dependencies is None:
+        dependencies = {}
+
+    include_dirs = _normalize_dirs(tuple(map(str, include_dirs)))
+    _read_config_h(Path(config_h_file), config_h, _RecordingMacros(predefined or {}, dependencies), include_dirs, set(), dependencies)
+
+    return config_h
+
+
+def _parse_layout_macro(define, file):
+    """Returns the layout described by a LAYOUT macro.
+    """
+    matrix_locations = _parse_matrix_locations(''.join(define.value.split()), file, define.name)
+    parsed_layout = []
+
+    for x, label in enumerate(''.join(define.params.split()).split(',')):
+        key = {'x': x, 'y': 0, 'w': 1}
+
+        if not label:
+            cli.log.error('Invalid LAYOUT macro in %s, line %s: Empty parameter name in macro %s at pos %s.', file, define.line, define.name, x)
+        else:
+            key['label'] = label
+
+            if label in matrix_locations:
+                key['matrix'] = matrix_locations[label]
+
+        parsed_layout.append(key)
 
-    return macro_name, layout, matrix
+    return {
+        'key_count': len(parsed_layout),
+        'layout': parsed_layout,
+        'filename': str(file),
+    }
 
 
 def _parse_matrix_locations(matrix, file, macro_name):
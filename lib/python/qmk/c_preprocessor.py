@@ -0,0 +1,885 @@
+"""A C pre-processor that runs in-process, for the parts of C that keymap.c files use.
+
+`preprocess()` expands object and function-like macros (including `#` and `##`), evaluates conditionals and reads quoted `#include`s of files that sit next to the keymap. Its output is what `cpp <file>` prints, down to GCC's rules for spacing, line breaks and line markers, so code that reads `cpp` output can use either. Anything it can't reproduce exactly- system headers, compiler builtins, pragmas, malformed directives- raises CppUnsupportedError, so the caller can run the real `cpp` instead.
+"""
+import os
+import re
+
+from qmk.c_parse import evaluate_c_condition
+from qmk.errors import CppUnsupportedError
+
+# Mostly ordered by how often each kind turns up in keymaps, since the regex engine tries the alternatives in turn. Strings and characters come before names because of their prefixes.
+_token_regex = re.compile(
+    r'''
+    (?P<punct>%:%:|\.\.\.|<<=|>>=|->|\+\+|--|<<|>>|<=|>=|==|!=|&&|\|\||[-+*/%&^|]=|\#\#|<:|:>|<%|%>|%:|[][(){}&*+\-~!%<>^|?:;=,\#]|/(?![*/])|\.(?![0-9]))
+    | (?P<space>[ \t\f\v\r]+)
+    | (?P<string>(?:u8|[uUL])?"[^"\\\n]*(?:\\.[^"\\\n]*)*")
+    | (?P<char>(?:u8|[uUL])?'[^'\\\n]*(?:\\.[^'\\\n]*)*')
+    | (?P<name>(?:[^\W\d]|\$)[\w$]*)
+    | (?P<newline>\n)
+    | (?P<number>\.?[0-9](?:[eEpP][+-]|[\w.])*)
+    | (?P<comment>/\*[^*]*\*+(?:[^/*][^*]*\*+)*/|//[^\n\\]*(?:\\.[^\n\\]*)*)
+    | (?P<splice>\\[ \t]*\r?\n)
+    | (?P<unterminated>/\*)
+    | (?P<other>["'][^\n]*|.)
+    ''',
+    re.DOTALL | re.VERBOSE,
+)
+
+# The kinds of token that `##` may produce
+_token_kinds = frozenset(('name', 'number', 'string', 'char', 'punct'))
+
+# Macros `cpp` defines itself, which depend on the compiler that runs it
+_builtin_names = frozenset(('_LP64', '_Pragma', '_STDC_PREDEF_H', 'linux', 'unix'))
+
+# GCC keywords that look like builtin macros, but are passed through by `cpp`
+_gcc_keywords = frozenset((
+    '__alignof', '__alignof__', '__asm', '__asm__', '__attribute', '__attribute__', '__auto_type', '__complex__', '__const', '__const__', '__extension__', '__FUNCTION__', '__func__', '__imag__', '__inline', '__inline__', '__int128', '__label__',
+    '__PRETTY_FUNCTION__', '__real__', '__restrict', '__restrict__', '__signed', '__signed__', '__thread', '__typeof', '__typeof__', '__volatile', '__volatile__'
+))
+
+# Operators that form a different token when followed by `=`
+_takes_equals = frozenset(('=', '!', '>', '<', '+', '-', '*', '/', '%', '&', '|', '^', '>>', '<<'))
+
+# The first characters of the tokens that would change a punctuator if printed right after it
+_pastes_after = {'>': '>', '<': '<%:', '+': '+', '-': '->', '/': '/*', '%': ':%', '&': '&', '|': '|', ':': ':>', '->': '*', '.': '.%', '#': '#%', '%:': '#%'}
+
+# The deepest `#include` nesting `cpp` allows
+max_include_depth = 200
+
+
+class _Token:
+    """A preprocessing token.
+
+    `line` and `column` are where the token came from, or for a token produced by a macro, where the outermost macro was used. `white` is True when whitespace came before it and `bol` when it was the first token on its line. `hideset` holds the macros that must not be expanded again in it. Macro bodies use `param`, `stringify` and `paste_left` to mark parameters and the operands of `#` and `##`, and padding tokens use `source` to say whose whitespace they stand for.
+    """
+    __slots__ = ('kind', 'text', 'line', 'column', 'white', 'bol', 'hideset', 'param', 'stringify', 'paste_left', 'source')
+
+    def __init__(self, kind, text, line, column, white=False, bol=False):
+        self.kind = kind
+        self.text = text
+        self.line = line
+        self.column = column
+        self.white = white
+        self.bol = bol
+        self.hideset = frozenset()
+        self.param = None
+        self.stringify = False
+        self.paste_left = False
+        self.source = None
+
+    def __repr__(self):
+        return f'_Token({self.kind!r}, {self.text!r}, {self.line}, {self.column})'
+
+    def copy(self, location, hideset):
+        """Returns a copy of this token for the expansion of a macro used at `location`.
+        """
+        token = _Token(self.kind, self.text, location.line, location.column, self.white)
+        token.hideset = self.hideset | hideset
+        token.paste_left = self.paste_left
+
+        return token
+
+
+def _padding(source):
+    """Returns a padding token, which prints as a space if its source token had whitespace before it.
+
+    A padding token without a source stands for the end of a macro expansion, and only prints as a space when the tokens either side of it would otherwise run together.
+    """
+    token = _Token('padding', '', 0, 0)
+    token.source = source
+
+    return token
+
+
+class _Macro:
+    """A macro defined with `#define`.
+
+    `params` is a tuple of parameter names, or None for an object-like macro. The last parameter of a variadic macro is `__VA_ARGS__`.
+    """
+    __slots__ = ('name', 'params', 'variadic', 'body')
+
+    def __init__(self, name, params, variadic, body):
+        self.name = name
+        self.params = params
+        self.variadic = variadic
+        self.body = body
+
+
+class _SourceFile:
+    """A file being read, with the state of its open conditionals.
+
+    Each conditional is a list of `[this branch is read, a branch has been taken, #else has been seen]`.
+    """
+    __slots__ = ('name', 'directory', 'tokens', 'index', 'conditionals', 'return_line')
+
+    def __init__(self, name, directory, tokens):
+        self.name = name
+        self.directory = directory
+        self.tokens = tokens
+        self.index = 0
+        self.conditionals = []
+        self.return_line = None
+
+    @property
+    def skipping(self):
+        return bool(self.conditionals) and not self.conditionals[-1][0]
+
+
+def _lex(text):
+    """Returns the preprocessing tokens in `text`.
+    """
+    tokens = []
+    line = 1
+    line_start = 0
+    white = False
+    bol = True
+    byte_columns = not text.isascii()  # cpp counts columns in bytes
+
+    for match in _token_regex.finditer(text):
+        kind = match.lastgroup
+
+        if kind == 'space':
+            white = True
+
+        elif kind == 'newline':
+            line += 1
+            line_start = match.end()
+            white = False
+            bol = True
+
+        elif kind in ('comment', 'splice'):
+            newlines = match.group().count('\n')
+
+            if newlines:
+                line += newlines
+                line_start = match.start() + match.group().rindex('\n') + 1
+
+            white = white or kind == 'comment'
+
+        elif kind == 'unterminated':
+            raise CppUnsupportedError(f'Unterminated comment on line {line}')
+
+        else:
+            if byte_columns:
+                column = len(text[line_start:match.start()].encode('utf-8')) + 1
+            else:
+                column = match.start() - line_start + 1
+
+            tokens.append(_Token(kind, match.group(), line, column, white, bol))
+            white = bol = False
+
+    return tokens
+
+
+def _is_builtin(name):
+    """Returns True if `name` may be a macro that `cpp` defines itself.
+    """
+    if name.startswith('__'):
+        return name[2:3] != '_' and not name.startswith('__builtin_') and name not in _gcc_keywords
+
+    return name in _builtin_names
+
+
+def _avoid_paste(prev, token):
+    """Returns True if `prev` and `token` would be read as different tokens when printed without a space between them.
+    """
+    first = token.text[0] if token.kind == 'punct' else ''
+
+    if prev.kind == 'punct':
+        if first == '=' and prev.text in _takes_equals:
+            return True
+
+        return bool(first) and first in _pastes_after.get(prev.text, '') or (prev.text == '.' and token.kind == 'number')
+
+    if prev.kind == 'name':
+        return token.kind in ('name', 'char', 'string')
+
+    if prev.kind == 'number':
+        return token.kind in ('number', 'name', 'char') or first in ('.', '+', '-')
+
+    return prev.kind == 'other' and prev.text[0] == '\\' and token.kind == 'name'
+
+
+def _paste_pair(lhs, rhs):
+    """Returns the token made by pasting `lhs` and `rhs` together with `##`.
+    """
+    text = lhs.text + rhs.text
+    match = _token_regex.match(text)
+
+    if lhs.text == '/' and rhs.text != '=' or match.end() != len(text) or match.lastgroup not in _token_kinds:
+        raise CppUnsupportedError(f'Pasting "{lhs.text}" and "{rhs.text}" does not give a valid preprocessing token')
+
+    token = _Token(match.lastgroup, text, lhs.line, lhs.column, lhs.white)
+    token.hideset = lhs.hideset
+    token.paste_left = rhs.paste_left
+
+    return token
+
+
+def _paste(tokens):
+    """Carry out the `##` operators in the expansion of a macro.
+    """
+    if not any(token.paste_left for token in tokens):
+        return tokens
+
+    pasted = []
+    tokens = iter(tokens)
+
+    for token in tokens:
+        while token.paste_left:
+            rhs = next(tokens)
+
+            while rhs.kind == 'padding':
+                rhs = next(tokens)
+
+            token = _paste_pair(token, rhs)
+
+        pasted.append(token)
+
+    return pasted
+
+
+def _stringify(tokens):
+    """Returns the string literal that `#` makes of a macro argument.
+    """
+    parts = ['"']
+    source = None
+
+    for token in tokens:
+        if token.kind == 'padding':
+            if source is None or (not source.white and token.source is None):
+                source = token.source
+
+            continue
+
+        if len(parts) > 1 and (source or token).white:
+            parts.append(' ')
+
+        source = None
+
+        if token.kind in ('string', 'char'):
+            parts.append(token.text.replace('\\', '\\\\').replace('"', '\\"'))
+        else:
+            parts.append(token.text)
+
+    parts.append('"')
+
+    return _Token('string', ''.join(parts), 0, 0)
+
+
+class _Expander:
+    """Expands the macros in a stream of tokens.
+
+    Tokens are taken from `pending` first, and then from `source`, a `_Preprocessor` reading files. An expander without a source expands a fixed list of tokens, such as a macro argument. Expanded tokens are pushed back onto `pending` so they are scanned again.
+    """
+    def __init__(self, macros, tokens=(), source=None):
+        self.macros = macros
+        self.pending = list(reversed(tokens))
+        self.source = source
+
+    def expand_all(self):
+        """Returns every token in the stream, fully expanded.
+        """
+        tokens = []
+        token = self.next()
+
+        while token is not None:
+            tokens.append(token)
+            token = self.next()
+
+        return tokens
+
+    def next(self):
+        """Returns the next fully expanded token, a padding token or None at the end of the stream.
+        """
+        while True:
+            if self.pending:
+                token = self.pending.pop()
+
+            elif self.source:
+                token = self.source.next_token()
+
+            else:
+                return None
+
+            if token is None or token.kind != 'name':
+                return token
+
+            macro = self.macros.get(token.text)
+
+            if macro is None:
+                if _is_builtin(token.text):
+                    raise CppUnsupportedError(f'{token.text} is defined by the compiler running cpp')
+
+                return token
+
+            if token.text in token.hideset or not self._expand(token, macro):
+                return token
+
+    def _next_arg_token(self):
+        if self.pending:
+            return self.pending.pop()
+
+        if self.source:
+            return self.source.next_token(in_args=True)
+
+        return None
+
+    def _take_paren(self):
+        """Consume the `(` after the name of a function-like macro, returning False if there isn't one.
+        """
+        for index in range(len(self.pending) - 1, -1, -1):
+            if self.pending[index].kind != 'padding':
+                if self.pending[index].text != '(':
+                    return False
+
+                del self.pending[index:]
+                return True
+
+        if self.source and self.source.take_paren():
+            self.pending.clear()
+            return True
+
+        return False
+
+    def _expand(self, token, macro):
+        """Push the expansion of `macro`, used at `token`, onto the stream. Returns False for a function-like macro that isn't called.
+        """
+        if macro.params is None:
+            hideset = token.hideset | {macro.name}
+            expansion = _paste([entry.copy(token, hideset) for entry in macro.body])
+
+        elif self._take_paren():
+            args, close_paren = self._collect_args(token, macro)
+            hideset = (token.hideset & close_paren.hideset) | {macro.name}
+            expansion = _paste(self._substitute(token, macro, args, hideset))
+
+        else:
+            return False
+
+        self.pending.append(_padding(None))
+        self.pending.extend(reversed(expansion))
+        self.pending.append(_padding(token))
+
+        return True
+
+    def _collect_args(self, name_token, macro):
+        """Returns the arguments to a function-like macro call and its closing parenthesis.
+        """
+        args = [[]]
+        depth = 0
+
+        while True:
+            token = self._next_arg_token()
+
+            if token is None:
+                raise CppUnsupportedError(f'Unterminated argument list invoking macro "{macro.name}" on line {name_token.line}')
+
+            if token.text == '(' and token.kind == 'punct':
+                depth += 1
+
+            elif token.text == ')' and token.kind == 'punct':
+                if not depth:
+                    break
+
+                depth -= 1
+
+            elif token.text == ',' and token.kind == 'punct' and not depth and not (macro.variadic and len(args) == len(macro.params)):
+                args.append([])
+                continue
+
+            if token.kind != 'padding' or args[-1]:
+                args[-1].append(token)
+
+        for arg in args:
+            while arg and arg[-1].kind == 'padding':
+                arg.pop()
+
+        if len(args) == 1 and not args[0] and not macro.params:
+            args = []
+
+        elif len(args) == len(macro.params) - 1 and macro.variadic:
+            args.append(None)
+
+        if len(args) != len(macro.params):
+            raise CppUnsupportedError(f'Macro "{macro.name}" passed {len(args)} arguments, but takes {len(macro.params)}, on line {name_token.line}')
+
+        return args, token
+
+    def _substitute(self, name_token, macro, args, hideset):
+        """Returns the body of a function-like macro with its parameters replaced by `args`.
+        """
+        expansion = []
+        expanded_args = {}
+
+        for index, entry in enumerate(macro.body):
+            if entry.param is None:
+                expansion.append(entry.copy(name_token, hideset))
+                continue
+
+            arg = args[entry.param]
+            after_paste = index > 0 and macro.body[index - 1].paste_left
+
+            if entry.stringify:
+                tokens = [_stringify(arg or ())]
+
+            elif entry.paste_left or after_paste:
+                tokens = arg or []
+
+                if after_paste and expansion:
+                    last = expansion[-1]
+
+                    if last.text == ',' and macro.variadic and entry.param == len(macro.params) - 1:
+                        # GNU extension: `, ## __VA_ARGS__` drops the comma when there are no variable arguments
+                        if arg is None:
+                            expansion.pop()
+                        elif not arg:
+                            raise CppUnsupportedError(f'Empty __VA_ARGS__ after ", ##" in macro "{macro.name}"')
+                        else:
+                            last.paste_left = entry.paste_left
+
+                    elif not tokens:
+                        last.paste_left = entry.paste_left
+
+            else:
+                if entry.param not in expanded_args:
+                    expanded_args[entry.param] = _Expander(self.macros, arg or ()).expand_all()
+
+                tokens = expanded_args[entry.param]
+
+            if index > 0 and not after_paste:
+                expansion.append(_padding(entry))
+
+            for token in tokens:
+                expansion.append(token if token.kind == 'padding' else token.copy(name_token, hideset))
+
+            if tokens and entry.paste_left:
+                expansion[-1].paste_left = True
+
+            if not entry.paste_left:
+                expansion.append(_padding(None))
+
+        return expansion
+
+
+class _Preprocessor:
+    """Reads a file and its includes, and prints the pre-processed tokens the way `cpp` does.
+    """
+    def __init__(self):
+        self.macros = {}
+        self.files = []
+        self.once = set()
+        self.output = []
+
+        # The state of GCC's printer, see scan_translation_unit() in gcc/c-family/c-ppoutput.c
+        self.printed = False
+        self.src_line = 1
+        self.prev = None
+        self.print_source = None
+        self.avoid_paste = False
+
+    def run(self, text, name, directory):
+        self.files.append(_SourceFile(name, directory, _lex(text)))
+        self._print_line(1, '')
+        expander = _Expander(self.macros, source=self)
+        token = expander.next()
+
+        while token is not None:
+            self._print(token)
+            token = expander.next()
+
+        if self.printed:
+            self.output.append('\n')
+
+        return ''.join(self.output)
+
+    # Printing
+
+    def _print(self, token):
+        if token.kind == 'padding':
+            self.avoid_paste = True
+
+            if self.print_source is None or (not self.print_source.white and token.source is None):
+                self.print_source = token.source
+
+            return
+
+        if self.avoid_paste:
+            source = self.print_source or token
+
+            if token.line != self.src_line:
+                self._line_change(token)
+                self.output.append(' ')
+
+            elif source.white or (self.prev and _avoid_paste(self.prev, token)) or (self.prev is None and token.text == '#'):
+                self.output.append(' ')
+
+        elif token.white:
+            if token.line != self.src_line:
+                self._line_change(token)
+
+            self.output.append(' ')
+
+        self.avoid_paste = False
+        self.print_source = None
+        self.prev = token
+        self.output.append(token.text)
+        self.printed = True
+
+    def _line_change(self, token):
+        """Start a new output line for `token`, indented to its column.
+        """
+        self._maybe_print_line(token.line)
+        self.prev = None
+        self.print_source = None
+        self.output.append(' ' * (token.column - 2))
+        self.printed = True
+
+    def _maybe_print_line(self, line):
+        """Move the output to `line`, with blank lines for a short distance and a line marker otherwise.
+        """
+        if self.printed:
+            self.output.append('\n')
+            self.src_line += 1
+            self.printed = False
+
+        if self.src_line <= line < self.src_line + 8:
+            self.output.append('\n' * (line - self.src_line))
+            self.src_line = line
+
+        else:
+            self._print_line(line, '')
+
+    def _print_line(self, line, flags):
+        """Print a line marker for `line` in the current file.
+        """
+        if self.printed:
+            self.output.append('\n')
+
+        name = self.files[-1].name.replace('\\', '\\\\').replace('"', '\\"')
+        self.output.append(f'# {line} "{name}"{flags}\n')
+        self.printed = False
+        self.src_line = line
+
+    # Reading source files
+
+    def next_token(self, in_args=False):
+        """Returns the next token to be expanded, or None at the end of the main file.
+
+        Directives are carried out as they are reached, and the tokens in conditional blocks that are not taken are skipped. Tokens read while collecting macro arguments can not end the file they are in, and the line breaks before them count as whitespace.
+        """
+        while True:
+            file = self.files[-1]
+
+            if file.index == len(file.tokens):
+                if file.conditionals:
+                    raise CppUnsupportedError(f'Unterminated conditional directive in {file.name}')
+
+                if in_args or len(self.files) == 1:
+                    return None
+
+                self._leave_file()
+                continue
+
+            token = file.tokens[file.index]
+
+            if token.bol and token.text == '#' and token.kind == 'punct':
+                self._directive(file, in_args)
+
+            elif file.skipping:
+                file.index += 1
+
+            else:
+                file.index += 1
+
+                if token.bol:
+                    if in_args:
+                        token.white = True
+                    else:
+                        self._line_change(token)
+
+                return token
+
+    def take_paren(self):
+        """Consume the next token if it is a `(`, without carrying out any directives.
+        """
+        file = self.files[-1]
+
+        if file.index < len(file.tokens) and file.tokens[file.index].text == '(' and file.tokens[file.index].kind == 'punct':
+            file.index += 1
+            return True
+
+        return False
+
+    def _leave_file(self):
+        self.files.pop()
+        self._print_line(self.files[-1].return_line, ' 2')
+
+    def _directive(self, file, in_args):
+        """Carry out the directive at the current position in `file`.
+        """
+        hash_token = file.tokens[file.index]
+        start = file.index = file.index + 1
+
+        while file.index < len(file.tokens) and not file.tokens[file.index].bol:
+            file.index += 1
+
+        tokens = file.tokens[start:file.index]
+
+        if not tokens:
+            return
+
+        name = tokens[0].text
+
+        if name in ('if', 'ifdef', 'ifndef', 'elif', 'else', 'endif'):
+            self._conditional(file, name, tokens)
+
+        elif file.skipping:
+            return
+
+        elif in_args:
+            raise CppUnsupportedError(f'#{name} inside the arguments of a macro on line {hash_token.line} of {file.name}')
+
+        elif name == 'define':
+            self._define(tokens[1:], hash_token, file)
+
+        elif name == 'undef':
+            if len(tokens) < 2 or tokens[1].kind != 'name':
+                raise CppUnsupportedError(f'Bad #undef on line {hash_token.line} of {file.name}')
+
+            self.macros.pop(tokens[1].text, None)
+
+        elif name == 'include':
+            self._include(tokens[1:], hash_token, file)
+
+        elif name == 'pragma' and len(tokens) == 2 and tokens[1].text == 'once':
+            self._line_change(tokens[1])
+
+            if len(self.files) > 1:
+                self.once.add(os.path.realpath(file.name))
+
+        elif name not in ('error', 'warning'):
+            # #error and #warning only print a message, but anything else changes the output in a way we don't reproduce
+            raise CppUnsupportedError(f'#{name} on line {hash_token.line} of {file.name}')
+
+    def _conditional(self, file, name, tokens):
+        """Carry out an `#if`, `#ifdef`, `#ifndef`, `#elif`, `#else` or `#endif`.
+        """
+        conditionals = file.conditionals
+
+        if name in ('if', 'ifdef', 'ifndef'):
+            if file.skipping:
+                conditionals.append([False, True, False])
+            else:
+                result = self._condition(name, tokens, file)
+                conditionals.append([result, result, False])
+
+            return
+
+        if not conditionals or (name != 'endif' and conditionals[-1][2]):
+            raise CppUnsupportedError(f'#{name} without #if on line {tokens[0].line} of {file.name}')
+
+        if name == 'endif':
+            conditionals.pop()
+            return
+
+        branch = conditionals[-1]
+
+        if branch[1]:
+            branch[0] = False
+
+        else:
+            branch[0] = name == 'else' or self._condition(name, tokens, file)
+            branch[1] = branch[0]
+
+        branch[2] = name == 'else'
+
+    def _condition(self, name, tokens, file):
+        """Returns the result of the condition in an `#if`, `#ifdef`, `#ifndef` or `#elif`.
+        """
+        if name in ('ifdef', 'ifndef'):
+            if len(tokens) < 2 or tokens[1].kind != 'name':
+                raise CppUnsupportedError(f'Bad #{name} on line {tokens[0].line} of {file.name}')
+
+            return self._defined(tokens[1].text) == (name == 'ifdef')
+
+        line = tokens[0].line
+        expression = []
+        tokens = iter(tokens[1:])
+
+        for token in tokens:
+            if token.text == 'defined' and token.kind == 'name':
+                operand = next(tokens, None)
+
+                if operand is not None and operand.text == '(':
+                    operand, close_paren = next(tokens, None), next(tokens, None)
+
+                    if close_paren is None or close_paren.text != ')':
+                        operand = None
+
+                if operand is None or operand.kind != 'name':
+                    raise CppUnsupportedError(f'Bad "defined" on line {token.line} of {file.name}')
+
+                expression.append(_Token('number', '1' if self._defined(operand.text) else '0', token.line, token.column))
+
+            else:
+                expression.append(token)
+
+        text = []
+
+        for token in _Expander(self.macros, expression).expand_all():
+            if token.kind == 'name':
+                # Identifiers left over after expansion are 0, including `defined` coming out of a macro, which GCC would handle differently
+                if token.text == 'defined':
+                    raise CppUnsupportedError(f'"defined" produced by a macro on line {token.line} of {file.name}')
+
+                text.append('0')
+
+            elif token.kind in ('number', 'punct'):
+                text.append(token.text)
+
+            elif token.kind != 'padding':
+                raise CppUnsupportedError(f'Can\'t evaluate {token.text} in #{name} on line {token.line} of {file.name}')
+
+        result = evaluate_c_condition(' '.join(text))
+
+        if result is None:
+            raise CppUnsupportedError(f'Can\'t evaluate #{name} on line {line} of {file.name}')
+
+        return result
+
+    def _defined(self, name):
+        if name not in self.macros and _is_builtin(name):
+            raise CppUnsupportedError(f'{name} is defined by the compiler running cpp')
+
+        return name in self.macros
+
+    def _define(self, tokens, hash_token, file):
+        """Carry out a `#define`.
+        """
+        if not tokens or tokens[0].kind != 'name' or tokens[0].text == 'defined':
+            raise CppUnsupportedError(f'Bad #define on line {hash_token.line} of {file.name}')
+
+        name = tokens[0].text
+        params = None
+        variadic = False
+        index = 1
+
+        if len(tokens) > 1 and tokens[1].text == '(' and not tokens[1].white:
+            params, variadic, index = self._define_params(tokens, hash_token, file)
+
+        body = []
+
+        while index < len(tokens):
+            token = tokens[index]
+            entry = _Token(token.kind, token.text, token.line, token.column, token.white)
+            index += 1
+
+            if token.text in ('__VA_ARGS__', '__VA_OPT__') and not (variadic and token.text == '__VA_ARGS__'):
+                raise CppUnsupportedError(f'{token.text} in macro "{name}" on line {hash_token.line} of {file.name}')
+
+            if token.text == '##' and token.kind == 'punct':
+                if not body or index == len(tokens):
+                    raise CppUnsupportedError(f'"##" at either end of macro "{name}" on line {hash_token.line} of {file.name}')
+
+                body[-1].paste_left = True
+                continue
+
+            if params is not None and token.text == '#' and token.kind == 'punct':
+                if index == len(tokens) or tokens[index].text not in params:
+                    raise CppUnsupportedError(f'"#" is not followed by a macro parameter in "{name}" on line {hash_token.line} of {file.name}')
+
+                entry = _Token('name', tokens[index].text, token.line, token.column, token.white)
+                entry.stringify = True
+                index += 1
+
+            if params is not None and entry.kind == 'name' and entry.text in params:
+                entry.param = params.index(entry.text)
+
+            body.append(entry)
+
+        if body:
+            body[0].white = False
+
+        self.macros[name] = _Macro(name, params, variadic, body)
+
+    def _define_params(self, tokens, hash_token, file):
+        """Returns the parameters of a function-like macro, whether it is variadic, and the index of the first token of its body.
+        """
+        params = []
+        index = 2
+
+        while index < len(tokens):
+            token = tokens[index]
+
+            if token.text == ')' and not params:
+                return (), False, index + 1
+
+            if token.text == '...':
+                params.append('__VA_ARGS__')
+                variadic = True
+
+            elif token.kind == 'name' and token.text not in params and token.text != '__VA_ARGS__':
+                params.append(token.text)
+                variadic = False
+
+            else:
+                break
+
+            if index + 1 < len(tokens) and tokens[index + 1].text == ')':
+                return tuple(params), variadic, index + 2
+
+            if variadic or index + 1 == len(tokens) or tokens[index + 1].text != ',':
+                break
+
+            index += 2
+
+        raise CppUnsupportedError(f'Bad parameter list for a macro on line {hash_token.line} of {file.name}')
+
+    def _include(self, tokens, hash_token, file):
+        """Carry out an `#include`.
+        """
+        if tokens and tokens[0].kind == 'name' and tokens[0].text not in self.macros:
+            # cpp reports an error and carries on, which is what happens to `#include QMK_KEYBOARD_H`
+            return
+
+        if not tokens or tokens[0].kind != 'string' or not tokens[0].text.startswith('"'):
+            raise CppUnsupportedError(f'#include {" ".join(token.text for token in tokens)} on line {hash_token.line} of {file.name}')
+
+        include_name = tokens[0].text[1:-1]
+        include_file = os.path.join(file.directory, include_name)
+
+        if not os.path.isfile(include_file):
+            raise CppUnsupportedError(f'{include_name} is not next to {file.name}')
+
+        if os.path.realpath(include_file) in self.once:
+            return
+
+        if len(self.files) > max_include_depth:
+            raise CppUnsupportedError(f'#include nested more than {max_include_depth} deep in {file.name}')
+
+        try:
+            with open(include_file, encoding='utf-8') as fd:
+                text = fd.read()
+
+        except UnicodeDecodeError:
+            raise CppUnsupportedError(f'{include_file} is not UTF-8')
+
+        file.return_line = hash_token.line + 1
+        self._maybe_print_line(hash_token.line)
+        self.files.append(_SourceFile(include_file, os.path.dirname(include_file), _lex(text)))
+        self._print_line(1, ' 1')
+
+
+def preprocess(text, path=None):
+    """Returns what `cpp` would print for `text`, the contents of the file at `path`.
+
+    Quoted `#include`s are looked for next to `path`, or in the current directory when `path` is None (for stdin). Raises CppUnsupportedError when the output could differ from `cpp`'s.
+    """
+    if path is None:
+        name, directory = '<stdin>', ''
+    else:
+        name, directory = str(path), os.path.dirname(str(path))
+
+    return _Preprocessor().run(text, name, directory)
@@ -0,0 +1,97 @@
+"""A single pass tokenizer for the preprocessor directives in C source and header files.
+
+Comments, string and character literals and line continuations are handled the same way the C preprocessor handles them, so a `/*` inside a string or a `#define` split over several lines comes out right. The tokenizer keeps no state between calls and is safe to use from several threads at once.
+"""
+import re
+
+# Written as unrolled loops rather than lazy matches, which the regex engine handles several times faster
+_comment = r'/\*[^*]*\*+(?:[^/*][^*]*\*+)*/|/\*.*|//[^\n\\]*(?:\\.[^\n\\]*)*'
+_literal = r'"[^"\\\n]*(?:\\.[^"\\\n]*)*"?|\'[^\'\\\n]*(?:\\.[^\'\\\n]*)*\'?'
+_continuation = r'\\[ \t]*\r?\n'
+
+# Each match is a whole directive, a comment or a literal, and the regex engine skips over everything else. A directive runs to the end of its logical line, including any comments and line continuations in it.
+_token_regex = re.compile(
+    rf'''
+    (?=[\#/"' \t])
+    (?:
+        (?P<directive>^[ \t]*\#(?:[^\n\\/"']+|{_continuation}|\\|/(?![/*])|{_literal}|{_comment})*)
+        | {_comment}
+        | {_literal}
+    )
+    ''',
+    re.DOTALL | re.MULTILINE | re.VERBOSE,
+)
+
+# The parts of a directive that need to be replaced before it can be parsed
+_cleanup_regex = re.compile(f'(?P<literal>{_literal})|(?P<comment>{_comment})|{_continuation}', re.DOTALL)
+_continuation_regex = re.compile(_continuation)
+_directive_regex = re.compile(r'[ \t]*(?:(define|undef|ifdef|ifndef)[ \t]+([A-Za-z_]\w*)(?:\(([^)]*)\))?|([A-Za-z_]\w*))?(.*)', re.DOTALL)
+
+
+class Directive:
+    """A preprocessor directive, such as `#define FOO 1`.
+
+    `directive` is the word after the `#`. For `define`, `undef`, `ifdef` and `ifndef`, `name` is the macro name and `params` is the text between the parentheses of a function-like macro, or None. `value` is everything after that, with comments replaced by a space and line continuations removed. `line` and `column` give the position of the `#`, counting from 1.
+    """
+    __slots__ = ('directive', 'name', 'params', 'value', 'line', 'column')
+
+    def __init__(self, directive, name, params, value, line, column):
+        self.directive = directive
+        self.name = name
+        self.params = params
+        self.value = value
+        self.line = line
+        self.column = column
+
+    def __repr__(self):
+        return f'Directive({self.directive!r}, {self.name!r}, {self.params!r}, {self.value!r}, {self.line}, {self.column})'
+
+    @property
+    def full_name(self):
+        """The macro name, followed by the parameter list of a function-like macro.
+        """
+        if self.params is None:
+            return self.name
+
+        return f'{self.name}({self.params})'
+
+
+def _cleanup(match):
+    """Replace a comment with a space and remove a line continuation, leaving literals alone.
+    """
+    if match.lastgroup == 'literal':
+        return match.group()
+
+    return ' ' if match.lastgroup == 'comment' else ''
+
+
+def _parse_directive(text, line, column):
+    """Returns a Directive for the text following a `#`.
+    """
+    name_directive, name, params, directive, rest = _directive_regex.match(text).groups()
+
+    return Directive(name_directive or directive, name, params, rest.strip(), line, column)
+
+
+def iter_directives(text):
+    """Yields a Directive for every preprocessor directive in `text`, in the order they appear.
+
+    Directives inside `#if` blocks are returned whether or not the condition holds.
+    """
+    line = 1
+    line_pos = 0  # Where in `text` the line count was last brought up to date
+
+    for match in _token_regex.finditer(text):
+        if match.lastgroup == 'directive':
+            line += text.count('\n', line_pos, match.start())
+            line_pos = match.start()
+            directive = match.group()
+            body = directive.lstrip(' \t')
+
+            if '/' in body:
+                body = _cleanup_regex.sub(_cleanup, body)
+
+            elif '\\' in body:
+                body = _continuation_regex.sub('', body)
+
+            yield _parse_directive(body[1:], line, len(directive) - len(directive.lstrip(' \t')) + 1)
@@ -0,0 +1,305 @@
+"""Persistent, content addressed caches stored under the build directory.
+
+Entries are JSON documents stored at `.build/cache/<namespace>/<key>.json`. Keys are digests of every input that went into computing an entry, so stale entries are never returned- they are simply not looked up anymore. `evict_cache()` removes the least recently used entries once a namespace grows past a size limit.
+"""
+import functools
+import hashlib
+import json
+import logging
+import os
+from functools import lru_cache
+from pathlib import Path
+
+from qmk.constants import BUILD_DIR
+
+# Bump this to invalidate every existing cache entry when the on-disk format changes.
+CACHE_VERSION = 1
+
+CACHE_DIR = Path(BUILD_DIR) / 'cache'
+
+# Hit/miss statistics for each namespace in this process
+cache_stats = {}
+
+# Namespaces that have been disabled, eg by `--no-cache`
+disabled_namespaces = set()
+
+# Maps a path to (mtime, size, digest) so we only hash a file once per process
+_file_digests = {}
+
+# In-memory results of functions decorated with `memoize_file`, keyed by namespace and path
+_memoized_files = {}
+
+
+def disable_cache(namespace):
+    """Stop using the cache for `namespace` for the rest of this process.
+    """
+    disabled_namespaces.add(namespace)
+
+
+def cache_enabled(namespace):
+    """Returns True if the cache for `namespace` is in use.
+    """
+    return namespace not in disabled_namespaces and 'QMK_NO_CACHE' not in os.environ
+
+
+def file_stat_key(path):
+    """Returns a `(mtime, size)` tuple that changes whenever a file changes, or None if it does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    return stat.st_mtime_ns, stat.st_size
+
+
+def memoize_file(namespace):
+    """Cache the result of a function that takes a single file path for the life of the process.
+
+    Results are keyed by the file's path, mtime and size, so an edited file is read again. Hits and misses are counted in `cache_stats[namespace]`. Callers must treat the returned object as read-only.
+    """
+    def decorator(func):
+        memo = _memoized_files.setdefault(namespace, {})
+
+        @functools.wraps(func)
+        def wrapper(path):
+            path = str(path)
+            stat_key = file_stat_key(path)
+            cached = memo.get(path)
+
+            if cached and cached[0] == stat_key:
+                record_cache_stat(namespace, 'hits')
+                return cached[1]
+
+            record_cache_stat(namespace, 'misses')
+            result = func(path)
+            memo[path] = (stat_key, result)
+
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def memoize_content(namespace):
+    """Cache the result of a function that takes a single file path for the life of the process, keyed by the file's contents.
+
+    Files with the same contents share one result, so the function must not use the path for anything but reading the file. Missing files are passed through uncached. Hits and misses are counted in `cache_stats[namespace]`. Callers must treat the returned object as read-only.
+    """
+    def decorator(func):
+        memo = _memoized_files.setdefault(namespace, {})
+
+        @functools.wraps(func)
+        def wrapper(path):
+            digest = file_digest(path)
+
+            if digest is None:
+                return func(path)
+
+            if digest in memo:
+                record_cache_stat(namespace, 'hits')
+                return memo[digest]
+
+            record_cache_stat(namespace, 'misses')
+            memo[digest] = func(path)
+
+            return memo[digest]
+
+        return wrapper
+
+    return decorator
+
+
+def file_digest(path):
+    """Returns the sha1 hex digest of a file's contents, or None if it does not exist.
+    """
+    path = str(path)
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    cached = _file_digests.get(path)
+
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    with open(path, 'rb') as fd:
+        digest = hashlib.sha1(fd.read()).hexdigest()
+
+    _file_digests[path] = (stat.st_mtime_ns, stat.st_size, digest)
+
+    return digest
+
+
+def files_digest(paths):
+    """Returns a single digest covering the names and contents of `paths`.
+
+    Missing files are included in the digest, so that creating one changes the result.
+    """
+    hasher = hashlib.sha1()
+
+    for path in paths:
+        hasher.update(f'{path}\0{file_digest(path)}\n'.encode('utf-8'))
+
+    return hasher.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def library_digest():
+    """Returns a digest of the qmk python library source, used to version cache entries.
+    """
+    library_dir = Path(__file__).parent
+    library_files = sorted(library_dir.glob('**/*.py'))
+    hasher = hashlib.sha1(f'cache_version={CACHE_VERSION}\n'.encode('utf-8'))
+    hasher.update(files_digest(library_files).encode('utf-8'))
+
+    return hasher.hexdigest()
+
+
+def record_cache_stat(namespace, stat):
+    """Increment a hit/miss counter for `namespace`.
+    """
+    if namespace not in cache_stats:
+        cache_stats[namespace] = {'hits': 0, 'misses': 0}
+
+    cache_stats[namespace][stat] += 1
+
+
+def merge_cache_stats(stats):
+    """Add hit/miss statistics collected in another process to this process' statistics.
+    """
+    for namespace, counts in stats.items():
+        if namespace not in cache_stats:
+            cache_stats[namespace] = {'hits': 0, 'misses': 0}
+
+        for stat, count in counts.items():
+            cache_stats[namespace][stat] += count
+
+
+def cache_get(namespace, key):
+    """Returns the cached data for `key` in `namespace`, or None if there is no entry.
+
+    The entry is marked as recently used, so that `evict_cache()` removes it last.
+    """
+    if not cache_enabled(namespace):
+        return None
+
+    cache_file = CACHE_DIR / namespace / f'{key}.json'
+
+    try:
+        with cache_file.open(encoding='utf-8') as fd:
+            data = json.load(fd)
+
+        os.utime(cache_file)
+
+    except (OSError, ValueError):
+        record_cache_stat(namespace, 'misses')
+        return None
+
+    record_cache_stat(namespace, 'hits')
+
+    return data
+
+
+def cache_put(namespace, key, data):
+    """Store `data` for `key` in `namespace`.
+
+    The file is written atomically so concurrent processes never see a partial entry.
+    """
+    if not cache_enabled(namespace):
+        return
+
+    write_json_atomic(CACHE_DIR / namespace / f'{key}.json', data)
+
+
+def evict_cache(namespace, max_bytes):
+    """Remove the least recently used entries of `namespace` until it takes up no more than `max_bytes`.
+
+    Returns the number of entries removed. Entries another process removes at the same time are skipped.
+    """
+    entries = []
+
+    try:
+        with os.scandir(CACHE_DIR / namespace) as cache_dir:
+            for entry in cache_dir:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    except OSError:
+        return 0
+
+    total_size = sum(size for _, size, _ in entries)
+    evicted = 0
+
+    for last_used, size, path in sorted(entries):
+        if total_size <= max_bytes:
+            break
+
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+
+        total_size -= size
+        evicted += 1
+
+    return evicted
+
+
+def write_json_atomic(json_file, data):
+    """Write `data` to `json_file` so that concurrent readers never see a partial file.
+
+    Failures are logged at debug level and otherwise ignored, since everything written this way can be rebuilt.
+    """
+    tmp_file = json_file.parent / f'{json_file.name}.{os.getpid()}'
+
+    try:
+        json_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file.write_text(json.dumps(data, separators=(',', ':')), encoding='utf-8')
+        tmp_file.replace(json_file)
+
+    except OSError as e:
+        logging.getLogger(__name__).debug('Could not write cache file %s: %s', json_file, e)
+
+
+def cache_stats_message(namespace):
+    """Returns a human readable summary of the hit/miss statistics for `namespace`.
+    """
+    stats = cache_stats.get(namespace, {'hits': 0, 'misses': 0})
+    total = stats['hits'] + stats['misses']
+    hit_rate = 100 * stats['hits'] / total if total else 0
+
+    return f'{namespace} cache: {stats["hits"]} hits, {stats["misses"]} misses ({hit_rate:.1f}% hit rate)'
+
+
+class LogRecorder(logging.Handler):
+    """Collects the messages sent to a logger so they can be stored with a cache entry and replayed on a hit.
+    """
+    def __init__(self, logger):
+        super().__init__()
+        self.logger = logger
+        self.messages = []
+
+    def __enter__(self):
+        self.logger.addHandler(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.logger.removeHandler(self)
+
+    def emit(self, record):
+        self.messages.append([record.levelno, record.getMessage()])
+
+
+def replay_logs(logger, messages):
+    """Send messages collected by a `LogRecorder` to `logger` again.
+    """
+    for levelno, message in messages:
+        logger.log(levelno, '%s', message)
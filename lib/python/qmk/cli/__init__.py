@@ -1,6 +1,8 @@
 """QMK CLI Subcommands
 
 We list each subcommand here explicitly because all the reliable ways of searching for modules are slow and delay startup.
+
+When a known subcommand is being run only its module is imported, so that startup does not pay for every other subcommand's dependencies. Everything is imported when we need the full list, such as for `qmk --help` or tab completion.
 """
 import os
 import shlex
@@ -13,9 +15,9 @@ from milc import cli, __VERSION__
 from milc.questions import yesno
 
 import_names = {
-    # A mapping of package name to importable name
+    # A mapping of package name to importable name. Use top level names, because find_spec() imports the parents of dotted names.
     'pep8-naming': 'pep8ext_naming',
-    'pyusb': 'usb.core',
+    'pyusb': 'usb',
     'qmk-dotty-dict': 'dotty_dict'
 }
 
@@ -41,6 +43,7 @@ subcommands = [
     'qmk.cli.fileformat',
     'qmk.cli.flash',
     'qmk.cli.format.json',
+    'qmk.cli.generate.all',
     'qmk.cli.generate.api',
     'qmk.cli.generate.config_h',
     'qmk.cli.generate.dfu_header',
@@ -58,6 +61,7 @@ subcommands = [
     'qmk.cli.list.keymaps',
     'qmk.cli.kle2json',
     'qmk.cli.multibuild',
+    'qmk.cli.multibuild_merge',
     'qmk.cli.new.keyboard',
     'qmk.cli.new.keymap',
     'qmk.cli.pyformat',
@@ -65,6 +69,12 @@ subcommands = [
 ]
 
 
+def subcommand_name(module):
+    """Returns the name of the subcommand defined in `module`, eg `qmk.cli.generate.config_h` -> `generate-config-h`.
+    """
+    return module[len('qmk.cli.'):].replace('.', '-').replace('_', '-')
+
+
 def _run_cmd(*command):
     """Run a command in a subshell.
     """
@@ -188,7 +198,14 @@ if not safe_command:
             exit(1)
 
 # Import our subcommands
-for subcommand in subcommands:
+subcommand_modules = {subcommand_name(module): module for module in subcommands}
+
+if args and args[0] in subcommand_modules and '_ARGCOMPLETE' not in os.environ:
+    import_subcommands = [subcommand_modules[args[0]]]
+else:
+    import_subcommands = subcommands
+
+for subcommand in import_subcommands:
     try:
         __import__(subcommand)
 
@@ -1,29 +1,127 @@
 """Generate a keymap.json from a keymap.c file.
 """
 import json
+import sys
+from fnmatch import fnmatchcase
+from multiprocessing import Pool
+from time import perf_counter
 
 from argcomplete.completers import FilesCompleter
 from milc import cli
 
 import qmk.keymap
 import qmk.path
+from qmk.constants import QMK_FIRMWARE
 from qmk.json_encoders import InfoJSONEncoder
 from qmk.keyboard import keyboard_completer, keyboard_folder
+from qmk.keymap_index import keymap_index
 from qmk.errors import CppError
 
 
+def _find_keymap_files(pattern):
+    """Returns `(keyboard, keymap, keymap.c path)` for every C keymap whose directory matches the glob `pattern`.
+
+    The keyboard is None for community layout keymaps.
+    """
+    keymap_files = []
+
+    for keymap_dir, keymap in sorted(keymap_index()['keymaps'].items()):
+        if keymap['type'] == 'c' and fnmatchcase(keymap_dir, pattern):
+            keyboard = None if keymap['layout'] else keymap_dir[len('keyboards/'):-len(f'/keymaps/{keymap["name"]}')]
+            keymap_files.append((keyboard, keymap['name'], f'{keymap_dir}/keymap.c'))
+
+    return keymap_files
+
+
+def _convert_keymap(job):
+    """Convert one keymap.c, returning a record with either its keymap.json `result` or an `error`.
+    """
+    keyboard, keymap, keymap_c, use_cpp, system_cpp = job
+    start_time = perf_counter()
+    record = {'keyboard': keyboard, 'keymap': keymap, 'file': keymap_c}
+
+    try:
+        keymap_json = qmk.keymap.c2json(keyboard, keymap, QMK_FIRMWARE / keymap_c, use_cpp=use_cpp, system_cpp=system_cpp)
+        record['result'] = qmk.keymap.generate_json(keymap_json['keymap'], keymap_json['keyboard'], keymap_json['layout'], keymap_json['layers'])
+
+    # The parser fails in many different ways on keymaps it does not understand, and one bad keymap must not stop the run
+    except Exception as e:
+        record['error'] = f'{e.__class__.__name__}: {e}'
+
+    record['seconds'] = round(perf_counter() - start_time, 4)
+
+    return record
+
+
+def _convert_keymaps(jobs, parallel):
+    """Yields a record for each of `jobs`, in order.
+    """
+    if parallel <= 1:
+        for job in jobs:
+            yield _convert_keymap(job)
+
+        return
+
+    with Pool(parallel) as pool:
+        yield from pool.imap(_convert_keymap, jobs, chunksize=8)
+
+
+def _bulk_c2json(pattern):
+    """Convert every C keymap matching `pattern`, writing one JSON record per line.
+    """
+    start_time = perf_counter()
+    keymap_files = _find_keymap_files(pattern)
+    jobs = [(keyboard, keymap, keymap_c, cli.args.no_cpp, cli.args.system_cpp) for keyboard, keymap, keymap_c in keymap_files]
+    converted = 0
+
+    if cli.args.output:
+        cli.args.output.parent.mkdir(parents=True, exist_ok=True)
+        output = cli.args.output.open('w', encoding='utf-8')
+    else:
+        output = sys.stdout
+
+    try:
+        for record in _convert_keymaps(jobs, cli.args.parallel):
+            converted += 'result' in record
+            output.write(json.dumps(record) + '\n')
+            output.flush()
+
+    finally:
+        if cli.args.output:
+            output.close()
+
+    if not cli.args.quiet:
+        cli.log.info('Converted %d of %d keymaps in %.1f seconds.', converted, len(jobs), perf_counter() - start_time)
+
+    return True
+
+
+@cli.argument('--system-cpp', arg_only=True, action='store_true', help='Always use \'cpp\' instead of the built-in C pre-processor')
 @cli.argument('--no-cpp', arg_only=True, action='store_false', help='Do not use \'cpp\' on keymap.c')
 @cli.argument('-o', '--output', arg_only=True, type=qmk.path.normpath, help='File to write to')
 @cli.argument('-q', '--quiet', arg_only=True, action='store_true', help="Quiet mode, only output error messages")
-@cli.argument('-kb', '--keyboard', arg_only=True, type=keyboard_folder, completer=keyboard_completer, required=True, help='The keyboard\'s name')
-@cli.argument('-km', '--keymap', arg_only=True, required=True, help='The keymap\'s name')
-@cli.argument('filename', arg_only=True, completer=FilesCompleter('.c'), help='keymap.c file')
+@cli.argument('-kb', '--keyboard', arg_only=True, type=keyboard_folder, completer=keyboard_completer, help='The keyboard\'s name')
+@cli.argument('-km', '--keymap', arg_only=True, help='The keymap\'s name')
+@cli.argument('-j', '--parallel', arg_only=True, type=int, default=1, help='Set the number of keymaps to convert in parallel with --all or --glob.')
+@cli.argument('--glob', arg_only=True, help='Convert every keymap.c in a keymap directory matching this pattern, eg \'keyboards/planck/*\', writing one JSON record per line.')
+@cli.argument('--all', arg_only=True, action='store_true', help='Convert every keymap.c in the tree, writing one JSON record per line.')
+@cli.argument('filename', arg_only=True, nargs='?', completer=FilesCompleter('.c'), help='keymap.c file')
 @cli.subcommand('Creates a keymap.json from a keymap.c file.')
 def c2json(cli):
     """Generate a keymap.json from a keymap.c file.
 
     This command uses the `qmk.keymap` module to generate a keymap.json from a keymap.c file. The generated keymap is written to stdout, or to a file if -o is provided.
+
+    With --all or --glob every matching keymap.c is converted instead, and a JSON record with the result or error for each one is written per line.
     """
+    if cli.args.all or cli.args.glob:
+        return _bulk_c2json('*' if cli.args.all else cli.args.glob)
+
+    if not cli.args.filename or not cli.args.keyboard or not cli.args.keymap:
+        cli.log.error('A keyboard, keymap and keymap.c file are required, unless --all or --glob is used.')
+        cli.print_usage()
+        return False
+
     if cli.args.filename != '-':
         cli.args.filename = qmk.path.normpath(cli.args.filename)
 
@@ -39,7 +137,7 @@ def c2json(cli):
 
     # Parse the keymap.c
     try:
-        keymap_json = qmk.keymap.c2json(cli.args.keyboard, cli.args.keymap, cli.args.filename, use_cpp=cli.args.no_cpp)
+        keymap_json = qmk.keymap.c2json(cli.args.keyboard, cli.args.keymap, cli.args.filename, use_cpp=cli.args.no_cpp, system_cpp=cli.args.system_cpp)
     except CppError as e:
         if cli.config.general.verbose:
             cli.log.debug('The C pre-processor ran into a fatal error: %s', e)
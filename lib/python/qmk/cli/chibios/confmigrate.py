@@ -1,9 +1,9 @@
 """This script automates the copying of the default keymap into your own keymap.
 """
-import re
 import sys
 import os
 
+from qmk.c_tokenizer import iter_directives
 from qmk.constants import QMK_FIRMWARE
 from qmk.path import normpath
 from milc import cli
@@ -42,16 +42,13 @@ file_header = """\
 def collect_defines(filepath):
     with open(filepath, 'r', encoding='utf-8') as f:
         content = f.read()
-        define_search = re.compile(r'(?m)^#\s*define\s+(?:.*\\\r?\n)*.*$', re.MULTILINE)
-        value_search = re.compile(r'^#\s*define\s+(?P<name>[a-zA-Z0-9_]+(\([^\)]*\))?)\s*(?P<value>.*)', re.DOTALL)
-        define_matches = define_search.findall(content)
-
-        defines = {"keys": [], "dict": {}}
-        for define_match in define_matches:
-            value_match = value_search.search(define_match)
-            defines["keys"].append(value_match.group("name"))
-            defines["dict"][value_match.group("name")] = value_match.group("value")
-        return defines
+
+    defines = {"keys": [], "dict": {}}
+    for define in iter_directives(content):
+        if define.directive == 'define' and define.name:
+            defines["keys"].append(define.full_name)
+            defines["dict"][define.full_name] = define.value
+    return defines
 
 
 def check_diffs(input_defs, reference_defs):
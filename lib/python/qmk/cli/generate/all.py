@@ -0,0 +1,88 @@
+"""Used by the make system to generate all of a keyboard's info.json derived files in one pass.
+"""
+from milc import cli
+
+from qmk.cache import cache_stats_message, disable_cache
+from qmk.cli.generate.config_h import build_config_h
+from qmk.cli.generate.keyboard_h import build_keyboard_h
+from qmk.cli.generate.layouts import build_layouts_h
+from qmk.cli.generate.rules_mk import build_rules_mk
+from qmk.decorators import automagic_keyboard, automagic_keymap
+from qmk.info import INFO_JSON_CACHE, info_json
+from qmk.keyboard import keyboard_completer, keyboard_folder
+from qmk.path import is_keyboard, normpath
+
+
+def _write_generated_file(output_file, content):
+    """Write a generated file, unless it already has this content.
+
+    Leaving an unchanged file alone keeps its mtime, so make does not rebuild everything that depends on it.
+    """
+    if output_file.exists() and output_file.read_text() == content:
+        cli.log.debug('%s is up to date.', output_file)
+        return
+
+    output_file.write_text(content)
+    cli.log.debug('Wrote %s.', output_file)
+
+
+@cli.argument('-o', '--output', arg_only=True, type=normpath, required=True, help='Directory to write the generated files to')
+@cli.argument('-q', '--quiet', arg_only=True, action='store_true', help="Quiet mode, only print the path to the generated rules.mk")
+@cli.argument('-e', '--escape', arg_only=True, action='store_true', help="Escape spaces in quiet mode")
+@cli.argument('-kb', '--keyboard', type=keyboard_folder, completer=keyboard_completer, help='Keyboard to generate files for.')
+@cli.argument('--no-cache', arg_only=True, action='store_true', help='Do not use the info.json cache.')
+@cli.subcommand('Used by the make system to generate rules.mk, info_config.h, default_keyboard.h and layouts.h from info.json', hidden=True)
+@automagic_keyboard
+@automagic_keymap
+def generate_all(cli):
+    """Generates rules.mk, info_config.h, default_keyboard.h and layouts.h from a single info.json pass.
+    """
+    if cli.args.no_cache:
+        disable_cache(INFO_JSON_CACHE)
+
+    if not cli.config.generate_all.keyboard:
+        cli.log.error('Missing parameter: --keyboard')
+        cli.subcommands['generate-all'].print_help()
+        return False
+
+    if not is_keyboard(cli.config.generate_all.keyboard):
+        cli.log.error('Invalid keyboard: "%s"', cli.config.generate_all.keyboard)
+        return False
+
+    # Build the info.json data once and derive every file from it
+    kb_info_json = info_json(cli.config.generate_all.keyboard)
+    generated_files = {
+        'rules.mk': build_rules_mk(kb_info_json),
+        'info_config.h': build_config_h(kb_info_json),
+        'default_keyboard.h': build_keyboard_h(kb_info_json),
+        'layouts.h': build_layouts_h(kb_info_json),
+    }
+
+    # Write the results
+    cli.args.output.mkdir(parents=True, exist_ok=True)
+
+    for filename, content in generated_files.items():
+        output_file = cli.args.output / filename
+
+        if content is None:
+            # Leave the file missing so that make runs the single-file generator and reports the error
+            if output_file.exists():
+                output_file.unlink()
+
+            continue
+
+        _write_generated_file(output_file, content)
+
+    rules_mk_file = cli.args.output / 'rules.mk'
+
+    if cli.args.quiet:
+        if cli.args.escape:
+            print(rules_mk_file.as_posix().replace(' ', '\\ '))
+        else:
+            print(rules_mk_file)
+    else:
+        cli.log.info('Wrote generated files to %s.', cli.args.output)
+
+    cli.log.debug(cache_stats_message(INFO_JSON_CACHE))
+
+    return None not in generated_files.values()
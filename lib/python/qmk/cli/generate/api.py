@@ -1,24 +1,311 @@
 """This script automates the generation of the QMK API data.
 """
+from multiprocessing import Pool
 from pathlib import Path
 from shutil import copyfile
+from time import perf_counter
+import hashlib
 import json
+import os
 
 from milc import cli
 
+import qmk.cache
+from qmk.cache import cache_stats_message, disable_cache, file_digest
+from qmk.constants import BUILD_DIR
 from qmk.datetime import current_datetime
-from qmk.info import info_json
+from qmk.info import INFO_JSON_CACHE, info_json, info_json_digest
 from qmk.json_encoders import InfoJSONEncoder
 from qmk.json_schema import json_load
-from qmk.keyboard import find_readme, list_keyboards
+from qmk.keyboard import find_readme, keyboard_completer, keyboard_folder, list_keyboards
+from qmk.path import normpath
+
+# How many of the slowest keyboards to report at the end of a run
+SLOWEST_KEYBOARD_COUNT = 10
+
+# Records the inputs and outputs of the previous run so unchanged keyboards can be skipped
+API_MANIFEST_FILE = Path(BUILD_DIR) / 'api_manifest.json'
+API_MANIFEST_VERSION = 1
+
+
+def _payload_digest(payload):
+    """Returns a digest of the data that goes into an API file, excluding the last_updated timestamp.
+    """
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _keyboard_input_digest(keyboard_name):
+    """Returns a digest of everything that goes into a keyboard's API files.
+    """
+    readme = find_readme(keyboard_name)
+    readme_digest = f'{readme}:{file_digest(readme)}' if readme else 'no readme'
+
+    return hashlib.sha1(f'{info_json_digest(keyboard_name)}\0{readme_digest}'.encode('utf-8')).hexdigest()
+
+
+def _load_manifest():
+    """Returns the manifest written by the previous run, or an empty manifest.
+    """
+    empty_manifest = {'version': API_MANIFEST_VERSION, 'keyboards': {}, 'files': {}}
+
+    try:
+        manifest = json.loads(API_MANIFEST_FILE.read_text(encoding='utf-8'))
+
+    except (OSError, ValueError):
+        return empty_manifest
+
+    if manifest.get('version') != API_MANIFEST_VERSION:
+        return empty_manifest
+
+    return manifest
+
+
+def _write_if_changed(output_file, payload, previous_digest, last_updated, dry_run, encoder=None):
+    """Write `payload` plus a last_updated timestamp to `output_file` when its contents have changed.
+
+    Returns the digest of `payload`.
+    """
+    digest = _payload_digest(payload)
+
+    if digest == previous_digest and output_file.exists():
+        cli.log.debug('Unchanged file %s', output_file)
+
+    elif not dry_run:
+        output_file.write_text(json.dumps({'last_updated': last_updated, **payload}, cls=encoder))
+        cli.log.debug('Wrote file %s', output_file)
+
+    return digest
+
+
+def _remove_keyboard_files(v1_dir, keyboard_name):
+    """Remove the API files for a keyboard that no longer exists.
+    """
+    keyboard_dir = v1_dir / 'keyboards' / keyboard_name
+
+    for filename in 'info.json', 'readme.md':
+        if (keyboard_dir / filename).exists():
+            (keyboard_dir / filename).unlink()
+            cli.log.debug('Removed file %s', keyboard_dir / filename)
+
+    # Clean up directories that are now empty, stopping at the first one still in use
+    while keyboard_dir != v1_dir / 'keyboards' and keyboard_dir.exists() and not any(keyboard_dir.iterdir()):
+        keyboard_dir.rmdir()
+        keyboard_dir = keyboard_dir.parent
+
+
+def _process_keyboard(keyboard_name, v1_dir, last_updated, dry_run, previous_digest=None):
+    """Build the info.json data for a keyboard and write its API files if they changed.
+
+    Returns a tuple of (keyboard_name, info_json, seconds taken, output digest).
+    """
+    start_time = perf_counter()
+    kb_info_json = info_json(keyboard_name)
+    keyboard_dir = v1_dir / 'keyboards' / keyboard_name
+    keyboard_info = keyboard_dir / 'info.json'
+    keyboard_readme = keyboard_dir / 'readme.md'
+    keyboard_readme_src = find_readme(keyboard_name)
+
+    if not dry_run:
+        keyboard_dir.mkdir(parents=True, exist_ok=True)
+
+    output_digest = _write_if_changed(keyboard_info, {'keyboards': {keyboard_name: kb_info_json}}, previous_digest, last_updated, dry_run)
+
+    if not dry_run and keyboard_readme_src and file_digest(keyboard_readme_src) != file_digest(keyboard_readme):
+        copyfile(keyboard_readme_src, keyboard_readme)
+        cli.log.debug('Copied %s -> %s', keyboard_readme_src, keyboard_readme)
+
+    return keyboard_name, kb_info_json, perf_counter() - start_time, output_digest
+
+
+def _init_worker(no_cache):
+    """Setup a worker process for parallel keyboard processing.
+    """
+    if no_cache:
+        disable_cache(INFO_JSON_CACHE)
+
+
+def _process_keyboard_worker(args):
+    """Process a keyboard in a worker process, returning the cache statistics collected along the way.
+    """
+    qmk.cache.cache_stats.clear()
+    result = _process_keyboard(*args)
+
+    return (*result, qmk.cache.cache_stats.copy())
+
+
+def _process_keyboards(keyboards, v1_dir, last_updated, dry_run, parallel, previous_digests):
+    """Yields `(keyboard_name, info_json, seconds, output digest)` for each keyboard, in the order of `keyboards`.
+    """
+    jobs = [(keyboard_name, v1_dir, last_updated, dry_run, previous_digests.get(keyboard_name)) for keyboard_name in keyboards]
+
+    if parallel <= 1:
+        for job in jobs:
+            yield _process_keyboard(*job)
+
+        return
+
+    with Pool(parallel, initializer=_init_worker, initargs=(cli.args.no_cache,)) as pool:
+        # imap() returns results in submission order, which keeps the output identical to a serial run
+        for keyboard_name, kb_info_json, elapsed, output_digest, cache_stats in pool.imap(_process_keyboard_worker, jobs, chunksize=8):
+            qmk.cache.merge_cache_stats(cache_stats)
+            yield keyboard_name, kb_info_json, elapsed, output_digest
+
+
+def _all_keyboards(keyboards, changed_keyboards, processed, v1_dir):
+    """Yields `(keyboard_name, info_json, seconds, output digest)` for every keyboard in `keyboards`, in order.
+
+    Changed keyboards are taken from `processed`, which must yield them in the same order as `keyboards`. The rest are loaded one at a time from their existing API files, with None for seconds and output digest.
+    """
+    changed_keyboards = set(changed_keyboards)
+
+    for keyboard_name in keyboards:
+        if keyboard_name in changed_keyboards:
+            yield next(processed)
+        else:
+            keyboard_info = v1_dir / 'keyboards' / keyboard_name / 'info.json'
+            yield keyboard_name, json.loads(keyboard_info.read_text(encoding='utf-8'))['keyboards'][keyboard_name], None, None
+
+
+def _add_usb(usb_list, keyboard_name, kb_info_json):
+    """Add a keyboard to the USB VID/PID mapping.
+    """
+    if 'usb' in kb_info_json:
+        usb = kb_info_json['usb']
+
+        if 'vid' in usb and usb['vid'] not in usb_list:
+            usb_list[usb['vid']] = {}
+
+        if 'pid' in usb and usb['pid'] not in usb_list[usb['vid']]:
+            usb_list[usb['vid']][usb['pid']] = {}
+
+        if 'vid' in usb and 'pid' in usb:
+            usb_list[usb['vid']][usb['pid']][keyboard_name] = usb
+
+
+class KeyboardsJSONWriter:
+    """Writes keyboards.json one keyboard at a time, so the data for every keyboard never has to be in memory at once.
+
+    The output is identical to `json.dumps({'last_updated': last_updated, 'keyboards': kb_all}, cls=InfoJSONEncoder)` as long as keyboards are written in sorted order. It goes to a temporary file which replaces `output_file` when `commit()` is called.
+    """
+    def __init__(self, output_file, last_updated):
+        self.output_file = output_file
+        self.tmp_file = output_file.parent / f'{output_file.name}.{os.getpid()}'
+        self.last_updated = last_updated
+        self.encoder = InfoJSONEncoder()
+        self.count = 0
+
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        self.fd = self.tmp_file.open('w')
+        self.fd.write('{\n    "keyboards": ')
+
+    def write(self, keyboard_name, kb_info_json):
+        """Append a keyboard to the file.
+        """
+        # Each keyboard sits two levels deep, inside the top level object and the keyboards object
+        self.encoder.indentation_level = 2
+        self.fd.write(',\n' if self.count else '{\n')
+        self.fd.write(f'{self.encoder.indent_str}{json.dumps(keyboard_name)}: {self.encoder.encode(kb_info_json)}')
+        self.count += 1
+
+    def close(self):
+        """Finish the file, returning True if the temporary file is complete.
+        """
+        if self.fd.closed:
+            return False
+
+        self.fd.write('\n    }' if self.count else '{}')
+        self.fd.write(f',\n    "last_updated": {json.dumps(self.last_updated)}\n}}')
+        self.fd.close()
+
+        return True
+
+    def commit(self):
+        """Replace `output_file` with the data written so far.
+        """
+        if self.close():
+            self.tmp_file.replace(self.output_file)
+            cli.log.debug('Wrote file %s', self.output_file)
+
+    def discard(self):
+        """Throw away the data written so far.
+        """
+        self.close()
+
+        if self.tmp_file.exists():
+            self.tmp_file.unlink()
+
+
+def _generate_keyboards(keyboards, changed_keyboards, v1_dir, last_updated, previous_digests, new_manifest, keyboards_writer, previous_keyboards_digest):
+    """Generate the changed keyboards, streaming every keyboard into keyboards.json when `keyboards_writer` is set.
+
+    Returns a tuple of (keyboards.json digest, seconds taken for each changed keyboard, USB VID/PID mapping).
+    """
+    keyboards_digest = hashlib.sha1()
+    kb_timings = {}
+    usb_list = {}
+    processed = _process_keyboards(changed_keyboards, v1_dir, last_updated, cli.args.dry_run, cli.args.parallel, previous_digests)
+
+    try:
+        for keyboard_name, kb_info_json, elapsed, output_digest in _all_keyboards(keyboards, changed_keyboards, processed, v1_dir):
+            if elapsed is not None:
+                kb_timings[keyboard_name] = elapsed
+                new_manifest['keyboards'][keyboard_name]['output'] = output_digest
+                cli.log.debug('Processed %s in %.3f seconds', keyboard_name, elapsed)
+
+            elif not new_manifest['keyboards'][keyboard_name]['output']:
+                new_manifest['keyboards'][keyboard_name]['output'] = _payload_digest({'keyboards': {keyboard_name: kb_info_json}})
+
+            keyboards_digest.update(f'{keyboard_name}\0{new_manifest["keyboards"][keyboard_name]["output"]}\n'.encode('utf-8'))
+            _add_usb(usb_list, keyboard_name, kb_info_json)
+
+            if keyboards_writer:
+                keyboards_writer.write(keyboard_name, kb_info_json)
+
+    except BaseException:
+        if keyboards_writer:
+            keyboards_writer.discard()
+
+        raise
+
+    # Only replace keyboards.json when its contents changed, so last_updated keeps meaning something
+    if keyboards_writer:
+        if keyboards_digest.hexdigest() == previous_keyboards_digest and keyboards_writer.output_file.exists():
+            keyboards_writer.discard()
+            cli.log.debug('Unchanged file %s', keyboards_writer.output_file)
+        else:
+            keyboards_writer.commit()
+
+    return keyboards_digest.hexdigest(), kb_timings, usb_list
+
+
+def _report_run(kb_timings):
+    """Log how long the keyboards took to process and how well the caches worked.
+    """
+    cli.log.info('Processed %s keyboards in %.1f seconds of keyboard time.', len(kb_timings), sum(kb_timings.values()))
+
+    for keyboard_name in sorted(kb_timings, key=kb_timings.get, reverse=True)[:SLOWEST_KEYBOARD_COUNT]:
+        cli.log.info('    %-48s %.3f seconds', keyboard_name, kb_timings[keyboard_name])
+
+    for namespace in sorted(qmk.cache.cache_stats):
+        cli.log.info(cache_stats_message(namespace))
 
 
 @cli.argument('-n', '--dry-run', arg_only=True, action='store_true', help="Don't write the data to disk.")
+@cli.argument('-j', '--parallel', type=int, default=1, help="Set the number of keyboards to process in parallel.")
+@cli.argument('-f', '--force', arg_only=True, action='store_true', help="Regenerate every keyboard, even when its inputs have not changed since the last run.")
+@cli.argument('--no-cache', arg_only=True, action='store_true', help='Do not use the info.json cache.')
+@cli.argument('-o', '--output', arg_only=True, type=normpath, help='Write the data to this directory instead of api_data. Every keyboard is regenerated.')
+@cli.argument('-kb', '--keyboard', arg_only=True, action='append', default=[], type=keyboard_folder, completer=keyboard_completer, help='Only generate the data for this keyboard. May be passed multiple times. Every keyboard given is regenerated.')
 @cli.subcommand('Creates a new keymap for the keyboard of your choosing', hidden=False if cli.config.user.developer else True)
 def generate_api(cli):
     """Generates the QMK API data.
+
+    Only keyboards whose inputs changed since the previous run are regenerated, and files are only rewritten when their contents change.
     """
-    api_data_dir = Path('api_data')
+    if cli.args.no_cache:
+        disable_cache(INFO_JSON_CACHE)
+
+    api_data_dir = cli.args.output or Path('api_data')
     v1_dir = api_data_dir / 'v1'
     keyboard_all_file = v1_dir / 'keyboards.json'  # A massive JSON containing everything
     keyboard_list_file = v1_dir / 'keyboard_list.json'  # A simple list of keyboard targets
@@ -26,62 +313,66 @@ def generate_api(cli):
     keyboard_metadata_file = v1_dir / 'keyboard_metadata.json'  # All the data configurator/via needs for initialization
     usb_file = v1_dir / 'usb.json'  # A mapping of USB VID/PID -> keyboard target
 
-    if not api_data_dir.exists():
-        api_data_dir.mkdir()
+    api_data_dir.mkdir(parents=True, exist_ok=True)
 
-    kb_all = {}
-    usb_list = {}
+    # The manifest describes a complete api_data, so other directories and partial runs neither use nor update it
+    use_manifest = not (cli.args.output or cli.args.keyboard)
 
-    # Generate and write keyboard specific JSON files
-    for keyboard_name in list_keyboards():
-        kb_all[keyboard_name] = info_json(keyboard_name)
-        keyboard_dir = v1_dir / 'keyboards' / keyboard_name
-        keyboard_info = keyboard_dir / 'info.json'
-        keyboard_readme = keyboard_dir / 'readme.md'
-        keyboard_readme_src = find_readme(keyboard_name)
+    # Use a single timestamp so every file from this run agrees, no matter how it was scheduled
+    last_updated = current_datetime()
+    manifest = {'version': API_MANIFEST_VERSION, 'keyboards': {}, 'files': {}} if cli.args.force or not use_manifest else _load_manifest()
+    new_manifest = {'version': API_MANIFEST_VERSION, 'keyboards': {}, 'files': {}}
 
-        keyboard_dir.mkdir(parents=True, exist_ok=True)
-        keyboard_json = json.dumps({'last_updated': current_datetime(), 'keyboards': {keyboard_name: kb_all[keyboard_name]}})
-        if not cli.args.dry_run:
-            keyboard_info.write_text(keyboard_json)
-            cli.log.debug('Wrote file %s', keyboard_info)
+    # Figure out which keyboards need to be regenerated
+    keyboards = sorted(set(cli.args.keyboard)) or list_keyboards()
+    changed_keyboards = []
 
-            if keyboard_readme_src:
-                copyfile(keyboard_readme_src, keyboard_readme)
-                cli.log.debug('Copied %s -> %s', keyboard_readme_src, keyboard_readme)
+    for keyboard_name in keyboards:
+        input_digest = _keyboard_input_digest(keyboard_name)
+        previous = manifest['keyboards'].get(keyboard_name, {})
+        keyboard_info = v1_dir / 'keyboards' / keyboard_name / 'info.json'
+        new_manifest['keyboards'][keyboard_name] = {'inputs': input_digest, 'output': previous.get('output')}
 
-        if 'usb' in kb_all[keyboard_name]:
-            usb = kb_all[keyboard_name]['usb']
+        if previous.get('inputs') != input_digest or not keyboard_info.exists():
+            changed_keyboards.append(keyboard_name)
 
-            if 'vid' in usb and usb['vid'] not in usb_list:
-                usb_list[usb['vid']] = {}
+    removed_keyboards = sorted(set(manifest['keyboards']) - set(keyboards))
+    cli.log.info('Regenerating %s of %s keyboards, removing %s.', len(changed_keyboards), len(keyboards), len(removed_keyboards))
 
-            if 'pid' in usb and usb['pid'] not in usb_list[usb['vid']]:
-                usb_list[usb['vid']][usb['pid']] = {}
+    # keyboards.json is streamed as keyboards are produced, and only when something in it may have changed
+    keyboards_writer = None
+    previous_keyboards_digest = manifest['files'].get(keyboard_all_file.name)
 
-            if 'vid' in usb and 'pid' in usb:
-                usb_list[usb['vid']][usb['pid']][keyboard_name] = usb
+    if not cli.args.dry_run and (changed_keyboards or removed_keyboards or not keyboard_all_file.exists() or not previous_keyboards_digest):
+        keyboards_writer = KeyboardsJSONWriter(keyboard_all_file, last_updated)
+
+    # Generate and write keyboard specific JSON files
+    previous_digests = {keyboard_name: keyboard['output'] for keyboard_name, keyboard in manifest['keyboards'].items()}
+    keyboards_digest, kb_timings, usb_list = _generate_keyboards(keyboards, changed_keyboards, v1_dir, last_updated, previous_digests, new_manifest, keyboards_writer, previous_keyboards_digest)
+    new_manifest['files'][keyboard_all_file.name] = keyboards_digest
+
+    if not cli.args.dry_run:
+        for keyboard_name in removed_keyboards:
+            _remove_keyboard_files(v1_dir, keyboard_name)
 
     # Generate data for the global files
-    keyboard_list = sorted(kb_all)
-    keyboard_aliases = json_load(Path('data/mappings/keyboard_aliases.json'))
-    keyboard_metadata = {
-        'last_updated': current_datetime(),
-        'keyboards': keyboard_list,
-        'keyboard_aliases': keyboard_aliases,
-        'usb': usb_list,
+    keyboard_list = {'keyboards': keyboards}
+    keyboard_aliases = {'keyboard_aliases': json_load(Path('data/mappings/keyboard_aliases.json'), cache=True)}
+    usb = {'usb': usb_list}
+    keyboard_metadata = {**keyboard_list, **keyboard_aliases, **usb}
+    global_files = {
+        usb_file: usb,
+        keyboard_list_file: keyboard_list,
+        keyboard_aliases_file: keyboard_aliases,
+        keyboard_metadata_file: keyboard_metadata,
     }
 
     # Write the global JSON files
-    keyboard_all_json = json.dumps({'last_updated': current_datetime(), 'keyboards': kb_all}, cls=InfoJSONEncoder)
-    usb_json = json.dumps({'last_updated': current_datetime(), 'usb': usb_list}, cls=InfoJSONEncoder)
-    keyboard_list_json = json.dumps({'last_updated': current_datetime(), 'keyboards': keyboard_list}, cls=InfoJSONEncoder)
-    keyboard_aliases_json = json.dumps({'last_updated': current_datetime(), 'keyboard_aliases': keyboard_aliases}, cls=InfoJSONEncoder)
-    keyboard_metadata_json = json.dumps(keyboard_metadata, cls=InfoJSONEncoder)
+    for output_file, payload in global_files.items():
+        new_manifest['files'][output_file.name] = _write_if_changed(output_file, payload, manifest['files'].get(output_file.name), last_updated, cli.args.dry_run, InfoJSONEncoder)
 
-    if not cli.args.dry_run:
-        keyboard_all_file.write_text(keyboard_all_json)
-        usb_file.write_text(usb_json)
-        keyboard_list_file.write_text(keyboard_list_json)
-        keyboard_aliases_file.write_text(keyboard_aliases_json)
-        keyboard_metadata_file.write_text(keyboard_metadata_json)
+    if use_manifest and not cli.args.dry_run:
+        API_MANIFEST_FILE.parent.mkdir(parents=True, exist_ok=True)
+        API_MANIFEST_FILE.write_text(json.dumps(new_manifest))
+
+    _report_run(kb_timings)
@@ -1,13 +1,11 @@
 """Used by the make system to generate info_config.h from info.json.
 """
-from pathlib import Path
-
-from dotty_dict import dotty
 from milc import cli
 
+from qmk.cache import disable_cache
 from qmk.decorators import automagic_keyboard, automagic_keymap
-from qmk.info import info_json
-from qmk.json_schema import json_load
+from qmk.info import INFO_JSON_CACHE, info_json
+from qmk.info_mappings import get_info_value, info_config_map
 from qmk.keyboard import keyboard_completer, keyboard_folder
 from qmk.path import is_keyboard, normpath
 
@@ -73,19 +71,46 @@ def matrix_pins(matrix_pins):
     return '\n'.join(pins)
 
 
+def build_config_h(kb_info_json):
+    """Returns the text of info_config.h for a keyboard's info.json data.
+    """
+    config_h_lines = ['/* This file was generated by `qmk generate-config-h`. Do not edit or copy.' ' */', '', '#pragma once']
+
+    # Iterate through the info_config map to generate basic things
+    for config_key, _, info_path, _, to_c, _ in info_config_map():
+        if not to_c:
+            continue
+
+        try:
+            config_value = get_info_value(kb_info_json, info_path)
+        except KeyError:
+            continue
+
+        config_h_lines.extend(to_c(config_key, config_value))
+
+    if 'matrix_pins' in kb_info_json:
+        config_h_lines.append(matrix_pins(kb_info_json['matrix_pins']))
+
+    return '\n'.join(config_h_lines)
+
+
 @cli.argument('-o', '--output', arg_only=True, type=normpath, help='File to write to')
 @cli.argument('-q', '--quiet', arg_only=True, action='store_true', help="Quiet mode, only output error messages")
 @cli.argument('-kb', '--keyboard', type=keyboard_folder, completer=keyboard_completer, help='Keyboard to generate config.h for.')
+@cli.argument('--no-cache', arg_only=True, action='store_true', help='Do not use the info.json cache.')
 @cli.subcommand('Used by the make system to generate info_config.h from info.json', hidden=True)
 @automagic_keyboard
 @automagic_keymap
 def generate_config_h(cli):
     """Generates the info_config.h file.
     """
+    if cli.args.no_cache:
+        disable_cache(INFO_JSON_CACHE)
+
     # Determine our keyboard(s)
     if not cli.config.generate_config_h.keyboard:
         cli.log.error('Missing parameter: --keyboard')
-        cli.subcommands['info'].print_help()
+        cli.subcommands['generate-config-h'].print_help()
         return False
 
     if not is_keyboard(cli.config.generate_config_h.keyboard):
@@ -93,54 +118,9 @@ def generate_config_h(cli):
         return False
 
     # Build the info_config.h file.
-    kb_info_json = dotty(info_json(cli.config.generate_config_h.keyboard))
-    info_config_map = json_load(Path('data/mappings/info_config.json'))
-
-    config_h_lines = ['/* This file was generated by `qmk generate-config-h`. Do not edit or copy.' ' */', '', '#pragma once']
-
-    # Iterate through the info_config map to generate basic things
-    for config_key, info_dict in info_config_map.items():
-        info_key = info_dict['info_key']
-        key_type = info_dict.get('value_type', 'str')
-        to_config = info_dict.get('to_config', True)
-
-        if not to_config:
-            continue
-
-        try:
-            config_value = kb_info_json[info_key]
-        except KeyError:
-            continue
-
-        if key_type.startswith('array'):
-            config_h_lines.append('')
-            config_h_lines.append(f'#ifndef {config_key}')
-            config_h_lines.append(f'#   define {config_key} {{ {", ".join(map(str, config_value))} }}')
-            config_h_lines.append(f'#endif // {config_key}')
-        elif key_type == 'bool':
-            if config_value:
-                config_h_lines.append('')
-                config_h_lines.append(f'#ifndef {config_key}')
-                config_h_lines.append(f'#   define {config_key}')
-                config_h_lines.append(f'#endif // {config_key}')
-        elif key_type == 'mapping':
-            for key, value in config_value.items():
-                config_h_lines.append('')
-                config_h_lines.append(f'#ifndef {key}')
-                config_h_lines.append(f'#   define {key} {value}')
-                config_h_lines.append(f'#endif // {key}')
-        else:
-            config_h_lines.append('')
-            config_h_lines.append(f'#ifndef {config_key}')
-            config_h_lines.append(f'#   define {config_key} {config_value}')
-            config_h_lines.append(f'#endif // {config_key}')
-
-    if 'matrix_pins' in kb_info_json:
-        config_h_lines.append(matrix_pins(kb_info_json['matrix_pins']))
+    config_h = build_config_h(info_json(cli.config.generate_config_h.keyboard))
 
     # Show the results
-    config_h = '\n'.join(config_h_lines)
-
     if cli.args.output:
         cli.args.output.parent.mkdir(parents=True, exist_ok=True)
         if cli.args.output.exists():
@@ -20,7 +20,7 @@ def generate_dfu_header(cli):
     # Determine our keyboard(s)
     if not cli.config.generate_dfu_header.keyboard:
         cli.log.error('Missing parameter: --keyboard')
-        cli.subcommands['info'].print_help()
+        cli.subcommands['generate-dfu-header'].print_help()
         return False
 
     if not is_keyboard(cli.config.generate_dfu_header.keyboard):
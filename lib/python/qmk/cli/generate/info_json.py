@@ -7,8 +7,9 @@ import json
 from jsonschema import Draft7Validator, validators
 from milc import cli
 
+from qmk.cache import disable_cache
 from qmk.decorators import automagic_keyboard, automagic_keymap
-from qmk.info import info_json
+from qmk.info import INFO_JSON_CACHE, info_json
 from qmk.json_encoders import InfoJSONEncoder
 from qmk.json_schema import load_jsonschema
 from qmk.keyboard import keyboard_completer, keyboard_folder
@@ -43,16 +44,20 @@ def strip_info_json(kb_info_json):
 
 @cli.argument('-kb', '--keyboard', type=keyboard_folder, completer=keyboard_completer, help='Keyboard to show info for.')
 @cli.argument('-km', '--keymap', help='Show the layers for a JSON keymap too.')
+@cli.argument('--no-cache', arg_only=True, action='store_true', help='Do not use the info.json cache.')
 @cli.subcommand('Generate an info.json file for a keyboard.', hidden=False if cli.config.user.developer else True)
 @automagic_keyboard
 @automagic_keymap
 def generate_info_json(cli):
     """Generate an info.json file for a keyboard
     """
+    if cli.args.no_cache:
+        disable_cache(INFO_JSON_CACHE)
+
     # Determine our keyboard(s)
     if not cli.config.generate_info_json.keyboard:
         cli.log.error('Missing parameter: --keyboard')
-        cli.subcommands['info'].print_help()
+        cli.subcommands['generate-info-json'].print_help()
         return False
 
     if not is_keyboard(cli.config.generate_info_json.keyboard):
@@ -2,24 +2,22 @@
 """
 from milc import cli
 
+from qmk.cache import disable_cache
 from qmk.decorators import automagic_keyboard, automagic_keymap
-from qmk.info import info_json
+from qmk.info import INFO_JSON_CACHE, info_json
 from qmk.keyboard import keyboard_completer, keyboard_folder
 from qmk.path import normpath
 
 
-def would_populate_layout_h(keyboard):
+def would_populate_layout_h(kb_info_json):
     """Detect if a given keyboard is doing data driven layouts
     """
-    # Build the info.json file
-    kb_info_json = info_json(keyboard)
-
     for layout_name in kb_info_json['layouts']:
         if kb_info_json['layouts'][layout_name]['c_macro']:
             continue
 
         if 'matrix' not in kb_info_json['layouts'][layout_name]['layout'][0]:
-            cli.log.debug('%s/%s: No matrix data!', keyboard, layout_name)
+            cli.log.debug('%s/%s: No matrix data!', kb_info_json['keyboard_folder'], layout_name)
             continue
 
         return True
@@ -27,26 +25,34 @@ def would_populate_layout_h(keyboard):
     return False
 
 
+def build_keyboard_h(kb_info_json):
+    """Returns the text of default_keyboard.h for a keyboard's info.json data.
+    """
+    keyboard_h_lines = ['/* This file was generated by `qmk generate-keyboard-h`. Do not edit or copy.' ' */', '', '#pragma once', '#include "quantum.h"']
+
+    if not would_populate_layout_h(kb_info_json):
+        keyboard_h_lines.append('#pragma error("<keyboard>.h is only optional for data driven keyboards - kb.h == bad times")')
+
+    return '\n'.join(keyboard_h_lines) + '\n'
+
+
 @cli.argument('-o', '--output', arg_only=True, type=normpath, help='File to write to')
 @cli.argument('-q', '--quiet', arg_only=True, action='store_true', help="Quiet mode, only output error messages")
 @cli.argument('-kb', '--keyboard', type=keyboard_folder, completer=keyboard_completer, required=True, help='Keyboard to generate keyboard.h for.')
+@cli.argument('--no-cache', arg_only=True, action='store_true', help='Do not use the info.json cache.')
 @cli.subcommand('Used by the make system to generate keyboard.h from info.json', hidden=True)
 @automagic_keyboard
 @automagic_keymap
 def generate_keyboard_h(cli):
     """Generates the keyboard.h file.
     """
-    has_layout_h = would_populate_layout_h(cli.config.generate_keyboard_h.keyboard)
-
-    # Build the layouts.h file.
-    keyboard_h_lines = ['/* This file was generated by `qmk generate-keyboard-h`. Do not edit or copy.' ' */', '', '#pragma once', '#include "quantum.h"']
+    if cli.args.no_cache:
+        disable_cache(INFO_JSON_CACHE)
 
-    if not has_layout_h:
-        keyboard_h_lines.append('#pragma error("<keyboard>.h is only optional for data driven keyboards - kb.h == bad times")')
+    # Build the keyboard.h file.
+    keyboard_h = build_keyboard_h(info_json(cli.config.generate_keyboard_h.keyboard))
 
     # Show the results
-    keyboard_h = '\n'.join(keyboard_h_lines) + '\n'
-
     if cli.args.output:
         cli.args.output.parent.mkdir(parents=True, exist_ok=True)
         if cli.args.output.exists():
@@ -2,9 +2,10 @@
 """
 from milc import cli
 
+from qmk.cache import disable_cache
 from qmk.constants import COL_LETTERS, ROW_LETTERS
 from qmk.decorators import automagic_keyboard, automagic_keymap
-from qmk.info import info_json
+from qmk.info import INFO_JSON_CACHE, info_json
 from qmk.keyboard import keyboard_completer, keyboard_folder
 from qmk.path import is_keyboard, normpath
 
@@ -15,29 +16,12 @@ usb_properties = {
 }
 
 
-@cli.argument('-o', '--output', arg_only=True, type=normpath, help='File to write to')
-@cli.argument('-q', '--quiet', arg_only=True, action='store_true', help="Quiet mode, only output error messages")
-@cli.argument('-kb', '--keyboard', type=keyboard_folder, completer=keyboard_completer, help='Keyboard to generate config.h for.')
-@cli.subcommand('Used by the make system to generate layouts.h from info.json', hidden=True)
-@automagic_keyboard
-@automagic_keymap
-def generate_layouts(cli):
-    """Generates the layouts.h file.
-    """
-    # Determine our keyboard(s)
-    if not cli.config.generate_layouts.keyboard:
-        cli.log.error('Missing parameter: --keyboard')
-        cli.subcommands['info'].print_help()
-        return False
-
-    if not is_keyboard(cli.config.generate_layouts.keyboard):
-        cli.log.error('Invalid keyboard: "%s"', cli.config.generate_layouts.keyboard)
-        return False
-
-    # Build the info.json file
-    kb_info_json = info_json(cli.config.generate_layouts.keyboard)
+def build_layouts_h(kb_info_json):
+    """Returns the text of layouts.h for a keyboard's info.json data.
 
-    # Build the layouts.h file.
+    Returns None if the layout data could not be turned into C macros.
+    """
+    keyboard = kb_info_json['keyboard_folder']
     layouts_h_lines = ['/* This file was generated by `qmk generate-layouts`. Do not edit or copy.' ' */', '', '#pragma once']
 
     if 'matrix_pins' in kb_info_json:
@@ -48,15 +32,15 @@ def generate_layouts(cli):
             col_num = len(kb_info_json['matrix_pins']['cols'])
             row_num = len(kb_info_json['matrix_pins']['rows'])
         else:
-            cli.log.error('%s: Invalid matrix config.', cli.config.generate_layouts.keyboard)
-            return False
+            cli.log.error('%s: Invalid matrix config.', keyboard)
+            return None
 
     for layout_name in kb_info_json['layouts']:
         if kb_info_json['layouts'][layout_name]['c_macro']:
             continue
 
         if 'matrix' not in kb_info_json['layouts'][layout_name]['layout'][0]:
-            cli.log.debug('%s/%s: No matrix data!', cli.config.generate_layouts.keyboard, layout_name)
+            cli.log.debug('%s/%s: No matrix data!', keyboard, layout_name)
             continue
 
         layout_keys = []
@@ -73,7 +57,7 @@ def generate_layouts(cli):
             except IndexError:
                 key_name = key.get('label', identifier)
                 cli.log.error('Matrix data out of bounds for layout %s at index %s (%s): %s, %s', layout_name, i, key_name, row, col)
-                return False
+                return None
 
         layouts_h_lines.append('')
         layouts_h_lines.append('#define %s(%s) {\\' % (layout_name, ', '.join(layout_keys)))
@@ -89,9 +73,39 @@ def generate_layouts(cli):
         layouts_h_lines.append(f'#   define {alias} {target}')
         layouts_h_lines.append('#endif')
 
-    # Show the results
-    layouts_h = '\n'.join(layouts_h_lines) + '\n'
+    return '\n'.join(layouts_h_lines) + '\n'
+
+
+@cli.argument('-o', '--output', arg_only=True, type=normpath, help='File to write to')
+@cli.argument('-q', '--quiet', arg_only=True, action='store_true', help="Quiet mode, only output error messages")
+@cli.argument('-kb', '--keyboard', type=keyboard_folder, completer=keyboard_completer, help='Keyboard to generate config.h for.')
+@cli.argument('--no-cache', arg_only=True, action='store_true', help='Do not use the info.json cache.')
+@cli.subcommand('Used by the make system to generate layouts.h from info.json', hidden=True)
+@automagic_keyboard
+@automagic_keymap
+def generate_layouts(cli):
+    """Generates the layouts.h file.
+    """
+    if cli.args.no_cache:
+        disable_cache(INFO_JSON_CACHE)
 
+    # Determine our keyboard(s)
+    if not cli.config.generate_layouts.keyboard:
+        cli.log.error('Missing parameter: --keyboard')
+        cli.subcommands['generate-layouts'].print_help()
+        return False
+
+    if not is_keyboard(cli.config.generate_layouts.keyboard):
+        cli.log.error('Invalid keyboard: "%s"', cli.config.generate_layouts.keyboard)
+        return False
+
+    # Build the layouts.h file.
+    layouts_h = build_layouts_h(info_json(cli.config.generate_layouts.keyboard))
+
+    if layouts_h is None:
+        return False
+
+    # Show the results
     if cli.args.output:
         cli.args.output.parent.mkdir(parents=True, exist_ok=True)
         if cli.args.output.exists():
@@ -1,84 +1,74 @@
 """Used by the make system to generate a rules.mk
 """
-from pathlib import Path
-
-from dotty_dict import dotty
 from milc import cli
 
+from qmk.cache import disable_cache
 from qmk.decorators import automagic_keyboard, automagic_keymap
-from qmk.info import info_json
-from qmk.json_schema import json_load
+from qmk.info import INFO_JSON_CACHE, info_json
+from qmk.info_mappings import get_info_value, info_rules_map
 from qmk.keyboard import keyboard_completer, keyboard_folder
 from qmk.path import is_keyboard, normpath
 
 
-def process_mapping_rule(kb_info_json, rules_key, info_dict):
-    """Return the rules.mk line(s) for a mapping rule.
+def build_rules_mk(kb_info_json):
+    """Returns the text of the generated rules.mk for a keyboard's info.json data.
     """
-    if not info_dict.get('to_c', True):
-        return None
+    rules_mk_lines = ['# This file was generated by `qmk generate-rules-mk`. Do not edit or copy.', '']
 
-    info_key = info_dict['info_key']
-    key_type = info_dict.get('value_type', 'str')
+    # Iterate through the info_rules map to generate basic rules
+    for rules_key, _, info_path, _, to_c, _ in info_rules_map():
+        if not to_c:
+            continue
 
-    try:
-        rules_value = kb_info_json[info_key]
-    except KeyError:
-        return None
+        try:
+            rules_value = get_info_value(kb_info_json, info_path)
+        except KeyError:
+            continue
 
-    if key_type == 'array':
-        return f'{rules_key} ?= {" ".join(rules_value)}'
-    elif key_type == 'bool':
-        return f'{rules_key} ?= {"on" if rules_value else "off"}'
-    elif key_type == 'mapping':
-        return '\n'.join([f'{key} ?= {value}' for key, value in rules_value.items()])
+        new_entry = to_c(rules_key, rules_value)
 
-    return f'{rules_key} ?= {rules_value}'
+        if new_entry:
+            rules_mk_lines.append(new_entry)
+
+    # Iterate through features to enable/disable them
+    if 'features' in kb_info_json:
+        for feature, enabled in kb_info_json['features'].items():
+            if feature == 'bootmagic_lite' and enabled:
+                rules_mk_lines.append('BOOTMAGIC_ENABLE ?= lite')
+            else:
+                feature = feature.upper()
+                enabled = 'yes' if enabled else 'no'
+                rules_mk_lines.append(f'{feature}_ENABLE ?= {enabled}')
+
+    return '\n'.join(rules_mk_lines) + '\n'
 
 
 @cli.argument('-o', '--output', arg_only=True, type=normpath, help='File to write to')
 @cli.argument('-q', '--quiet', arg_only=True, action='store_true', help="Quiet mode, only output error messages")
 @cli.argument('-e', '--escape', arg_only=True, action='store_true', help="Escape spaces in quiet mode")
 @cli.argument('-kb', '--keyboard', type=keyboard_folder, completer=keyboard_completer, help='Keyboard to generate config.h for.')
+@cli.argument('--no-cache', arg_only=True, action='store_true', help='Do not use the info.json cache.')
 @cli.subcommand('Used by the make system to generate info_config.h from info.json', hidden=True)
 @automagic_keyboard
 @automagic_keymap
 def generate_rules_mk(cli):
     """Generates a rules.mk file from info.json.
     """
+    if cli.args.no_cache:
+        disable_cache(INFO_JSON_CACHE)
+
     if not cli.config.generate_rules_mk.keyboard:
         cli.log.error('Missing parameter: --keyboard')
-        cli.subcommands['info'].print_help()
+        cli.subcommands['generate-rules-mk'].print_help()
         return False
 
     if not is_keyboard(cli.config.generate_rules_mk.keyboard):
         cli.log.error('Invalid keyboard: "%s"', cli.config.generate_rules_mk.keyboard)
         return False
 
-    kb_info_json = dotty(info_json(cli.config.generate_rules_mk.keyboard))
-    info_rules_map = json_load(Path('data/mappings/info_rules.json'))
-    rules_mk_lines = ['# This file was generated by `qmk generate-rules-mk`. Do not edit or copy.', '']
-
-    # Iterate through the info_rules map to generate basic rules
-    for rules_key, info_dict in info_rules_map.items():
-        new_entry = process_mapping_rule(kb_info_json, rules_key, info_dict)
-
-        if new_entry:
-            rules_mk_lines.append(new_entry)
-
-    # Iterate through features to enable/disable them
-    if 'features' in kb_info_json:
-        for feature, enabled in kb_info_json['features'].items():
-            if feature == 'bootmagic_lite' and enabled:
-                rules_mk_lines.append('BOOTMAGIC_ENABLE ?= lite')
-            else:
-                feature = feature.upper()
-                enabled = 'yes' if enabled else 'no'
-                rules_mk_lines.append(f'{feature}_ENABLE ?= {enabled}')
+    rules_mk = build_rules_mk(info_json(cli.config.generate_rules_mk.keyboard))
 
     # Show the results
-    rules_mk = '\n'.join(rules_mk_lines) + '\n'
-
     if cli.args.output:
         cli.args.output.parent.mkdir(parents=True, exist_ok=True)
         if cli.args.output.exists():
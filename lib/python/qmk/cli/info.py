@@ -7,12 +7,13 @@ import json
 
 from milc import cli
 
+from qmk.cache import disable_cache
 from qmk.json_encoders import InfoJSONEncoder
 from qmk.constants import COL_LETTERS, ROW_LETTERS
 from qmk.decorators import automagic_keyboard, automagic_keymap
 from qmk.keyboard import keyboard_completer, keyboard_folder, render_layouts, render_layout, rules_mk
 from qmk.keymap import locate_keymap
-from qmk.info import info_json
+from qmk.info import INFO_JSON_CACHE, info_json
 from qmk.path import is_keyboard
 
 UNICODE_SUPPORT = sys.stdout.encoding.lower().startswith('utf')
@@ -138,12 +139,16 @@ def print_parsed_rules_mk(keyboard_name):
 @cli.argument('-f', '--format', default='friendly', arg_only=True, help='Format to display the data in (friendly, text, json) (Default: friendly).')
 @cli.argument('--ascii', action='store_true', default=not UNICODE_SUPPORT, help='Render layout box drawings in ASCII only.')
 @cli.argument('-r', '--rules-mk', action='store_true', help='Render the parsed values of the keyboard\'s rules.mk file.')
+@cli.argument('--no-cache', arg_only=True, action='store_true', help='Do not use the info.json cache.')
 @cli.subcommand('Keyboard information.')
 @automagic_keyboard
 @automagic_keymap
 def info(cli):
     """Compile an info.json for a particular keyboard and pretty-print it.
     """
+    if cli.args.no_cache:
+        disable_cache(INFO_JSON_CACHE)
+
     # Determine our keyboard(s)
     if not cli.config.info.keyboard:
         cli.log.error('Missing parameter: --keyboard')
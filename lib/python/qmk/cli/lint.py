@@ -2,8 +2,9 @@
 """
 from milc import cli
 
+from qmk.cache import disable_cache
 from qmk.decorators import automagic_keyboard, automagic_keymap
-from qmk.info import info_json
+from qmk.info import INFO_JSON_CACHE, info_json
 from qmk.keyboard import keyboard_completer
 from qmk.keymap import locate_keymap
 from qmk.path import is_keyboard, keyboard
@@ -12,12 +13,16 @@ from qmk.path import is_keyboard, keyboard
 @cli.argument('--strict', action='store_true', help='Treat warnings as errors.')
 @cli.argument('-kb', '--keyboard', completer=keyboard_completer, help='The keyboard to check.')
 @cli.argument('-km', '--keymap', help='The keymap to check.')
+@cli.argument('--no-cache', arg_only=True, action='store_true', help='Do not use the info.json cache.')
 @cli.subcommand('Check keyboard and keymap for common mistakes.')
 @automagic_keyboard
 @automagic_keymap
 def lint(cli):
     """Check keyboard and keymap for common mistakes.
     """
+    if cli.args.no_cache:
+        disable_cache(INFO_JSON_CACHE)
+
     if not cli.config.lint.keyboard:
         cli.log.error('Missing required argument: --keyboard')
         cli.print_help()
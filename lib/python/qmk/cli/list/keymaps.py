@@ -1,17 +1,40 @@
 """List the keymaps for a specific keyboard
 """
+import json
+
 from milc import cli
 
 import qmk.keymap
 from qmk.decorators import automagic_keyboard
-from qmk.keyboard import keyboard_completer, keyboard_folder
+from qmk.keyboard import keyboard_completer, keyboard_folder, list_keyboards
+from qmk.keymap_index import keymap_index
+
+
+def _keymap_records():
+    """Yields a record for every keyboard:keymap pair, with the type, files and community layout of the keymap directory it is built from.
+    """
+    keymaps = keymap_index()['keymaps']
+
+    for keyboard in list_keyboards():
+        for name in qmk.keymap.list_keymaps(keyboard):
+            keymap_dir = qmk.keymap.locate_keymap(keyboard, name).parent.as_posix()
+            keymap = keymaps.get(keymap_dir, {})
+
+            yield {'keyboard': keyboard, 'keymap': name, 'path': keymap_dir, 'type': keymap.get('type'), 'files': keymap.get('files'), 'layout': keymap.get('layout')}
 
 
 @cli.argument("-kb", "--keyboard", type=keyboard_folder, completer=keyboard_completer, help="Specify keyboard name. Example: 1upkeyboards/1up60hse")
+@cli.argument("-a", "--all", arg_only=True, action="store_true", help="List the keymaps for every keyboard, as one JSON record per keyboard:keymap pair")
 @cli.subcommand("List the keymaps for a specific keyboard")
 @automagic_keyboard
 def list_keymaps(cli):
     """List the keymaps for a specific keyboard
     """
+    if cli.args.all:
+        for record in _keymap_records():
+            print(json.dumps(record))
+
+        return
+
     for name in qmk.keymap.list_keymaps(cli.config.list_keymaps.keyboard):
         print(name)
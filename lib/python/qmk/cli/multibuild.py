@@ -2,25 +2,30 @@
 
 This will compile everything in parallel, for testing purposes.
 """
+import json
 import os
-import re
 from pathlib import Path
 from subprocess import DEVNULL
+from time import perf_counter, time
 
 from milc import cli
 
+from qmk.build_cache import FIRMWARE_CACHE, cached_build, evict_firmware_cache, firmware_file, firmware_fingerprint, restore_firmware, store_build
+from qmk.build_plan import longest_first, plan_digest, predict_durations, predict_schedule, shard_targets
+from qmk.build_history import BUILD_HISTORY_FILE, flaky_targets, load_build_history, parse_build_log, record_builds, regressed_targets, slowest_targets
+from qmk.cache import cache_enabled, cache_stats_message, disable_cache
 from qmk.constants import QMK_FIRMWARE
 from qmk.commands import _find_make
+from qmk.datetime import current_datetime
+from qmk.errors import FilterSyntaxError
+from qmk.keyboard_attributes import keyboard_attributes
+from qmk.keyboard_filter import parse_filter
 import qmk.keyboard
 import qmk.keymap
+import qmk.path
 
-
-def _make_rules_mk_filter(key, value):
-    def _rules_mk_filter(keyboard_name):
-        rules_mk = qmk.keyboard.rules_mk(keyboard_name)
-        return True if key in rules_mk and rules_mk[key].lower() == str(value).lower() else False
-
-    return _rules_mk_filter
+# How many targets to show in each section of `--report`
+REPORT_TARGET_COUNT = 10
 
 
 def _is_split(keyboard_name):
@@ -28,14 +33,235 @@ def _is_split(keyboard_name):
     return True if 'SPLIT_KEYBOARD' in rules_mk and rules_mk['SPLIT_KEYBOARD'].lower() == 'yes' else False
 
 
+def _shard(shard):
+    """Returns `(index, count)` for a shard given as `INDEX/COUNT`, where INDEX counts from 1.
+    """
+    index, count = (int(number) for number in shard.split('/'))
+
+    if not 1 <= index <= count:
+        raise ValueError(f'Shard {shard} does not exist.')
+
+    return index, count
+
+
+def _filtered_keyboards(filters):
+    """Returns the sorted keyboards whose attributes match every filter.
+
+    Raises FilterSyntaxError if a filter can not be parsed.
+    """
+    keyboard_list = qmk.keyboard.list_keyboards()
+
+    if filters:
+        matchers = [parse_filter(filter_txt) for filter_txt in filters]
+        attributes = keyboard_attributes()
+        keyboard_list = [keyboard for keyboard in keyboard_list if keyboard in attributes and all(matches(attributes[keyboard]) for matches in matchers)]
+
+    return list(sorted(keyboard_list))
+
+
+def _plan_targets(targets, shard):
+    """Returns the targets of this run, and a dictionary of the predicted duration of every target.
+
+    When `shard` is given as `(index, count)`, only the targets of that shard are returned.
+    """
+    durations = predict_durations(targets, load_build_history())
+
+    if shard:
+        index, count = shard
+        targets = shard_targets(durations, count)[index - 1]
+        cli.log.info('Building shard %d of %d: %d targets, %.1f minutes of predicted build time.', index, count, len(targets), sum(durations[target] for target in targets) / 60)
+
+    return targets, durations
+
+
+def _target_safe(keyboard_name, keymap):
+    """Returns the name of the make rule and temporary files of a target.
+    """
+    return f'{keyboard_name.replace("/", "_")}_{keymap}'
+
+
+def _keymap_files(keyboard_list, keymaps, community):
+    """Returns a dictionary mapping each `(keyboard, keymap)` target to its keymap file.
+
+    `keymaps` is a comma separated list of keymap names and globs, which is matched against the keymaps in the keymap index.
+    """
+    patterns = [pattern.strip() for pattern in keymaps.split(',') if pattern.strip()]
+    keymap_files = {}
+
+    for keyboard_name in keyboard_list:
+        for keymap, keymap_file in qmk.keymap.locate_keymaps(keyboard_name, patterns, community).items():
+            keymap_files[keyboard_name, keymap] = keymap_file
+
+    return keymap_files
+
+
+def _collect_build(builddir, run, keyboard_name, keymap):
+    """Returns the build history entry for a target built by the generated makefile, or None if it did not finish.
+
+    A build finished when the makefile recorded the exit status of make for it. Builds that were interrupted, either before make exited or by a signal that killed make, have no result worth recording or caching. The build log and the files the makefile leaves behind for it are removed.
+    """
+    target_safe = _target_safe(keyboard_name, keymap)
+    build_log = builddir / f'build.log.{os.getpid()}.{target_safe}'
+    start_file = builddir / f'build.start.{os.getpid()}.{target_safe}'
+    returncode_file = builddir / f'build.returncode.{os.getpid()}.{target_safe}'
+    build = None
+
+    try:
+        returncode = int(returncode_file.read_text().strip())
+        start_time = start_file.stat().st_mtime
+        end_time = build_log.stat().st_mtime
+
+        # Shells report a command killed by a signal as 128 + the signal number
+        if returncode <= 128:
+            build = {'run': run, 'keyboard': keyboard_name, 'keymap': keymap, 'start': round(start_time, 3), 'seconds': round(end_time - start_time, 3), 'returncode': returncode}
+            build.update(parse_build_log(build_log.read_text(encoding='utf-8', errors='replace')))
+
+    except (OSError, ValueError):
+        pass
+
+    for leftover_file in build_log, start_file, returncode_file:
+        if leftover_file.exists():
+            leftover_file.unlink()
+
+    return build
+
+
+def _use_cached_builds(builddir, run, fingerprints):
+    """Report the cached results of targets whose inputs have not changed, and put their firmware where a build would have.
+
+    Returns the cached builds. A failed cached build leaves a failed log behind, just like a failed build.
+    """
+    builds = []
+
+    for (keyboard_name, keymap), fingerprint in fingerprints.items():
+        build = cached_build(fingerprint)
+
+        if not build or not restore_firmware(fingerprint, build, keyboard_name, keymap):
+            continue
+
+        if build['returncode'] != 0:
+            (builddir / f'failed.log.{os.getpid()}.{_target_safe(keyboard_name, keymap)}').write_text(build['log'] or '', encoding='utf-8')
+
+        if build['returncode'] != 0 or build['errors']:
+            status = '{fg_red}[ERRORS]'
+        elif build['warnings']:
+            status = '{fg_yellow}[WARNINGS]'
+        else:
+            status = '{fg_green}[OK]'
+
+        cli.echo(f'Build %-64s {{style_bright}}{status}{{style_reset_all}} (cached)', f'{keyboard_name}:{keymap}')
+        build = {key: value for key, value in build.items() if key not in ('artifact', 'log')}
+        builds.append({**build, 'run': run, 'keyboard': keyboard_name, 'keymap': keymap, 'start': round(time(), 3), 'seconds': 0.0, 'cached': True})
+
+    return builds
+
+
+def _store_builds(builddir, builds, fingerprints):
+    """Add the results of the targets that were just built to the firmware cache.
+
+    Only builds that finished are passed in, see `_collect_build()`.
+    """
+    for build in builds:
+        fingerprint = fingerprints[build['keyboard'], build['keymap']]
+
+        if build['returncode'] == 0:
+            firmware = firmware_file(build['keyboard'], build['keymap'], since=build['start'])
+
+            # A cache hit must be able to put the firmware back, so a success without one is not cached
+            if firmware:
+                store_build(fingerprint, build, firmware)
+
+        else:
+            failed_log = builddir / f'failed.log.{os.getpid()}.{_target_safe(build["keyboard"], build["keymap"])}'
+            store_build(fingerprint, build, build_log=failed_log.read_text(encoding='utf-8', errors='replace') if failed_log.exists() else None)
+
+    evicted = evict_firmware_cache(cli.args.cache_size * 1024 * 1024)
+
+    if evicted:
+        cli.log.info('Evicted %d results from the firmware cache.', evicted)
+
+
+def _write_results(results_file, shard, durations, builds):
+    """Write the builds of this run to `results_file`, tagged with the shard they belong to, for `qmk multibuild-merge`.
+
+    The first line describes the plan the shard was taken from- how many targets there are in all shards and a digest of their predicted durations- so that `qmk multibuild-merge` can check that every shard was split from the same plan and that no target is missing. Does nothing if `results_file` is None.
+    """
+    if not results_file:
+        return
+
+    shard = '%d/%d' % shard if shard else None
+    plan = {'shard': shard, 'targets': len(durations), 'plan': plan_digest(durations)}
+    results_file.parent.mkdir(parents=True, exist_ok=True)
+    results_file.write_text(''.join(json.dumps(record) + '\n' for record in [plan, *({**build, 'shard': shard} for build in builds)]), encoding='utf-8')
+
+
+def _print_report():
+    """Show the slowest, most regressed and flakiest targets of the recorded runs.
+    """
+    history = load_build_history()
+
+    if not history:
+        cli.log.info('No builds have been recorded in %s yet.', BUILD_HISTORY_FILE)
+        return
+
+    cli.log.info('%d builds recorded over %d runs in %s.', len(history), len({build['run'] for build in history}), BUILD_HISTORY_FILE)
+
+    cli.log.info('{fg_cyan}Slowest targets:')
+    for (keyboard_name, keymap), seconds, builds in slowest_targets(history, REPORT_TARGET_COUNT):
+        cli.log.info('    %-64s %8.1f seconds (median of %d)', f'{keyboard_name}:{keymap}', seconds, builds)
+
+    cli.log.info('{fg_cyan}Most regressed targets:')
+    for (keyboard_name, keymap), before, seconds in regressed_targets(history, REPORT_TARGET_COUNT):
+        cli.log.info('    %-64s %8.1f seconds, up from %.1f', f'{keyboard_name}:{keymap}', seconds, before)
+
+    cli.log.info('{fg_cyan}Flakiest targets:')
+    for (keyboard_name, keymap), changes, failures, builds in flaky_targets(history, REPORT_TARGET_COUNT):
+        cli.log.info('    %-64s %d result changes, failed %d of %d builds', f'{keyboard_name}:{keymap}', changes, failures, builds)
+
+
+def _print_critical_path(durations, targets):
+    """Show the predicted wall time of a run and the targets that determine it.
+    """
+    wall_time, critical_path = predict_schedule(durations, targets, cli.args.parallel)
+
+    cli.log.info('Predicted %.1f minutes for %d targets on %d jobs. Critical path:', wall_time / 60, len(targets), cli.args.parallel)
+
+    for keyboard_name, keymap in critical_path:
+        cli.log.info('    %-64s %8.1f seconds', f'{keyboard_name}:{keymap}', durations[keyboard_name, keymap])
+
+
+def _print_utilization(builds, wall_time):
+    """Show how much of the available job time was spent building targets.
+    """
+    build_time = sum(build['seconds'] for build in builds)
+    utilization = build_time / (wall_time * cli.args.parallel) if wall_time else 0
+
+    cli.log.info('Built %d targets in %.1f minutes, %.1f minutes of builds on %d jobs: %.0f%% utilization.', len(builds), wall_time / 60, build_time / 60, cli.args.parallel, 100 * utilization)
+
+
 @cli.argument('-j', '--parallel', type=int, default=1, help="Set the number of parallel make jobs to run.")
 @cli.argument('-c', '--clean', arg_only=True, action='store_true', help="Remove object files before compiling.")
-@cli.argument('-f', '--filter', arg_only=True, action='append', default=[], help="Filter the list of keyboards based on the supplied value in rules.mk. Supported format is 'SPLIT_KEYBOARD=yes'. May be passed multiple times.")
-@cli.argument('-km', '--keymap', type=str, default='default', help="The keymap name to build. Default is 'default'.")
+@cli.argument('-f', '--filter', arg_only=True, action='append', default=[], help="Filter the keyboards by their rules.mk, config.h and info.json values, eg 'MCU in (STM32F303, RP2040) and features.rgb_matrix'. May be passed multiple times.")
+@cli.argument('-km', '--keymap', type=str, default='default', help="The keymaps to build, as a comma separated list of names and globs, eg 'default,via' or '*'. Default is 'default'.")
+@cli.argument('--community', arg_only=True, action='store_true', help="Also build the community layout keymaps matched by a glob in --keymap.")
+@cli.argument('--shard', arg_only=True, type=_shard, help="Only build shard INDEX of COUNT, eg '2/4'. Shards are balanced by predicted build time, so give every node the same build history.")
+@cli.argument('--results', arg_only=True, type=qmk.path.normpath, help="Also write the results of this run to a file, for 'qmk multibuild-merge'.")
+@cli.argument('--no-cache', arg_only=True, action='store_true', help="Build every target, even when its inputs have not changed since a cached build.")
+@cli.argument('--cache-size', type=int, default=256, help="The size in MB the firmware cache is trimmed to after each run. Default is 256.")
+@cli.argument('--timing', arg_only=True, action='store_true', help="Show the predicted critical path before building, and how busy the parallel jobs were afterwards.")
+@cli.argument('--report', arg_only=True, action='store_true', help="Show the slowest, most regressed and flakiest targets of previous runs instead of building.")
 @cli.subcommand('Compile QMK Firmware for all keyboards.', hidden=False if cli.config.user.developer else True)
 def multibuild(cli):
     """Compile QMK Firmware against all keyboards.
+
+    `--keymap` takes a list of keymap names and globs, and every matching keymap of every keyboard is built by the same parallel make run. Targets are started longest first, using durations predicted from previous runs, so that slow builds do not extend the end of the run. Targets whose inputs have not changed since they were last built are not built again, and their cached result is reported instead. The duration, result, warning and error counts and firmware size of every target are recorded in `.build/multibuild_history.jsonl`.
     """
+    if cli.args.report:
+        _print_report()
+        return
+
+    if cli.args.no_cache:
+        disable_cache(FIRMWARE_CACHE)
 
     make_cmd = _find_make()
     if cli.args.clean:
@@ -44,43 +270,84 @@ def multibuild(cli):
     builddir = Path(QMK_FIRMWARE) / '.build'
     makefile = builddir / 'parallel_kb_builds.mk'
 
-    keyboard_list = qmk.keyboard.list_keyboards()
-
-    filter_re = re.compile(r'^(?P<key>[A-Z0-9_]+)\s*=\s*(?P<value>[^#]+)$')
-    for filter_txt in cli.args.filter:
-        f = filter_re.match(filter_txt)
-        if f is not None:
-            keyboard_list = filter(_make_rules_mk_filter(f.group('key'), f.group('value')), keyboard_list)
+    try:
+        keyboard_list = _filtered_keyboards(cli.args.filter)
 
-    keyboard_list = list(sorted(keyboard_list))
+    except FilterSyntaxError as e:
+        cli.log.error(e.message)
+        return False
 
     if len(keyboard_list) == 0:
         return
 
+    run = f'{current_datetime()} {os.getpid()}'
+    keymap_files = _keymap_files(keyboard_list, cli.args.keymap, cli.args.community)
+    targets, durations = _plan_targets(list(keymap_files), cli.args.shard)
+
+    # Written again once the builds are done. Until then a merge reports this shard's targets as missing.
+    _write_results(cli.args.results, cli.args.shard, durations, [])
+
+    if not targets:
+        return
+
     builddir.mkdir(parents=True, exist_ok=True)
+    fingerprints = {}
+    cached_builds = []
+
+    if cache_enabled(FIRMWARE_CACHE):
+        fingerprints = {target: firmware_fingerprint(*target, Path(keymap_files[target]).parent) for target in targets}
+        cached_builds = _use_cached_builds(builddir, run, fingerprints)
+        cached_targets = {(build['keyboard'], build['keymap']) for build in cached_builds}
+        targets = [target for target in targets if target not in cached_targets]
+
+    # make starts the prerequisites of `all` in the order they are listed
+    targets = longest_first({target: durations[target] for target in targets})
+
+    if cli.args.timing and targets:
+        _print_critical_path(durations, targets)
+
     with open(makefile, "w") as f:
-        for keyboard_name in keyboard_list:
-            if qmk.keymap.locate_keymap(keyboard_name, cli.args.keymap) is not None:
-                keyboard_safe = keyboard_name.replace('/', '_')
-                # yapf: disable
-                f.write(
-                    f"""\
-all: {keyboard_safe}_binary
-{keyboard_safe}_binary:
-	@rm -f "{QMK_FIRMWARE}/.build/failed.log.{keyboard_safe}" || true
-	+@$(MAKE) -C "{QMK_FIRMWARE}" -f "{QMK_FIRMWARE}/build_keyboard.mk" KEYBOARD="{keyboard_name}" KEYMAP="{cli.args.keymap}" REQUIRE_PLATFORM_KEY= COLOR=true SILENT=false \\
-		>>"{QMK_FIRMWARE}/.build/build.log.{os.getpid()}.{keyboard_safe}" 2>&1 \\
-		|| cp "{QMK_FIRMWARE}/.build/build.log.{os.getpid()}.{keyboard_safe}" "{QMK_FIRMWARE}/.build/failed.log.{os.getpid()}.{keyboard_safe}"
-	@{{ grep '\[ERRORS\]' "{QMK_FIRMWARE}/.build/build.log.{os.getpid()}.{keyboard_safe}" >/dev/null 2>&1 && printf "Build %-64s \e[1;31m[ERRORS]\e[0m\\n" "{keyboard_name}:{cli.args.keymap}" ; }} \\
-		|| {{ grep '\[WARNINGS\]' "{QMK_FIRMWARE}/.build/build.log.{os.getpid()}.{keyboard_safe}" >/dev/null 2>&1 && printf "Build %-64s \e[1;33m[WARNINGS]\e[0m\\n" "{keyboard_name}:{cli.args.keymap}" ; }} \\
-		|| printf "Build %-64s \e[1;32m[OK]\e[0m\\n" "{keyboard_name}:{cli.args.keymap}"
-	@rm -f "{QMK_FIRMWARE}/.build/build.log.{os.getpid()}.{keyboard_safe}" || true
+        for keyboard_name, keymap in targets:
+            target_safe = _target_safe(keyboard_name, keymap)
+            # yapf: disable
+            f.write(
+                f"""\
+all: {target_safe}_binary
+{target_safe}_binary:
+	@rm -f "{QMK_FIRMWARE}/.build/failed.log.{target_safe}" || true
+	@touch "{QMK_FIRMWARE}/.build/build.start.{os.getpid()}.{target_safe}"
+	+@$(MAKE) -C "{QMK_FIRMWARE}" -f "{QMK_FIRMWARE}/build_keyboard.mk" KEYBOARD="{keyboard_name}" KEYMAP="{keymap}" REQUIRE_PLATFORM_KEY= COLOR=true SILENT=false \\
+		>>"{QMK_FIRMWARE}/.build/build.log.{os.getpid()}.{target_safe}" 2>&1 ; \\
+		status=$$? ; echo $$status >"{QMK_FIRMWARE}/.build/build.returncode.{os.getpid()}.{target_safe}" ; \\
+		[ $$status -eq 0 ] || cp "{QMK_FIRMWARE}/.build/build.log.{os.getpid()}.{target_safe}" "{QMK_FIRMWARE}/.build/failed.log.{os.getpid()}.{target_safe}"
+	@{{ grep '\[ERRORS\]' "{QMK_FIRMWARE}/.build/build.log.{os.getpid()}.{target_safe}" >/dev/null 2>&1 && printf "Build %-64s \e[1;31m[ERRORS]\e[0m\\n" "{keyboard_name}:{keymap}" ; }} \\
+		|| {{ grep '\[WARNINGS\]' "{QMK_FIRMWARE}/.build/build.log.{os.getpid()}.{target_safe}" >/dev/null 2>&1 && printf "Build %-64s \e[1;33m[WARNINGS]\e[0m\\n" "{keyboard_name}:{keymap}" ; }} \\
+		|| printf "Build %-64s \e[1;32m[OK]\e[0m\\n" "{keyboard_name}:{keymap}"
 
 """# noqa
-                )
-                # yapf: enable
+            )
+            # yapf: enable
+
+    start_time = perf_counter()
+
+    try:
+        if targets:
+            cli.run([make_cmd, '-j', str(cli.args.parallel), '-f', makefile.as_posix(), 'all'], capture_output=False, stdin=DEVNULL)
+
+    finally:
+        builds = [build for build in (_collect_build(builddir, run, keyboard_name, keymap) for keyboard_name, keymap in targets) if build]
+        record_builds(builds)
+
+        if fingerprints:
+            _store_builds(builddir, builds, fingerprints)
+
+        _write_results(cli.args.results, cli.args.shard, durations, cached_builds + builds)
+
+    if cli.args.timing and builds:
+        _print_utilization(builds, perf_counter() - start_time)
 
-    cli.run([make_cmd, '-j', str(cli.args.parallel), '-f', makefile.as_posix(), 'all'], capture_output=False, stdin=DEVNULL)
+    if fingerprints:
+        cli.log.info(cache_stats_message(FIRMWARE_CACHE))
 
     # Check for failures
     failures = [f for f in builddir.glob(f'failed.log.{os.getpid()}.*')]
@@ -0,0 +1,125 @@
+"""Merge the results of a multibuild that was split into shards.
+"""
+import json
+
+from milc import cli
+
+import qmk.path
+from qmk.build_history import record_builds
+
+
+def _load_results(results_file):
+    """Returns the plan and the builds in a file written by `qmk multibuild --results`.
+
+    The plan is None if the file does not have one.
+    """
+    plan = None
+    builds = []
+
+    with results_file.open(encoding='utf-8') as fd:
+        for line in fd:
+            if line.strip():
+                record = json.loads(line)
+
+                if 'plan' in record:
+                    plan = record
+                else:
+                    builds.append(record)
+
+    return plan, builds
+
+
+def _check_plans(plans, targets):
+    """Returns True if every shard was split from the same plan, and every planned target has a result.
+    """
+    shard_plans = {(plan['targets'], plan['plan'], (plan['shard'] or '1/1').split('/')[1]) for plan in plans}
+
+    if len(shard_plans) > 1:
+        cli.log.error('The shards were split from different plans, so some targets may not have been built by any shard. Give every node the same build history and shard count.')
+        return False
+
+    planned_targets = plans[0]['targets'] if plans else 0
+
+    if len(targets) < planned_targets:
+        cli.log.error('Only %d of the %d planned targets have results. Check that every shard finished and that all of their results files were merged.', len(targets), planned_targets)
+        return False
+
+    return True
+
+
+def _print_shard(shard, builds):
+    """Show how long a shard took and how many of its builds failed.
+
+    Only targets that were really built count towards the times, not those taken from the firmware cache.
+    """
+    built = [build for build in builds if not build.get('cached')]
+    wall_time = max(build['start'] + build['seconds'] for build in built) - min(build['start'] for build in built) if built else 0.0
+    build_time = sum(build['seconds'] for build in built)
+    failures = sum(build['returncode'] != 0 for build in builds)
+
+    cli.log.info('    shard %-8s %5d targets, %4d cached, %4d failed, %7.1f minutes wall time, %8.1f minutes of builds', shard, len(builds), len(builds) - len(built), failures, wall_time / 60, build_time / 60)
+
+    return wall_time
+
+
+@cli.argument('--record', arg_only=True, action='store_true', help='Add the builds of the merged run to the local build history, so that later runs can use their build times.')
+@cli.argument('-o', '--output', arg_only=True, type=qmk.path.normpath, help='Write the merged results to this file.')
+@cli.argument('results', arg_only=True, nargs='+', type=qmk.path.normpath, help="Result files written by 'qmk multibuild --results'.")
+@cli.subcommand('Merge the results of a multibuild split into shards.', hidden=False if cli.config.user.developer else True)
+def multibuild_merge(cli):
+    """Merge the results files of several `qmk multibuild --shard` runs into one report.
+    """
+    shards = {}
+    plans = []
+
+    for results_file in cli.args.results:
+        if not results_file.exists():
+            cli.log.error('Results file %s does not exist!', results_file)
+            return False
+
+        plan, results = _load_results(results_file)
+
+        if not plan:
+            cli.log.error("Results file %s has no plan. Write it with 'qmk multibuild --results'.", results_file)
+            return False
+
+        plans.append(plan)
+        shards.setdefault(plan['shard'] or str(results_file), [])
+
+        for build in results:
+            shards.setdefault(build.get('shard') or str(results_file), []).append(build)
+
+    builds = [build for shard_builds in shards.values() for build in shard_builds]
+    targets = {(build['keyboard'], build['keymap']) for build in builds}
+    failures = [build for build in builds if build['returncode'] != 0]
+
+    cli.log.info('Merged %d shards: %d targets, %d failed.', len(shards), len(targets), len(failures))
+
+    wall_times = [_print_shard(shard, shard_builds) for shard, shard_builds in sorted(shards.items())]
+    average_wall_time = sum(wall_times) / len(wall_times) if wall_times else 0
+
+    if average_wall_time:
+        cli.log.info('The slowest shard took %.0f%% longer than the average.', 100 * (max(wall_times) / average_wall_time - 1))
+
+    if len(targets) < len(builds):
+        cli.log.warning('%d targets were built by more than one shard. Give every node the same build history, so that they split the targets the same way.', len(builds) - len(targets))
+
+    for build in sorted(failures, key=lambda build: (build['keyboard'], build['keymap'])):
+        cli.log.error('Build %s:%s failed with exit status %d.', build['keyboard'], build['keymap'], build['returncode'])
+
+    complete = _check_plans(plans, targets)
+
+    # Every shard is recorded as part of the same run, which is named after the first shard to start
+    run = min((build['run'] for build in builds), default=None)
+    merged_builds = [{**{key: value for key, value in build.items() if key != 'shard'}, 'run': run} for build in builds]
+
+    if cli.args.output:
+        cli.args.output.parent.mkdir(parents=True, exist_ok=True)
+        cli.args.output.write_text(''.join(json.dumps(build) + '\n' for build in merged_builds), encoding='utf-8')
+        cli.log.info('Wrote merged results to %s.', cli.args.output)
+
+    if cli.args.record:
+        # Cached results took no time to build, so they would throw off the durations predicted from the history
+        record_builds([build for build in merged_builds if not build.get('cached')])
+
+    return complete and not failures
@@ -213,7 +213,7 @@ def parse_configurator_json(configurator_file):
     # FIXME(skullydazed/anyone): Add validation here
     user_keymap = json.load(configurator_file)
     orig_keyboard = user_keymap['keyboard']
-    aliases = json_load(Path('data/mappings/keyboard_aliases.json'))
+    aliases = json_load(Path('data/mappings/keyboard_aliases.json'), cache=True)
 
     if orig_keyboard in aliases:
         if 'target' in aliases[orig_keyboard]:
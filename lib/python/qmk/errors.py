@@ -10,3 +10,24 @@ class CppError(Exception):
     """
     def __init__(self, message):
         self.message = message
+
+
+class CppUnsupportedError(Exception):
+    """Raised when the built-in C pre-processor finds something it can't reproduce exactly, and 'cpp' has to be used instead.
+    """
+    def __init__(self, message):
+        self.message = message
+
+
+class CLexerUnsupportedError(Exception):
+    """Raised when the keymap.c lexer finds something it can't split up the same way pygments does, and pygments has to be used instead.
+    """
+    def __init__(self, message):
+        self.message = message
+
+
+class FilterSyntaxError(Exception):
+    """Raised when a keyboard filter can't be parsed.
+    """
+    def __init__(self, message):
+        self.message = message
@@ -1,22 +1,31 @@
 """Functions that help us generate and use info.json files.
 """
+import hashlib
+import os
+from functools import lru_cache
 from glob import glob
 from pathlib import Path
 
-import jsonschema
-from dotty_dict import dotty
 from milc import cli
 
+from qmk.cache import LogRecorder, cache_enabled, cache_get, cache_put, evict_cache, files_digest, library_digest, replay_logs
 from qmk.constants import CHIBIOS_PROCESSORS, LUFA_PROCESSORS, VUSB_PROCESSORS
 from qmk.c_parse import find_layouts
-from qmk.json_schema import deep_update, json_load, keyboard_validate, keyboard_api_validate
-from qmk.keyboard import config_h, rules_mk
+from qmk.info_mappings import false_values, get_info_value, info_config_map, info_rules_map, set_info_value, true_values
+from qmk.json_schema import deep_update, json_load, keyboard_validate_file, keyboard_api_validate
+from qmk.keyboard import config_h, resolve_keyboard, rules_mk
 from qmk.keymap import list_keymaps
 from qmk.makefile import parse_rules_mk_file
 from qmk.math import compute
 
-true_values = ['1', 'on', 'yes']
-false_values = ['0', 'off', 'no']
+# The cache namespace used to store info_json() results
+INFO_JSON_CACHE = 'info_json'
+
+# The size in bytes the info_json cache is trimmed to. A full `qmk generate-api` stores about 16MB.
+INFO_JSON_CACHE_SIZE = 64 * 1024 * 1024
+
+# Files in a keyboard folder that can change the info.json data
+info_json_input_suffixes = ('.h', '.json', '.mk')
 
 
 def _valid_community_layout(layout):
@@ -25,9 +34,116 @@ def _valid_community_layout(layout):
     return (Path('layouts/default') / layout).exists()
 
 
+@lru_cache(maxsize=None)
+def _shared_info_json_inputs():
+    """Returns the files and directory names that every keyboard's info.json depends on.
+    """
+    input_files = sorted(Path('data/mappings').glob('*.json')) + sorted(Path('data/schemas').glob('*.jsonschema'))
+    layout_names = sorted(path.name for path in Path('layouts/default').iterdir() if path.is_dir())
+    community_json_keymaps = sorted(str(path) for path in Path('layouts/community').glob('*/*/keymap.json'))
+
+    return input_files, layout_names + community_json_keymaps
+
+
+def _keyboard_folder_inputs(folder):
+    """Returns the files in a single keyboard folder that can affect the info.json data.
+    """
+    input_files = []
+
+    try:
+        entries = sorted(os.scandir(folder), key=lambda entry: entry.name)
+    except OSError:
+        return input_files
+
+    for entry in entries:
+        if entry.is_file() and entry.name.endswith(info_json_input_suffixes):
+            input_files.append(entry.path)
+
+        elif entry.name == 'keymaps' and entry.is_dir():
+            # Only JSON keymaps show up in the info.json data
+            input_files.extend(sorted(str(keymap_json) for keymap_json in Path(entry.path).glob('*/keymap.json')))
+
+    return input_files
+
+
+def info_json_input_files(keyboard):
+    """Returns every file `info_json()` reads for a keyboard.
+
+    This covers every rules.mk, config.h, keyboard header and info.json in the keyboard's folder chain, the JSON keymaps, and the data/mappings and data/schemas files.
+    """
+    keyboard = str(keyboard)
+    shared_files, _ = _shared_info_json_inputs()
+    input_files = list(shared_files)
+    folders = []
+
+    for keyboard_name in keyboard, resolve_keyboard(keyboard):
+        cur_dir = Path('keyboards')
+
+        for directory in Path(keyboard_name).parts:
+            cur_dir = cur_dir / directory
+
+            if cur_dir not in folders:
+                folders.append(cur_dir)
+
+    for folder in folders:
+        input_files.extend(_keyboard_folder_inputs(folder))
+
+    return input_files
+
+
+def info_json_digest(keyboard):
+    """Returns a digest of every input `info_json()` reads for a keyboard.
+
+    This covers the files from `info_json_input_files()`, the names of the default and community layouts, and the source of the qmk library itself.
+    """
+    keyboard = str(keyboard)
+    _, shared_names = _shared_info_json_inputs()
+    hasher = hashlib.sha1(f'{library_digest()}\0{keyboard}\n'.encode('utf-8'))
+    hasher.update('\0'.join(shared_names).encode('utf-8'))
+    hasher.update(files_digest(info_json_input_files(keyboard)).encode('utf-8'))
+
+    return hasher.hexdigest()
+
+
 def info_json(keyboard):
     """Generate the info.json data for a specific keyboard.
+
+    Results are cached under `.build/cache/info_json`, keyed by `info_json_digest(keyboard)`, and the least recently used results are evicted once the cache grows past `INFO_JSON_CACHE_SIZE`. Log messages emitted while building the data are stored with it and replayed on a cache hit.
+    """
+    cache_key = info_json_digest(keyboard) if cache_enabled(INFO_JSON_CACHE) else None
+
+    if cache_key:
+        cached = cache_get(INFO_JSON_CACHE, cache_key)
+
+        if cached:
+            replay_logs(cli.log, cached['log'])
+            return cached['info_json']
+
+    with LogRecorder(cli.log) as recorder:
+        info_data = _build_info_json(keyboard)
+
+    if cache_key:
+        cache_put(INFO_JSON_CACHE, cache_key, {'log': recorder.messages, 'info_json': info_data})
+        _evict_info_json_cache()
+
+    return info_data
+
+
+@lru_cache(maxsize=None)
+def _evict_info_json_cache():
+    """Trim the info_json cache to `INFO_JSON_CACHE_SIZE`, once per process.
+
+    Entries for old versions of a keyboard or of this library are never looked up again, so without this the cache grows with every change.
     """
+    return evict_cache(INFO_JSON_CACHE, INFO_JSON_CACHE_SIZE)
+
+
+def _build_info_json(keyboard):
+    """Build the info.json data for a specific keyboard from scratch.
+    """
+    # jsonschema is slow to import and isn't needed when info_json() is answered from the cache
+    import jsonschema
+
     cur_dir = Path('keyboards')
     rules = parse_rules_mk_file(cur_dir / keyboard / 'rules.mk')
     if 'DEFAULT_FOLDER' in rules:
@@ -216,57 +332,33 @@ def _extract_matrix_info(info_data, config_c):
     return info_data
 
 
+def _info_value(info_data, info_path):
+    """Returns the value at `info_path` in `info_data`, or None if it does not exist.
+    """
+    try:
+        return get_info_value(info_data, info_path)
+
+    except KeyError:
+        return None
+
+
 def _extract_config_h(info_data):
     """Pull some keyboard information from existing config.h files
     """
     config_c = config_h(info_data['keyboard_folder'])
 
     # Pull in data from the json map
-    dotty_info = dotty(info_data)
-    info_config_map = json_load(Path('data/mappings/info_config.json'))
-
-    for config_key, info_dict in info_config_map.items():
-        info_key = info_dict['info_key']
-        key_type = info_dict.get('value_type', 'str')
-
+    for config_key, info_key, info_path, to_json, _, warn_duplicate in info_config_map():
         try:
-            if config_key in config_c and info_dict.get('to_json', True):
-                if dotty_info.get(info_key) and info_dict.get('warn_duplicate', True):
+            if to_json and config_key in config_c:
+                if warn_duplicate and _info_value(info_data, info_path):
                     _log_warning(info_data, '%s in config.h is overwriting %s in info.json' % (config_key, info_key))
 
-                if key_type.startswith('array'):
-                    if '.' in key_type:
-                        key_type, array_type = key_type.split('.', 1)
-                    else:
-                        array_type = None
-
-                    config_value = config_c[config_key].replace('{', '').replace('}', '').strip()
-
-                    if array_type == 'int':
-                        dotty_info[info_key] = list(map(int, config_value.split(',')))
-                    else:
-                        dotty_info[info_key] = config_value.split(',')
-
-                elif key_type == 'bool':
-                    dotty_info[info_key] = config_c[config_key] in true_values
-
-                elif key_type == 'hex':
-                    dotty_info[info_key] = '0x' + config_c[config_key][2:].upper()
-
-                elif key_type == 'list':
-                    dotty_info[info_key] = config_c[config_key].split()
-
-                elif key_type == 'int':
-                    dotty_info[info_key] = int(config_c[config_key])
-
-                else:
-                    dotty_info[info_key] = config_c[config_key]
+                set_info_value(info_data, info_path, to_json(config_c[config_key]))
 
         except Exception as e:
             _log_warning(info_data, f'{config_key}->{info_key}: {e}')
 
-    info_data.update(dotty_info)
-
     # Pull data that easily can't be mapped in json
     _extract_matrix_info(info_data, config_c)
 
@@ -290,51 +382,17 @@ def _extract_rules_mk(info_data):
         unknown_processor_rules(info_data, rules)
 
     # Pull in data from the json map
-    dotty_info = dotty(info_data)
-    info_rules_map = json_load(Path('data/mappings/info_rules.json'))
-
-    for rules_key, info_dict in info_rules_map.items():
-        info_key = info_dict['info_key']
-        key_type = info_dict.get('value_type', 'str')
-
+    for rules_key, info_key, info_path, to_json, _, warn_duplicate in info_rules_map():
         try:
-            if rules_key in rules and info_dict.get('to_json', True):
-                if dotty_info.get(info_key) and info_dict.get('warn_duplicate', True):
+            if to_json and rules_key in rules:
+                if warn_duplicate and _info_value(info_data, info_path):
                     _log_warning(info_data, '%s in rules.mk is overwriting %s in info.json' % (rules_key, info_key))
 
-                if key_type.startswith('array'):
-                    if '.' in key_type:
-                        key_type, array_type = key_type.split('.', 1)
-                    else:
-                        array_type = None
-
-                    rules_value = rules[rules_key].replace('{', '').replace('}', '').strip()
-
-                    if array_type == 'int':
-                        dotty_info[info_key] = list(map(int, rules_value.split(',')))
-                    else:
-                        dotty_info[info_key] = rules_value.split(',')
-
-                elif key_type == 'list':
-                    dotty_info[info_key] = rules[rules_key].split()
-
-                elif key_type == 'bool':
-                    dotty_info[info_key] = rules[rules_key] in true_values
-
-                elif key_type == 'hex':
-                    dotty_info[info_key] = '0x' + rules[rules_key][2:].upper()
-
-                elif key_type == 'int':
-                    dotty_info[info_key] = int(rules[rules_key])
-
-                else:
-                    dotty_info[info_key] = rules[rules_key]
+                set_info_value(info_data, info_path, to_json(rules[rules_key]))
 
         except Exception as e:
             _log_warning(info_data, f'{rules_key}->{info_key}: {e}')
 
-    info_data.update(dotty_info)
-
     # Merge in config values that can't be easily mapped
     _extract_features(info_data, rules)
 
@@ -484,6 +542,8 @@ def unknown_processor_rules(info_data, rules):
 def merge_info_jsons(keyboard, info_data):
     """Return a merged copy of all the info.json files for a keyboard.
     """
+    import jsonschema
+
     for info_file in find_info_json(keyboard):
         # Load and validate the JSON data
         new_info_data = json_load(info_file)
@@ -493,7 +553,7 @@ def merge_info_jsons(keyboard, info_data):
             continue
 
         try:
-            keyboard_validate(new_info_data)
+            keyboard_validate_file(info_file, new_info_data)
         except jsonschema.ValidationError as e:
             json_path = '.'.join([str(p) for p in e.absolute_path])
             cli.log.error('Not including data from file: %s', info_file)
@@ -0,0 +1,167 @@
+"""Compiled forms of `data/mappings/info_config.json` and `data/mappings/info_rules.json`.
+
+Each mapping file is loaded once per process and compiled into a list of entries holding the split info.json key and the converters for its `value_type`, in both directions. Callers never have to look at the mapping options again.
+"""
+from functools import lru_cache
+from pathlib import Path
+
+from qmk.json_schema import json_load
+
+true_values = ['1', 'on', 'yes']
+false_values = ['0', 'off', 'no']
+
+INFO_CONFIG_MAP = Path('data/mappings/info_config.json')
+INFO_RULES_MAP = Path('data/mappings/info_rules.json')
+
+
+def _unchanged(value):
+    return value
+
+
+def _array(value):
+    return value.replace('{', '').replace('}', '').strip().split(',')
+
+
+def _int_array(value):
+    return list(map(int, _array(value)))
+
+
+def _bool(value):
+    return value in true_values
+
+
+def _hex(value):
+    return '0x' + value[2:].upper()
+
+
+def _list(value):
+    return value.split()
+
+
+def _to_json(value_type):
+    """Returns the function that turns a config.h or rules.mk value into its info.json value.
+    """
+    if value_type == 'array.int':
+        return _int_array
+
+    elif value_type.startswith('array'):
+        return _array
+
+    return {'bool': _bool, 'hex': _hex, 'int': int, 'list': _list}.get(value_type, _unchanged)
+
+
+def _config_h_define(config_key, value):
+    return ['', f'#ifndef {config_key}', f'#   define {config_key} {value}', f'#endif // {config_key}']
+
+
+def _config_h_array(config_key, value):
+    return _config_h_define(config_key, f'{{ {", ".join(map(str, value))} }}')
+
+
+def _config_h_bool(config_key, value):
+    return ['', f'#ifndef {config_key}', f'#   define {config_key}', f'#endif // {config_key}'] if value else []
+
+
+def _config_h_mapping(config_key, value):
+    return [line for key, item in value.items() for line in _config_h_define(key, item)]
+
+
+def _to_config_h(value_type):
+    """Returns the function that turns an info.json value into a list of config.h lines.
+    """
+    if value_type.startswith('array'):
+        return _config_h_array
+
+    return {'bool': _config_h_bool, 'mapping': _config_h_mapping}.get(value_type, _config_h_define)
+
+
+def _rules_mk_assign(rules_key, value):
+    return f'{rules_key} ?= {value}'
+
+
+def _rules_mk_array(rules_key, value):
+    return f'{rules_key} ?= {" ".join(value)}'
+
+
+def _rules_mk_bool(rules_key, value):
+    return f'{rules_key} ?= {"on" if value else "off"}'
+
+
+def _rules_mk_mapping(rules_key, value):
+    return '\n'.join([f'{key} ?= {item}' for key, item in value.items()])
+
+
+def _to_rules_mk(value_type):
+    """Returns the function that turns an info.json value into rules.mk text.
+    """
+    return {'array': _rules_mk_array, 'bool': _rules_mk_bool, 'mapping': _rules_mk_mapping}.get(value_type, _rules_mk_assign)
+
+
+def _compile_mapping(mapping_file, to_c, to_c_option):
+    """Returns the compiled entries for a mapping file.
+    """
+    entries = []
+
+    for key, info_dict in json_load(mapping_file).items():
+        value_type = info_dict.get('value_type', 'str')
+
+        entries.append((
+            key,
+            info_dict['info_key'],
+            tuple(info_dict['info_key'].split('.')),
+            _to_json(value_type) if info_dict.get('to_json', True) else None,
+            to_c(value_type) if info_dict.get(to_c_option, True) else None,
+            info_dict.get('warn_duplicate', True),
+        ))
+
+    return entries
+
+
+@lru_cache(maxsize=None)
+def info_config_map():
+    """Returns the compiled info_config.json mapping.
+
+    Each entry is a tuple of (config.h key, info.json key, info.json key path, to_json, to_c, warn_duplicate). `to_json(value)` converts a config.h value for info.json and `to_c(config_key, value)` returns the config.h lines for an info.json value. Either is None when the mapping does not go in that direction.
+    """
+    return _compile_mapping(INFO_CONFIG_MAP, _to_config_h, 'to_config')
+
+
+@lru_cache(maxsize=None)
+def info_rules_map():
+    """Returns the compiled info_rules.json mapping.
+
+    Entries are the same as `info_config_map()`, except that `to_c(rules_key, value)` returns rules.mk text.
+    """
+    return _compile_mapping(INFO_RULES_MAP, _to_rules_mk, 'to_c')
+
+
+def get_info_value(info_data, info_path):
+    """Returns the value at `info_path` in `info_data`, the same way dotty does.
+
+    Raises KeyError when part of the path is missing. A None value part way down the path is returned as None.
+    """
+    for key in info_path:
+        try:
+            info_data = info_data[key]
+
+        except TypeError:
+            raise KeyError(key)
+
+        if info_data is None:
+            break
+
+    return info_data
+
+
+def set_info_value(info_data, info_path, value):
+    """Set the value at `info_path` in `info_data`, the same way dotty does.
+
+    Empty or missing values part way down the path are replaced with new dictionaries.
+    """
+    for key in info_path[:-1]:
+        if not info_data.get(key):
+            info_data[key] = {}
+
+        info_data = info_data[key]
+
+    info_data[info_path[-1]] = value
@@ -2,16 +2,26 @@
 """
 import json
 from decimal import Decimal
+from json.encoder import encode_basestring, encode_basestring_ascii
+from math import isfinite
 
 newline = '\n'
 
 
 class QMKJSONEncoder(json.JSONEncoder):
     """Base class for all QMK JSON encoders.
+
+    Containers are written into a single list of output chunks that is joined once at the end. Runs of primitive values are handed to the stdlib C encoder.
     """
     container_types = (list, tuple, dict)
     indentation_char = " "
 
+    # How the stdlib encoder writes these
+    constants = {True: 'true', False: 'false', None: 'null'}
+
+    # Values that keep a dictionary from being handed to the stdlib encoder whole
+    inline_exclude_types = (list, tuple, dict, Decimal)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.indentation_level = 0
@@ -19,6 +29,10 @@ class QMKJSONEncoder(json.JSONEncoder):
         if not self.indent:
             self.indent = 4
 
+        # Encodes lists and dicts of primitives on a single line, the way we format them
+        self.inline_encoder = json.JSONEncoder(ensure_ascii=self.ensure_ascii, check_circular=False, allow_nan=self.allow_nan, separators=(', ', ': '), default=self.default)
+        self.inline_sorted_encoder = json.JSONEncoder(ensure_ascii=self.ensure_ascii, check_circular=False, allow_nan=self.allow_nan, sort_keys=True, separators=(', ', ': '), default=self.default)
+
     def encode_decimal(self, obj):
         """Encode a decimal object.
         """
@@ -30,15 +44,18 @@ class QMKJSONEncoder(json.JSONEncoder):
     def encode_list(self, obj):
         """Encode a list-like object.
         """
-        if self.primitives_only(obj):
-            return "[" + ", ".join(self.encode(element) for element in obj) + "]"
+        output = []
+        self.write_list(obj, self.indentation_level, output)
 
-        else:
-            self.indentation_level += 1
-            output = [self.indent_str + self.encode(element) for element in obj]
-            self.indentation_level -= 1
+        return ''.join(output)
+
+    def encode_dict(self, obj):
+        """Encode a dictionary.
+        """
+        output = []
+        self.write_dict(obj, self.indentation_level, output)
 
-            return "[\n" + ",\n".join(output) + "\n" + self.indent_str + "]"
+        return ''.join(output)
 
     def encode(self, obj):
         """Encode keymap.json objects for QMK.
@@ -55,6 +72,79 @@ class QMKJSONEncoder(json.JSONEncoder):
         else:
             return super().encode(obj)
 
+    def encode_primitive(self, obj):
+        """Encode anything that isn't a container, always returning a string.
+        """
+        obj_type = type(obj)
+
+        if obj_type is str:
+            return encode_basestring_ascii(obj) if self.ensure_ascii else encode_basestring(obj)
+
+        elif obj_type is int:
+            return int.__repr__(obj)
+
+        elif obj_type is float and isfinite(obj):
+            return float.__repr__(obj)
+
+        elif obj_type is bool or obj is None:
+            return self.constants[obj]
+
+        elif isinstance(obj, Decimal):
+            return str(self.encode_decimal(obj))
+
+        return super().encode(obj)
+
+    def write(self, obj, level, output):
+        """Append the encoded form of `obj`, which sits at indentation `level`, to `output`.
+        """
+        if isinstance(obj, (list, tuple)):
+            self.write_list(obj, level, output)
+
+        elif isinstance(obj, dict):
+            self.write_dict(obj, level, output)
+
+        else:
+            output.append(self.encode_primitive(obj))
+
+    def write_list(self, obj, level, output):
+        """Append a list-like object to `output`.
+        """
+        if self.primitives_only(obj):
+            output.append(self.inline_encoder.encode(obj))
+
+        else:
+            indent_level = level + 1
+            indent = self.indentation_char * (indent_level * self.indent)
+            separator = '[\n'
+
+            for element in obj:
+                output.append(separator)
+                output.append(indent)
+                self.write(element, indent_level, output)
+                separator = ',\n'
+
+            output.append('\n' + self.indentation_char * (level * self.indent) + ']')
+
+    def write_lines(self, obj, keys, level, output):
+        """Append a dictionary to `output` with each of `keys` on its own line.
+        """
+        indent_level = level + 1
+        indent = self.indentation_char * (indent_level * self.indent)
+        separator = '{\n'
+
+        for key in keys:
+            value = obj[key]
+            output.append(f'{separator}{indent}{encode_basestring_ascii(key) if isinstance(key, str) else json.dumps(key)}: ')
+
+            if isinstance(value, self.container_types):
+                self.write(value, indent_level, output)
+            else:
+                output.append(self.encode_primitive(value))
+
+            separator = ',\n'
+
+        output.append('\n' + self.indentation_char * (level * self.indent) + '}')
+
     def primitives_only(self, obj):
         """Returns true if the object doesn't have any container type objects (list, tuple, dict).
         """
@@ -71,21 +161,46 @@ class QMKJSONEncoder(json.JSONEncoder):
 class InfoJSONEncoder(QMKJSONEncoder):
     """Custom encoder to make info.json's a little nicer to work with.
     """
-    def encode_dict(self, obj):
-        """Encode info.json dictionaries.
+    # Sort keys for the top level of info.json, everything else sorts as '50' + key
+    top_level_order = {
+        'manufacturer': '10keyboard_name',
+        'keyboard_name': '11keyboard_name',
+        'maintainer': '12maintainer',
+        'height': '40height',
+        'width': '40width',
+        'community_layouts': '97community_layouts',
+        'layout_aliases': '98layout_aliases',
+        'layouts': '99layouts',
+    }
+
+    def write_dict(self, obj, level, output):
+        """Append an info.json dictionary to `output`.
         """
-        if obj:
-            if self.indentation_level == 4:
-                # These are part of a layout, put them on a single line.
-                return "{ " + ", ".join(f"{self.encode(key)}: {self.encode(element)}" for key, element in sorted(obj.items())) + " }"
+        if not obj:
+            output.append('{}')
+
+        elif level == 4:
+            # These are part of a layout, put them on a single line.
+            if all(type(key) is str for key in obj) and not any(isinstance(value, self.inline_exclude_types) for value in obj.values()):
+                output.append('{ ' + self.inline_sorted_encoder.encode(obj)[1:-1] + ' }')
 
             else:
-                self.indentation_level += 1
-                output = [self.indent_str + f"{json.dumps(key)}: {self.encode(value)}" for key, value in sorted(obj.items(), key=self.sort_dict)]
-                self.indentation_level -= 1
-                return "{\n" + ",\n".join(output) + "\n" + self.indent_str + "}"
+                separator = '{ '
+
+                for key in sorted(obj):
+                    output.append(f'{separator}{self.encode_primitive(key)}: ')
+                    self.write(obj[key], level, output)
+                    separator = ', '
+
+                output.append(' }')
+
         else:
-            return "{}"
+            self.write_lines(obj, sorted(obj, key=self.top_level_key) if level == 0 else sorted(obj), level, output)
+
+    def top_level_key(self, key):
+        """Returns the sort key for a key at the top level of info.json.
+        """
+        return self.top_level_order.get(key) or '50' + str(key)
 
     def sort_dict(self, key):
         """Forces layout to the back of the sort order.
@@ -93,29 +208,7 @@ class InfoJSONEncoder(QMKJSONEncoder):
         key = key[0]
 
         if self.indentation_level == 1:
-            if key == 'manufacturer':
-                return '10keyboard_name'
-
-            elif key == 'keyboard_name':
-                return '11keyboard_name'
-
-            elif key == 'maintainer':
-                return '12maintainer'
-
-            elif key in ('height', 'width'):
-                return '40' + str(key)
-
-            elif key == 'community_layouts':
-                return '97community_layouts'
-
-            elif key == 'layout_aliases':
-                return '98layout_aliases'
-
-            elif key == 'layouts':
-                return '99layouts'
-
-            else:
-                return '50' + str(key)
+            return self.top_level_key(key)
 
         return key
 
@@ -123,25 +216,29 @@ class InfoJSONEncoder(QMKJSONEncoder):
 class KeymapJSONEncoder(QMKJSONEncoder):
     """Custom encoder to make keymap.json's a little nicer to work with.
     """
-    def encode_dict(self, obj):
-        """Encode dictionary objects for keymap.json.
+    # Sort keys for the top level of keymap.json, everything else sorts as '50' + key
+    top_level_order = {
+        'version': '00version',
+        'author': '01author',
+        'notes': '02notes',
+        'layers': '98layers',
+        'documentation': '99documentation',
+    }
+
+    def write_dict(self, obj, level, output):
+        """Append a keymap.json dictionary to `output`.
         """
         if obj:
-            self.indentation_level += 1
-            output_lines = [f"{self.indent_str}{json.dumps(key)}: {self.encode(value)}" for key, value in sorted(obj.items(), key=self.sort_dict)]
-            output = ',\n'.join(output_lines)
-            self.indentation_level -= 1
-
-            return f"{{\n{output}\n{self.indent_str}}}"
+            self.write_lines(obj, sorted(obj, key=self.top_level_key) if level == 0 else sorted(obj), level, output)
 
         else:
-            return "{}"
+            output.append('{}')
 
-    def encode_list(self, obj):
-        """Encode a list-like object.
+    def write_list(self, obj, level, output):
+        """Append a list-like object to `output`.
         """
-        if self.indentation_level == 2:
-            indent_level = self.indentation_level + 1
+        if level == 2:
+            indent_str = self.indentation_char * (level * self.indent)
             # We have a list of keycodes
             layer = [[]]
 
@@ -151,19 +248,17 @@ class KeymapJSONEncoder(QMKJSONEncoder):
                 else:
                     layer[-1].append(f'"{key}"')
 
-            layer = [f"{self.indent_str*indent_level}{', '.join(row)}" for row in layer]
+            layer = [f"{indent_str*(level + 1)}{', '.join(row)}" for row in layer]
 
-            return f"{self.indent_str}[\n{newline.join(layer)}\n{self.indent_str*self.indentation_level}]"
-
-        elif self.primitives_only(obj):
-            return "[" + ", ".join(self.encode(element) for element in obj) + "]"
+            output.append(f"{indent_str}[\n{newline.join(layer)}\n{indent_str*level}]")
 
         else:
-            self.indentation_level += 1
-            output = [self.indent_str + self.encode(element) for element in obj]
-            self.indentation_level -= 1
+            super().write_list(obj, level, output)
 
-            return "[\n" + ",\n".join(output) + "\n" + self.indent_str + "]"
+    def top_level_key(self, key):
+        """Returns the sort key for a key at the top level of keymap.json.
+        """
+        return self.top_level_order.get(key) or '50' + str(key)
 
     def sort_dict(self, key):
         """Sorts the hashes in a nice way.
@@ -171,22 +266,6 @@ class KeymapJSONEncoder(QMKJSONEncoder):
         key = key[0]
 
         if self.indentation_level == 1:
-            if key == 'version':
-                return '00version'
-
-            elif key == 'author':
-                return '01author'
-
-            elif key == 'notes':
-                return '02notes'
-
-            elif key == 'layers':
-                return '98layers'
-
-            elif key == 'documentation':
-                return '99documentation'
-
-            else:
-                return '50' + str(key)
+            return self.top_level_key(key)
 
         return key
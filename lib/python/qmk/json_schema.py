@@ -1,21 +1,98 @@
 """Functions that help us generate and use info.json files.
 """
+import copy
 import json
+from collections import OrderedDict
 from collections.abc import Mapping
+from functools import lru_cache
 from pathlib import Path
 
 import hjson
-import jsonschema
 from milc import cli
 
+from qmk.cache import file_digest, file_stat_key, record_cache_stat
 
-def json_load(json_file):
+# How many parsed documents `json_load(..., cache=True)` keeps in memory
+JSON_CACHE_SIZE = 32
+
+# Parsed documents keyed by path, in least to most recently used order
+_json_cache = OrderedDict()
+
+# Validation results for files that have already been checked, keyed by the file's content digest
+_keyboard_file_results = {}
+
+
+def _parse_float(value):
+    """Parse a JSON number with a fractional part the same way hjson does, which turns whole numbers like `6.0` into ints.
+    """
+    number = float(value)
+
+    # Check the bound first, numbers too large for a float like `1e400` become inf, which int() can't convert
+    if abs(number) < 1e10 and int(number) == number:
+        return int(number)
+
+    return number
+
+
+def _json_parse(json_file):
+    """Parse a json file, using the fast stdlib parser for strict JSON and hjson for everything else.
+    """
+    json_text = json_file.read_text(encoding='utf-8')
+
+    try:
+        return json.loads(json_text, parse_float=_parse_float)
+
+    except json.decoder.JSONDecodeError:
+        return hjson.loads(json_text)
+
+
+def _json_copy(data):
+    """Returns a deep copy of parsed JSON data, much faster than `copy.deepcopy()`.
+    """
+    if isinstance(data, dict):
+        return type(data)((key, _json_copy(value)) for key, value in data.items())
+
+    if isinstance(data, list):
+        return [_json_copy(value) for value in data]
+
+    return data
+
+
+def _json_load_cached(json_file):
+    """Returns a copy of a parsed json file, only reading it again when it has changed.
+    """
+    path = str(json_file)
+    stat_key = file_stat_key(json_file)
+    cached = _json_cache.get(path)
+
+    if cached and cached[0] == stat_key:
+        record_cache_stat('json_load', 'hits')
+        _json_cache.move_to_end(path)
+
+    else:
+        record_cache_stat('json_load', 'misses')
+        cached = _json_cache[path] = (stat_key, _json_parse(json_file))
+
+        if len(_json_cache) > JSON_CACHE_SIZE:
+            _json_cache.popitem(last=False)
+
+    return _json_copy(cached[1])
+
+
+def json_load(json_file, cache=False):
     """Load a json file from disk.
 
     Note: file must be a Path object.
+
+    Args:
+        json_file: the file to load
+        cache: keep the parsed file in memory for the next call. A copy is returned, so callers are free to modify it.
     """
     try:
-        return hjson.load(json_file.open(encoding='utf-8'))
+        if cache:
+            return _json_load_cached(json_file)
+
+        return _json_parse(json_file)
 
     except json.decoder.JSONDecodeError as e:
         cli.log.error('Invalid JSON encountered attempting to load {fg_cyan}%s{fg_reset}:\n\t{fg_red}%s', json_file, e)
@@ -32,27 +109,67 @@ def load_jsonschema(schema_name):
     if not schema_path.exists():
         schema_path = Path('data/schemas/false.jsonschema')
 
-    return json_load(schema_path)
+    return json_load(schema_path, cache=True)
+
+
+@lru_cache(maxsize=None)
+def compiled_validator(schema_name, resolver_schema_name=None):
+    """Returns a Draft7Validator for a jsonschema, built once and shared for the life of the process.
+
+    Args:
+        schema_name: name of the schema to validate against
+        resolver_schema_name: name of a schema to resolve `$ref`s against, if it is not `schema_name` itself
+    """
+    # jsonschema is slow to import and most subcommands never validate anything, so we only import it when needed
+    import jsonschema
+
+    schema = load_jsonschema(schema_name)
+    jsonschema.Draft7Validator.check_schema(schema)
+    resolver = None
+
+    if resolver_schema_name:
+        resolver = jsonschema.RefResolver.from_schema(load_jsonschema(resolver_schema_name))
+
+    return jsonschema.Draft7Validator(schema, resolver=resolver)
 
 
 def keyboard_validate(data):
     """Validates data against the keyboard jsonschema.
     """
-    schema = load_jsonschema('keyboard')
-    validator = jsonschema.Draft7Validator(schema).validate
+    return compiled_validator('keyboard').validate(data)
+
+
+def keyboard_validate_file(json_file, data):
+    """Validates the data loaded from `json_file` against the keyboard jsonschema.
+
+    The result is remembered by the file's content digest, so identical files are only validated once per process. `data` must be the unmodified contents of `json_file`.
+    """
+    import jsonschema
+
+    digest = file_digest(json_file)
 
-    return validator(data)
+    if digest in _keyboard_file_results:
+        record_cache_stat('keyboard_validation', 'hits')
+
+    else:
+        record_cache_stat('keyboard_validation', 'misses')
+
+        try:
+            keyboard_validate(data)
+            _keyboard_file_results[digest] = None
+
+        except jsonschema.ValidationError as e:
+            _keyboard_file_results[digest] = e.with_traceback(None)
+
+    # Raise a copy, re-raising the stored instance would add to its traceback every time
+    if _keyboard_file_results[digest]:
+        raise copy.copy(_keyboard_file_results[digest])
 
 
 def keyboard_api_validate(data):
     """Validates data against the api_keyboard jsonschema.
     """
-    base = load_jsonschema('keyboard')
-    relative = load_jsonschema('api_keyboard')
-    resolver = jsonschema.RefResolver.from_schema(base)
-    validator = jsonschema.Draft7Validator(relative, resolver=resolver).validate
-
-    return validator(data)
+    return compiled_validator('api_keyboard', 'keyboard').validate(data)
 
 
 def deep_update(origdict, newdict):
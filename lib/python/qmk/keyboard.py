@@ -4,13 +4,21 @@ from array import array
 from math import ceil
 from pathlib import Path
 import os
-from glob import glob
+
+from milc import cli
 
 import qmk.path
-from qmk.c_parse import parse_config_h_file
+from qmk.c_parse import config_h_dependency, parse_config_h_file
+from qmk.cache import LogRecorder, file_stat_key, record_cache_stat, replay_logs
+from qmk.constants import CHIBIOS_PROCESSORS, LUFA_PROCESSORS, VUSB_PROCESSORS
 from qmk.json_schema import json_load
+from qmk.keyboard_index import indexed_name, keyboard_index
 from qmk.makefile import parse_rules_mk_file
 
+# Merged config.h/rules.mk data for every prefix of a folder chain seen so far, so keyboards with common parents share work
+_config_h_chains = {}
+_rules_mk_chains = {}
+
 BOX_DRAWING_CHARACTERS = {
     "unicode": {
         "tl": "┌",
@@ -69,16 +77,22 @@ def keyboard_folder(keyboard):
 
     This checks aliases and DEFAULT_FOLDER to resolve the actual path for a keyboard.
     """
-    aliases = json_load(Path('data/mappings/keyboard_aliases.json'))
+    aliases = json_load(Path('data/mappings/keyboard_aliases.json'), cache=True)
 
     if keyboard in aliases:
         keyboard = aliases[keyboard].get('target', keyboard)
 
-    rules_mk_file = Path(base_path, keyboard, 'rules.mk')
+    indexed_keyboard = keyboard_index()['keyboards'].get(keyboard)
+
+    if indexed_keyboard:
+        keyboard = indexed_keyboard['default_folder'] or keyboard
 
-    if rules_mk_file.exists():
-        rules_mk = parse_rules_mk_file(rules_mk_file)
-        keyboard = rules_mk.get('DEFAULT_FOLDER', keyboard)
+    elif indexed_name(keyboard) != keyboard:
+        rules_mk_file = Path(base_path, keyboard, 'rules.mk')
+
+        if rules_mk_file.exists():
+            rules_mk = parse_rules_mk_file(rules_mk_file)
+            keyboard = rules_mk.get('DEFAULT_FOLDER', keyboard)
 
     if not qmk.path.is_keyboard(keyboard):
         raise ValueError(f'Invalid keyboard: {keyboard}')
@@ -86,12 +100,6 @@ def keyboard_folder(keyboard):
     return keyboard
 
 
-def _find_name(path):
-    """Determine the keyboard name by stripping off the base_path and rules.mk.
-    """
-    return path.replace(base_path, "").replace(os.path.sep + "rules.mk", "")
-
-
 def keyboard_completer(prefix, action, parser, parsed_args):
     """Returns a list of keyboards for tab completion.
     """
@@ -101,14 +109,15 @@ def keyboard_completer(prefix, action, parser, parsed_args):
 def list_keyboards():
     """Returns a list of all keyboards.
     """
-    # We avoid pathlib here because this is performance critical code.
-    kb_wildcard = os.path.join(base_path, "**", "rules.mk")
-    paths = [path for path in glob(kb_wildcard, recursive=True) if 'keymaps' not in path]
-
-    return sorted(set(map(resolve_keyboard, map(_find_name, paths))))
+    return sorted({keyboard['folder'] for keyboard in keyboard_index()['keyboards'].values()})
 
 
 def resolve_keyboard(keyboard):
+    indexed_keyboard = keyboard_index()['keyboards'].get(keyboard)
+
+    if indexed_keyboard:
+        return indexed_keyboard['folder']
+
     cur_dir = Path('keyboards')
     rules = parse_rules_mk_file(cur_dir / keyboard / 'rules.mk')
     while 'DEFAULT_FOLDER' in rules and keyboard != rules['DEFAULT_FOLDER']:
@@ -117,24 +126,103 @@ def resolve_keyboard(keyboard):
     return keyboard
 
 
+def _parse_file_chain(namespace, chains, files, parse, resolve=None):
+    """Parse `files` in order, reusing the result for any prefix of `files` that has been parsed before.
+
+    Args:
+        namespace: the `cache_stats` namespace to count reused prefixes in
+        chains: dictionary holding the merged results for each prefix
+        files: list of files to parse, in order
+        parse: function that takes a file and the merged result so far and returns the new merged result
+        resolve: for a `parse` that depends on more than the files, a function that returns the current value of a dependency. `parse` is then passed a third argument, a dictionary to add the dependencies it used to along with their values, and a prefix is only reused while all of its dependencies still have those values.
+
+    Returns:
+        a new dictionary with the merged result for all of `files`
+    """
+    merged = {}
+    dependencies = {}
+    chain = ()
+
+    for file in files:
+        chain += ((str(file), file_stat_key(file)),)
+        results = chains.setdefault(chain, [])
+
+        for result in results:
+            if all(resolve(dependency) == value for dependency, value in result[0].items()):
+                record_cache_stat(namespace, 'hits')
+                dependencies, merged, messages = result
+                replay_logs(cli.log, messages)
+                break
+
+        else:
+            record_cache_stat(namespace, 'misses')
+            dependencies = dict(dependencies)
+
+            with LogRecorder(cli.log) as recorder:
+                merged = parse(file, dict(merged), dependencies) if resolve else parse(file, dict(merged))
+
+            results.append((dependencies, merged, recorder.messages))
+
+    return dict(merged)
+
+
+def config_h_predefined(keyboard):
+    """Returns the macros the build system defines for a keyboard before its config.h files are read.
+
+    These are the `KEYBOARD_<folder>` macros, a macro for every `*_ENABLE` and `SPLIT_KEYBOARD` option set in its rules.mk files, and `__AVR__` or `__arm__` for its MCU. Options turned off map to False.
+    """
+    keyboard = resolve_keyboard(keyboard)
+    rules = rules_mk(keyboard)
+    predefined = {}
+    folder = ''
+
+    for part in keyboard.split('/'):
+        folder = f'{folder}_{part}' if folder else part
+        predefined['KEYBOARD_' + folder.replace('.', '')] = '1'
+
+    for option, value in rules.items():
+        if option.endswith('_ENABLE') or option == 'SPLIT_KEYBOARD':
+            predefined[option] = False if value.strip().lower() in ('', '0', 'no', 'off', 'false') else '1'
+
+    if rules.get('MCU') in CHIBIOS_PROCESSORS:
+        predefined.update({'__arm__': '1', '__AVR__': False})
+
+    elif rules.get('MCU') in LUFA_PROCESSORS + VUSB_PROCESSORS:
+        predefined.update({'__arm__': False, '__AVR__': '1'})
+
+    return predefined
+
+
 def config_h(keyboard):
     """Parses all the config.h files for a keyboard.
 
+    Conditionals are evaluated against the macros from `config_h_predefined()`, and includes are followed into the keyboard's own folders.
+
     Args:
         keyboard: name of the keyboard
 
     Returns:
         a dictionary representing the content of the entire config.h tree for a keyboard
     """
-    config = {}
     cur_dir = Path('keyboards')
-    keyboard = Path(resolve_keyboard(keyboard))
+    keyboard = resolve_keyboard(keyboard)
+    predefined = config_h_predefined(keyboard)
+    folders = []
 
-    for dir in keyboard.parts:
+    for dir in keyboard.split('/'):
         cur_dir = cur_dir / dir
-        config = {**config, **parse_config_h_file(cur_dir / 'config.h')}
+        folders.append(cur_dir)
 
-    return config
+    def parse(file, config, dependencies):
+        return parse_config_h_file(file, config, predefined, folders, dependencies)
+
+    def resolve(dependency):
+        return config_h_dependency(dependency, predefined, folders)
+
+    config_h_files = [folder / 'config.h' for folder in folders]
+
+    # Keyboards with common parents share a prefix as long as the parents' config.h files look at no macros or includes that differ between them
+    return _parse_file_chain('config_h_chains', _config_h_chains, config_h_files, parse, resolve)
 
 
 def rules_mk(keyboard):
@@ -148,13 +236,14 @@ def rules_mk(keyboard):
     """
     cur_dir = Path('keyboards')
     keyboard = Path(resolve_keyboard(keyboard))
-    rules = parse_rules_mk_file(cur_dir / keyboard / 'rules.mk')
+    rules_mk_files = []
 
-    for i, dir in enumerate(keyboard.parts):
+    # Parse from the top folder down, like build_keyboard.mk includes them, so keyboards with common parents share a prefix
+    for dir in keyboard.parts:
         cur_dir = cur_dir / dir
-        rules = parse_rules_mk_file(cur_dir / 'rules.mk', rules)
+        rules_mk_files.append(cur_dir / 'rules.mk')
 
-    return rules
+    return _parse_file_chain('rules_mk_chains', _rules_mk_chains, rules_mk_files, parse_rules_mk_file)
 
 
 def render_layout(layout_data, render_ascii, key_labels=None):
@@ -0,0 +1,172 @@
+"""A table of the attributes of every keyboard, for selecting keyboards with `qmk multibuild --filter`.
+
+Each keyboard's attributes are its info.json data, with nested keys joined by dots (eg `features.rgb_matrix` or `usb.vid`) and `layouts` reduced to the list of layout names, its config.h defines and its rules.mk variables. rules.mk variables take precedence over config.h defines of the same name. The keyboard's own name is the `keyboard` attribute.
+
+The table is stored in `.build/keyboard_attributes.json`. When the keyboard index or any file the info.json data is built from changes, only the keyboards whose `info_json_digest()` changed are looked at again.
+"""
+import json
+import logging
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+from milc import cli
+
+from qmk.cache import cache_enabled, file_stat_key, library_digest, write_json_atomic
+from qmk.constants import BUILD_DIR
+from qmk.info import info_json, info_json_digest, info_json_input_files
+from qmk.keyboard import config_h, rules_mk
+from qmk.keyboard_index import KEYBOARD_INDEX, keyboard_index
+
+KEYBOARD_ATTRIBUTES = 'keyboard_attributes'
+KEYBOARD_ATTRIBUTES_FILE = Path(BUILD_DIR) / 'keyboard_attributes.json'
+KEYBOARD_ATTRIBUTES_VERSION = 1
+
+# info.json keys holding dictionaries keyed by name, of which only the names are kept
+_named_info_keys = ('layouts', 'layout_aliases')
+
+# The table for this process, loaded or built the first time it is needed
+_keyboard_attributes = None
+
+
+@contextmanager
+def _console_log_hidden():
+    """Keep log messages off the console while the info.json data of many keyboards is built.
+
+    The messages still reach handlers attached to `cli.log`, so they are stored in the info.json cache and shown by `qmk info`.
+    """
+    propagate = cli.log.propagate
+    null_handler = logging.NullHandler()
+    cli.log.propagate = False
+
+    # Without a handler of its own, `cli.log` would fall back to `logging.lastResort` and print anyway
+    cli.log.addHandler(null_handler)
+
+    try:
+        yield
+
+    finally:
+        cli.log.removeHandler(null_handler)
+        cli.log.propagate = propagate
+
+
+def _flatten(data, prefix, attributes):
+    """Add the values in `data` to `attributes`, joining nested keys with dots.
+
+    Lists are kept when they only hold plain values, and left out otherwise.
+    """
+    for key, value in data.items():
+        name = f'{prefix}{key}'
+
+        if key in _named_info_keys and isinstance(value, dict):
+            attributes[name] = sorted(value)
+
+        elif isinstance(value, dict):
+            _flatten(value, f'{name}.', attributes)
+
+        elif isinstance(value, list):
+            if all(isinstance(item, (str, int, float, bool)) for item in value):
+                attributes[name] = value
+
+        else:
+            attributes[name] = value
+
+
+def _build_attributes(keyboard):
+    """Returns the attributes of a single keyboard.
+    """
+    attributes = {}
+    _flatten(info_json(keyboard), '', attributes)
+
+    for name, value in config_h(keyboard).items():
+        attributes.setdefault(name, value)
+
+    attributes.update(rules_mk(keyboard))
+    attributes['keyboard'] = keyboard
+
+    return attributes
+
+
+def _input_files(keyboards):
+    """Returns the files the info.json data of `keyboards` is built from, with their `(mtime, size)`, or None for files that do not exist.
+    """
+    files = {}
+
+    for keyboard in keyboards:
+        files.update((str(path), None) for path in info_json_input_files(keyboard))
+
+    return {path: file_stat_key(path) for path in sorted(files)}
+
+
+def _table_is_current(table):
+    """Returns True if nothing the attributes in `table` were built from has changed.
+    """
+    if table.get('version') != KEYBOARD_ATTRIBUTES_VERSION or table.get('library') != library_digest() or table.get('keyboard_index') != keyboard_index()['generation']:
+        return False
+
+    for path, stat_key in table['files'].items():
+        try:
+            stat = os.stat(path)
+
+        except OSError:
+            if stat_key is not None:
+                return False
+
+        else:
+            if stat_key is None or [stat.st_mtime_ns, stat.st_size] != stat_key:
+                return False
+
+    return True
+
+
+def _build_table(previous):
+    """Returns a new attribute table, reusing the entries of `previous` for keyboards whose inputs did not change.
+    """
+    keyboards = sorted(keyboard_index()['keyboards'])
+    previous_keyboards = previous.get('keyboards', {}) if previous.get('version') == KEYBOARD_ATTRIBUTES_VERSION else {}
+    table = {'version': KEYBOARD_ATTRIBUTES_VERSION, 'library': library_digest(), 'keyboard_index': keyboard_index()['generation'], 'files': _input_files(keyboards), 'keyboards': {}}
+
+    with _console_log_hidden():
+        for keyboard in keyboards:
+            digest = info_json_digest(keyboard)
+            entry = previous_keyboards.get(keyboard)
+
+            if not entry or entry['digest'] != digest:
+                entry = {'digest': digest, 'attributes': _build_attributes(keyboard)}
+
+            table['keyboards'][keyboard] = entry
+
+    # JSON can't hold tuples as keys, so stat keys are stored as lists and compared that way
+    table['files'] = {path: list(stat_key) if stat_key else None for path, stat_key in table['files'].items()}
+
+    return table
+
+
+def keyboard_attributes():
+    """Returns a dictionary mapping every keyboard to a dictionary of its attributes.
+
+    The returned dictionaries are shared and must not be modified.
+    """
+    global _keyboard_attributes
+
+    use_cache = cache_enabled(KEYBOARD_ATTRIBUTES) and cache_enabled(KEYBOARD_INDEX)
+
+    if _keyboard_attributes is None:
+        table = {}
+
+        if use_cache:
+            try:
+                table = json.loads(KEYBOARD_ATTRIBUTES_FILE.read_text(encoding='utf-8'))
+
+            except (OSError, ValueError):
+                pass
+
+        if not table or not _table_is_current(table):
+            table = _build_table(table)
+
+            if use_cache and table['keyboards']:
+                write_json_atomic(KEYBOARD_ATTRIBUTES_FILE, table)
+
+        _keyboard_attributes = {keyboard: entry['attributes'] for keyboard, entry in table['keyboards'].items()}
+
+    return _keyboard_attributes
@@ -0,0 +1,301 @@
+"""Filter expressions for selecting keyboards by their attributes, as used by `qmk multibuild --filter`.
+
+A filter is evaluated against the attributes of one keyboard from `qmk.keyboard_attributes`. The grammar is:
+
+    filter     := or_expr
+    or_expr    := and_expr ('or' and_expr)*
+    and_expr   := not_expr ('and' not_expr)*
+    not_expr   := 'not' not_expr | '(' or_expr ')' | comparison
+    comparison := NAME (OP VALUE | ['not'] 'in' '(' VALUE (',' VALUE)* ')')?
+    OP         := '=' | '==' | '!=' | '<' | '<=' | '>' | '>='
+
+A NAME on its own is true when the attribute is set to something other than a false value such as `no`, `false`, `off` or `0`. A NAME that contains `/` or a glob character is matched against the keyboard's name instead, so `planck/*` selects every planck.
+
+Values are words or quoted strings. Equality ignores case, treats `yes`/`on`/`true` and `no`/`off`/`false` as the same value, compares numbers by value (`0x10 == 16`) and matches globs such as `STM32F4*`. An attribute holding a list matches when any of its items does. An attribute the keyboard does not have never equals anything.
+"""
+import re
+from fnmatch import fnmatchcase
+
+from qmk.errors import FilterSyntaxError
+
+_token_re = re.compile(r'''
+    (?P<space>\s+)
+    | (?P<punct>[(),])
+    | (?P<op>==|!=|<=|>=|=|<|>)
+    | (?P<string>"[^"]*"|'[^']*')
+    | (?P<word>[^\s(),=!<>'"]+)
+    | (?P<other>.)
+''', re.VERBOSE)
+
+_keywords = ('and', 'or', 'not', 'in')
+_glob_chars = ('*', '?', '[')
+_true_words = ('true', 'yes', 'on')
+_false_words = ('false', 'no', 'off')
+
+
+def _tokenize(text):
+    """Returns the `(kind, value, position)` tokens of a filter.
+
+    Punctuation and keywords are returned as their own kind, unless they are quoted.
+    """
+    tokens = []
+
+    for match in _token_re.finditer(text):
+        kind, value = match.lastgroup, match.group()
+
+        if kind == 'space':
+            continue
+
+        if kind == 'other':
+            raise FilterSyntaxError(f"Unexpected {value!r} at position {match.start() + 1} in filter {text!r}.")
+
+        if kind == 'string':
+            value = value[1:-1]
+
+        elif kind == 'punct' or (kind == 'word' and value.lower() in _keywords):
+            kind = value = value.lower()
+
+        tokens.append((kind, value, match.start()))
+
+    return tokens
+
+
+def _normalize(value):
+    """Returns `value` as a lowercase string, with every spelling of true and false made the same.
+    """
+    value = str(value).strip().lower()
+
+    if value in _true_words:
+        return 'true'
+
+    if value in _false_words:
+        return 'false'
+
+    return value
+
+
+def _number(value):
+    """Returns `value` as a number, or None if it is not one.
+    """
+    if isinstance(value, bool):
+        return None
+
+    if isinstance(value, (int, float)):
+        return value
+
+    try:
+        return int(str(value).strip(), 0)
+
+    except ValueError:
+        pass
+
+    try:
+        return float(value)
+
+    except ValueError:
+        return None
+
+
+def _equals(actual, expected):
+    """Returns True if the attribute value `actual` matches the filter value `expected`.
+    """
+    actual_number, expected_number = _number(actual), _number(expected)
+
+    if actual_number is not None and expected_number is not None:
+        return actual_number == expected_number
+
+    actual, expected = _normalize(actual), _normalize(expected)
+
+    if any(char in expected for char in _glob_chars):
+        return fnmatchcase(actual, expected)
+
+    return actual == expected
+
+
+def _less_than(actual, expected):
+    """Returns True if the attribute value `actual` sorts before the filter value `expected`.
+
+    Numbers are compared by value, and anything else as lowercase strings.
+    """
+    actual_number, expected_number = _number(actual), _number(expected)
+
+    if actual_number is not None and expected_number is not None:
+        return actual_number < expected_number
+
+    return _normalize(actual) < _normalize(expected)
+
+
+_comparisons = {
+    '<': _less_than,
+    '<=': lambda actual, expected: _less_than(actual, expected) or _equals(actual, expected),
+    '>': lambda actual, expected: not (_less_than(actual, expected) or _equals(actual, expected)),
+    '>=': lambda actual, expected: not _less_than(actual, expected),
+}
+
+
+def _values(attributes, name):
+    """Returns the values of attribute `name`, as a list, or None if the keyboard does not have it.
+    """
+    if name not in attributes or attributes[name] is None:
+        return None
+
+    value = attributes[name]
+
+    return value if isinstance(value, list) else [value]
+
+
+def is_true(value):
+    """Returns True if an attribute value means the attribute is turned on.
+    """
+    if isinstance(value, list):
+        return bool(value)
+
+    if value is None or value is False:
+        return False
+
+    return str(value).strip().lower() not in (*_false_words, '0', '')
+
+
+class _Parser:
+    """A recursive descent parser that turns a filter into a function of a keyboard's attributes.
+    """
+    def __init__(self, text):
+        self.text = text
+        self.tokens = _tokenize(text)
+        self.index = 0
+
+    def error(self, expected):
+        if self.index < len(self.tokens):
+            _, value, position = self.tokens[self.index]
+            found = f'{value!r} at position {position + 1}'
+        else:
+            found = 'the end'
+
+        return FilterSyntaxError(f'Expected {expected} but found {found} in filter {self.text!r}.')
+
+    def peek(self):
+        return self.tokens[self.index][0] if self.index < len(self.tokens) else None
+
+    def take(self, *kinds, expected=None):
+        """Returns the value of the next token, which must be one of `kinds`.
+        """
+        if self.peek() not in kinds:
+            raise self.error(expected or ' or '.join(repr(kind) for kind in kinds))
+
+        value = self.tokens[self.index][1]
+        self.index += 1
+
+        return value
+
+    def value(self):
+        return self.take('word', 'string', expected='a value')
+
+    def parse(self):
+        if not self.tokens:
+            raise FilterSyntaxError('The filter is empty.')
+
+        expression = self.or_expr()
+
+        if self.peek() is not None:
+            raise self.error("'and', 'or' or the end")
+
+        return expression
+
+    def or_expr(self):
+        terms = [self.and_expr()]
+
+        while self.peek() == 'or':
+            self.take('or')
+            terms.append(self.and_expr())
+
+        return terms[0] if len(terms) == 1 else lambda attributes: any(term(attributes) for term in terms)
+
+    def and_expr(self):
+        terms = [self.not_expr()]
+
+        while self.peek() == 'and':
+            self.take('and')
+            terms.append(self.not_expr())
+
+        return terms[0] if len(terms) == 1 else lambda attributes: all(term(attributes) for term in terms)
+
+    def not_expr(self):
+        if self.peek() == 'not':
+            self.take('not')
+            term = self.not_expr()
+
+            return lambda attributes: not term(attributes)
+
+        if self.peek() == '(':
+            self.take('(')
+            term = self.or_expr()
+            self.take(')')
+
+            return term
+
+        return self.comparison()
+
+    def in_list(self):
+        self.take('(')
+        expected = [self.value()]
+
+        while self.peek() == ',':
+            self.take(',')
+            expected.append(self.value())
+
+        self.take(')')
+
+        return expected
+
+    @staticmethod
+    def matches_any(name, expected, negate=False):
+        """Returns a function that is True if any value of attribute `name` equals any of `expected`, or the opposite when `negate` is set.
+
+        An attribute the keyboard does not have equals nothing.
+        """
+        def matches(attributes):
+            values = _values(attributes, name) or []
+
+            return any(_equals(value, item) for value in values for item in expected) != negate
+
+        return matches
+
+    def comparison(self):
+        name = self.take('word', 'string', expected='an attribute name')
+
+        if self.peek() == 'op':
+            op = self.take('op')
+            expected = [self.value()]
+
+            if op == '!=':
+                return self.matches_any(name, expected, negate=True)
+
+            if op in ('=', '=='):
+                return self.matches_any(name, expected)
+
+            compare = _comparisons[op]
+
+            return lambda attributes: any(compare(value, expected[0]) for value in _values(attributes, name) or [])
+
+        if self.peek() in ('in', 'not'):
+            negate = self.peek() == 'not'
+
+            if negate:
+                self.take('not')
+
+            self.take('in')
+
+            return self.matches_any(name, self.in_list(), negate)
+
+        if '/' in name or any(char in name for char in _glob_chars):
+            return lambda attributes: fnmatchcase(attributes.get('keyboard', ''), name)
+
+        return lambda attributes: is_true(attributes.get(name))
+
+
+def parse_filter(text):
+    """Returns a function that takes a keyboard's attributes and returns True if they match the filter `text`.
+
+    Raises FilterSyntaxError when `text` is not a valid filter.
+    """
+    return _Parser(text).parse()
@@ -0,0 +1,175 @@
+"""An index of every keyboard folder, so that finding keyboards does not require walking the keyboards tree.
+
+The index is built with a single walk over `keyboards/` and stored in `.build/keyboard_index.json`. It is rebuilt when the mtime of any directory it walked changes, which happens when anything in that directory is added, removed or renamed, when any rules.mk file changes, or when the qmk python library changes.
+"""
+import json
+import os
+import posixpath
+import time
+from pathlib import Path
+
+from qmk.cache import cache_enabled, file_stat_key, library_digest, write_json_atomic
+from qmk.constants import BUILD_DIR, QMK_FIRMWARE
+from qmk.makefile import parse_rules_mk_file
+
+KEYBOARD_INDEX = 'keyboard_index'
+KEYBOARD_INDEX_FILE = Path(BUILD_DIR) / 'keyboard_index.json'
+KEYBOARD_INDEX_VERSION = 1
+
+# The index for this process, loaded or built the first time it is needed
+_keyboard_index = None
+
+
+def _scan_keyboards(keyboards_dir):
+    """Walk `keyboards_dir` once, without descending into keymaps.
+
+    Returns:
+        a tuple of (directory mtimes, rules.mk `[mtime, size]` lists, keymap names for each folder with a keymaps directory)
+    """
+    directories = {}
+    rules_mk_files = {}
+    keymaps = {}
+    pending = ['']
+
+    while pending:
+        folder = pending.pop()
+        folder_path = os.path.join(keyboards_dir, folder)
+        directories[folder] = os.stat(folder_path).st_mtime_ns
+
+        with os.scandir(folder_path) as entries:
+            for entry in entries:
+                name = f'{folder}/{entry.name}' if folder else entry.name
+
+                if entry.is_dir():
+                    if entry.name == 'keymaps':
+                        directories[name] = entry.stat().st_mtime_ns
+
+                        with os.scandir(entry.path) as keymap_entries:
+                            keymaps[folder] = sorted(keymap.name for keymap in keymap_entries if keymap.is_dir())
+
+                    else:
+                        pending.append(name)
+
+                elif entry.name == 'rules.mk' and folder:
+                    stat = entry.stat()
+                    rules_mk_files[name] = [stat.st_mtime_ns, stat.st_size]
+
+    return directories, rules_mk_files, keymaps
+
+
+def _build_keyboard_index():
+    """Walk the keyboards tree and return a new index.
+    """
+    keyboards_dir = QMK_FIRMWARE / 'keyboards'
+    index = {'version': KEYBOARD_INDEX_VERSION, 'library': library_digest(), 'generation': time.time_ns(), 'directories': {}, 'rules_mk': {}, 'keymaps': {}, 'keyboards': {}}
+
+    if not keyboards_dir.is_dir():
+        return index
+
+    index['directories'], index['rules_mk'], index['keymaps'] = _scan_keyboards(keyboards_dir)
+    folders = sorted(rules_mk[:-len('/rules.mk')] for rules_mk in index['rules_mk'])
+    default_folders = {}
+
+    for folder in folders:
+        default_folders[folder] = parse_rules_mk_file(keyboards_dir / folder / 'rules.mk').get('DEFAULT_FOLDER')
+
+    for folder in folders:
+        # Follow DEFAULT_FOLDER the same way as `qmk.keyboard.resolve_keyboard()`
+        keyboard = folder
+        seen = {folder}
+
+        while default_folders.get(posixpath.normpath(keyboard)) and keyboard != default_folders[posixpath.normpath(keyboard)]:
+            keyboard = default_folders[posixpath.normpath(keyboard)]
+
+            if keyboard in seen:
+                break
+
+            seen.add(keyboard)
+
+        # Collect the rules.mk files and keymaps along the resolved folder's path
+        rules_mk = []
+        keymaps = []
+        parent = ''
+
+        for part in Path(keyboard).parts:
+            parent = f'{parent}/{part}' if parent else part
+
+            if f'{parent}/rules.mk' in index['rules_mk']:
+                rules_mk.append(f'keyboards/{parent}/rules.mk')
+
+            keymaps.extend(f'keyboards/{parent}/keymaps/{keymap}' for keymap in index['keymaps'].get(parent, []))
+
+        index['keyboards'][folder] = {
+            'folder': keyboard,
+            'default_folder': default_folders[folder],
+            'rules_mk': rules_mk,
+            'keymaps': keymaps,
+        }
+
+    return index
+
+
+def _index_is_current(index):
+    """Returns True if nothing in the keyboards tree has changed since `index` was built.
+    """
+    if index.get('version') != KEYBOARD_INDEX_VERSION or index.get('library') != library_digest():
+        return False
+
+    # We avoid pathlib here because this is performance critical code.
+    keyboards_dir = str(QMK_FIRMWARE / 'keyboards')
+
+    for directory, mtime in index['directories'].items():
+        try:
+            if os.stat(os.path.join(keyboards_dir, directory)).st_mtime_ns != mtime:
+                return False
+
+        except OSError:
+            return False
+
+    for rules_mk, stat_key in index['rules_mk'].items():
+        if file_stat_key(os.path.join(keyboards_dir, rules_mk)) != tuple(stat_key):
+            return False
+
+    return True
+
+
+def keyboard_index():
+    """Returns the keyboard index, loading it from `.build` or rebuilding it when the keyboards tree has changed.
+
+    The returned dictionary is shared and must not be modified. Its `keymaps` key maps every folder with a keymaps directory to the names in it, and its `keyboards` key maps every folder with a rules.mk to:
+
+        folder: the folder it builds, after following DEFAULT_FOLDER
+        default_folder: the DEFAULT_FOLDER set in its own rules.mk, or None
+        rules_mk: the rules.mk files along the path to `folder`
+        keymaps: the keymap directories along the path to `folder`
+    """
+    global _keyboard_index
+
+    if _keyboard_index is None:
+        if cache_enabled(KEYBOARD_INDEX):
+            try:
+                _keyboard_index = json.loads(KEYBOARD_INDEX_FILE.read_text(encoding='utf-8'))
+
+            except (OSError, ValueError):
+                pass
+
+        if _keyboard_index is None or not _index_is_current(_keyboard_index):
+            _keyboard_index = _build_keyboard_index()
+
+            if cache_enabled(KEYBOARD_INDEX) and _keyboard_index['keyboards']:
+                write_json_atomic(KEYBOARD_INDEX_FILE, _keyboard_index)
+
+    return _keyboard_index
+
+
+def indexed_name(keyboard_name):
+    """Returns `keyboard_name` as it would appear in the index, or None if the index can not answer for this name.
+
+    Only plain relative names such as `planck/rev6` can be answered from the index. Anything else has to be checked on disk.
+    """
+    name = Path(keyboard_name).as_posix()
+
+    if name in ('', '.') or name.startswith('/') or '..' in name.split('/') or 'keymaps' in name.split('/'):
+        return None
+
+    return name
@@ -2,18 +2,20 @@
 """
 import json
 import sys
+from fnmatch import fnmatchcase
 from pathlib import Path
 from subprocess import DEVNULL
 
 import argcomplete
 from milc import cli
-from pygments.lexers.c_cpp import CLexer
-from pygments.token import Token
-from pygments import lex
 
 import qmk.path
 from qmk.keyboard import find_keyboard_from_dir, rules_mk
-from qmk.errors import CppError
+from qmk.keyboard_index import keyboard_index
+from qmk.keymap_index import keymap_dirs, keymap_index
+from qmk.c_keymap_lexer import iter_keymap_tokens
+from qmk.c_preprocessor import preprocess
+from qmk.errors import CLexerUnsupportedError, CppError, CppUnsupportedError
 
 # The `keymap.c` template to use when a keyboard doesn't have its own
 DEFAULT_KEYMAP_C = """#include QMK_KEYBOARD_H
@@ -156,6 +158,17 @@ def is_keymap_dir(keymap, c=True, json=True, additional_files=None):
             return True
 
 
+def _is_indexed_keymap(keymap, c=True, json=True, additional_files=None):
+    """Return True if a keymap index entry has the files `is_keymap_dir()` looks for.
+    """
+    files = keymap['files']
+
+    if (c and 'keymap.c' in files) or (json and 'keymap.json' in files):
+        return all(file in files for file in additional_files or ())
+
+    return False
+
+
 def generate_json(keymap, keyboard, layout, layers):
     """Returns a `keymap.json` for the specified keyboard, layout, and layers.
 
@@ -266,12 +279,47 @@ def write(keyboard, keymap, layout, layers):
     return write_file(keymap_file, keymap_content)
 
 
+def _locate_indexed_keymap(keyboard, keymap):
+    """Returns the path to a keymap for a keyboard in the keymap index, following the same rules as `locate_keymap()`.
+    """
+    keymaps = keymap_index()['keymaps']
+    keymap_path = None
+    checked_dirs = ''
+
+    # Check the keyboard folder first, last match wins
+    for dir in keyboard.split('/'):
+        checked_dirs = '/'.join((checked_dirs, dir)) if checked_dirs else dir
+        keymap_dir = f'keyboards/{checked_dirs}/keymaps/{keymap}'
+
+        if keymap_dir in keymaps:
+            if 'keymap.c' in keymaps[keymap_dir]['files']:
+                keymap_path = Path(keymap_dir, 'keymap.c')
+            if 'keymap.json' in keymaps[keymap_dir]['files']:
+                keymap_path = Path(keymap_dir, 'keymap.json')
+
+    if keymap_path:
+        return keymap_path
+
+    # Check community layouts as a fallback
+    for layout in keymap_index()['layouts'][keyboard] or []:
+        community_layout = f'layouts/community/{layout}/{keymap}'
+
+        if community_layout in keymaps:
+            if 'keymap.json' in keymaps[community_layout]['files']:
+                return Path(community_layout, 'keymap.json')
+            if 'keymap.c' in keymaps[community_layout]['files']:
+                return Path(community_layout, 'keymap.c')
+
+
 def locate_keymap(keyboard, keymap):
     """Returns the path to a keymap for a specific keyboard.
     """
     if not qmk.path.is_keyboard(keyboard):
         raise KeyError('Invalid keyboard: ' + repr(keyboard))
 
+    if keyboard in keymap_index()['layouts'] and '/' not in keymap:
+        return _locate_indexed_keymap(keyboard, keymap)
+
     # Check the keyboard folder first, last match wins
     checked_dirs = ''
     keymap_path = ''
@@ -305,6 +353,54 @@ def locate_keymap(keyboard, keymap):
                     return community_layout / 'keymap.c'
 
 
+def _keymap_names(keyboard):
+    """Returns the names of the keymap folders `locate_keymap()` looks in for a keyboard.
+
+    Unlike `list_keymaps()`, this includes the keymaps of keyboards that have no rules.mk data, which can still be built.
+    """
+    if keyboard not in keymap_index()['layouts']:
+        return set(list_keymaps(keyboard))
+
+    folder_keymaps = keyboard_index()['keymaps']
+    community = keymap_index()['community']
+    names = set()
+    parent = ''
+
+    for part in keyboard.split('/'):
+        parent = f'{parent}/{part}' if parent else part
+        names.update(folder_keymaps.get(parent, []))
+
+    for layout in keymap_index()['layouts'][keyboard] or []:
+        names.update(community.get(layout, []))
+
+    return names
+
+
+def locate_keymaps(keyboard, patterns=('*',), community=True):
+    """Returns a dictionary mapping the names of the keymaps for a keyboard that match any of `patterns` to their paths, as `locate_keymap()` finds them.
+
+    Args:
+        keyboard
+            The keyboards full name with vendor and revision if necessary, example: clueboard/66/rev3
+
+        patterns
+            A sequence of keymap names and globs, example: `['default', 'via*']`
+
+        community
+            When False, keymaps that are only found in community layouts are left out, unless they are named in `patterns` rather than matched by a glob.
+    """
+    keymaps = {}
+
+    for name in sorted(_keymap_names(keyboard)):
+        if name in patterns or any(fnmatchcase(name, pattern) for pattern in patterns):
+            keymap_path = locate_keymap(keyboard, name)
+
+            if keymap_path and (community or name in patterns or Path(keymap_path).parts[0] != 'layouts'):
+                keymaps[name] = keymap_path
+
+    return keymaps
+
+
 def list_keymaps(keyboard, c=True, json=True, additional_files=None, fullpath=False):
     """List the available keymaps for a keyboard.
 
@@ -327,6 +423,16 @@ def list_keymaps(keyboard, c=True, json=True, additional_files=None, fullpath=Fa
     Returns:
         a sorted list of valid keymap names.
     """
+    if keyboard in keymap_index()['layouts']:
+        keymaps = keymap_index()['keymaps']
+        names = set()
+
+        for keymap_dir in keymap_dirs(keyboard):
+            if _is_indexed_keymap(keymaps[keymap_dir], c, json, additional_files):
+                names.add(Path(keymap_dir) if fullpath else keymaps[keymap_dir]['name'])
+
+        return sorted(names)
+
     # parse all the rules.mk files for the keyboard
     rules = rules_mk(keyboard)
     names = set()
@@ -361,18 +467,22 @@ def list_keymaps(keyboard, c=True, json=True, additional_files=None, fullpath=Fa
     return sorted(names)
 
 
-def _c_preprocess(path, stdin=DEVNULL):
+def _c_preprocess(path, stdin=DEVNULL, text=None):
     """ Run a file through the C pre-processor
 
     Args:
         path: path of the keymap.c file (set None to use stdin)
         stdin: stdin pipe (e.g. sys.stdin)
+        text: contents to pass to the pre-processor on stdin, instead of reading `stdin`
 
     Returns:
         the stdout of the pre-processor
     """
     cmd = ['cpp', str(path)] if path else ['cpp']
-    pre_processed_keymap = cli.run(cmd, stdin=stdin)
+    if text is None:
+        pre_processed_keymap = cli.run(cmd, stdin=stdin)
+    else:
+        pre_processed_keymap = cli.run(cmd, stdin=None, input=text)
     if 'fatal error' in pre_processed_keymap.stderr:
         for line in pre_processed_keymap.stderr.split('\n'):
             if 'fatal error' in line:
@@ -380,7 +490,57 @@ def _c_preprocess(path, stdin=DEVNULL):
     return pre_processed_keymap.stdout
 
 
-def _get_layers(keymap):  # noqa C901 : until someone has a good idea how to simplify/split up this code
+def _preprocess_keymap_c(path, text=None, system_cpp=False):
+    """ Run a keymap.c file through the built-in C pre-processor, falling back to 'cpp' for anything it can't handle
+
+    Args:
+        path: path of the keymap.c file (set None for stdin)
+        text: the contents of the keymap.c file (set None to read it from path)
+        system_cpp: if True, always use 'cpp'
+
+    Returns:
+        the output of the pre-processor
+    """
+    if not system_cpp:
+        try:
+            if text is None:
+                text = path.read_text(encoding='utf-8')
+
+            return preprocess(text, path)
+
+        except UnicodeDecodeError as e:
+            cli.log.info('%s: %s, falling back to cpp.', path, e)
+
+        except CppUnsupportedError as e:
+            cli.log.info('%s: %s, falling back to cpp.', path or '<stdin>', e.message)
+
+    if path:
+        return _c_preprocess(path)
+
+    return _c_preprocess(None, text=text)
+
+
+def _pygments_tokens(keymap):
+    """ Split a keymap.c file into tokens with pygments
+
+    Args:
+        keymap: the content of the keymap.c file
+
+    Returns:
+        an iterator of (kind, text) tuples, like qmk.c_keymap_lexer.iter_keymap_tokens()
+    """
+    # pygments is slow to import and only needed when the keymap.c lexer gives up
+    from pygments.lexers.c_cpp import CLexer
+    from pygments.token import Token
+    from pygments import lex
+
+    kinds = {Token.Name: 'name', Token.Keyword: 'keyword', Token.Keyword.Type: 'type', Token.Punctuation: 'punct', Token.Literal.Number.Integer: 'integer'}
+
+    for token_type, value in lex(keymap, CLexer()):
+        yield kinds.get(token_type, 'other'), value
+
+
+def _get_layers(keymap):
     """ Find the layers in a keymap.c file.
 
     Args:
@@ -389,37 +549,54 @@ def _get_layers(keymap):  # noqa C901 : until someone has a good idea how to sim
     Returns:
         a dictionary containing the parsed keymap
     """
+    try:
+        return _parse_layers(iter_keymap_tokens(keymap))
+
+    except CLexerUnsupportedError as e:
+        cli.log.debug('Lexing keymap.c with pygments: %s', e.message)
+        return _parse_layers(_pygments_tokens(keymap))
+
+
+def _parse_layers(tokens):  # noqa C901 : until someone has a good idea how to simplify/split up this code
+    """ Find the layers in the tokens of a keymap.c file.
+
+    Args:
+        tokens: (kind, text) tuples for the tokens of the keymap.c file
+
+    Returns:
+        a list of layers
+    """
     layers = list()
     opening_braces = '({['
     closing_braces = ')}]'
     keymap_certainty = brace_depth = 0
     is_keymap = is_layer = is_adv_kc = False
     layer = dict(name=False, layout=False, keycodes=list())
-    for line in lex(keymap, CLexer()):
-        if line[0] is Token.Name:
+    for kind, value in tokens:
+        if kind == 'name':
             if is_keymap:
                 # If we are inside the keymap array
                 # we know the keymap's name and the layout macro will come,
                 # followed by the keycodes
                 if not layer['name']:
-                    if line[1].startswith('LAYOUT') or line[1].startswith('KEYMAP'):
+                    if value.startswith('LAYOUT') or value.startswith('KEYMAP'):
                         # This can happen if the keymap array only has one layer,
                         # for macropads and such
                         layer['name'] = '0'
-                        layer['layout'] = line[1]
+                        layer['layout'] = value
                     else:
-                        layer['name'] = line[1]
+                        layer['name'] = value
                 elif not layer['layout']:
-                    layer['layout'] = line[1]
+                    layer['layout'] = value
                 elif is_layer:
                     # If we are inside a layout macro,
                     # collect all keycodes
-                    if line[1] == '_______':
+                    if value == '_______':
                         kc = 'KC_TRNS'
-                    elif line[1] == 'XXXXXXX':
+                    elif value == 'XXXXXXX':
                         kc = 'KC_NO'
                     else:
-                        kc = line[1]
+                        kc = value
                     if is_adv_kc:
                         # If we are inside an advanced keycode
                         # collect everything and hope the user
@@ -433,61 +610,61 @@ def _get_layers(keymap):  # noqa C901 : until someone has a good idea how to sim
         #
         # Only if we've found all 6 keywords in this specific order
         # can we know for sure that we are inside the keymaps array
-            elif line[1] == 'PROGMEM' and keymap_certainty == 2:
+            elif value == 'PROGMEM' and keymap_certainty == 2:
                 keymap_certainty = 3
-            elif line[1] == 'keymaps' and keymap_certainty == 3:
+            elif value == 'keymaps' and keymap_certainty == 3:
                 keymap_certainty = 4
-            elif line[1] == 'MATRIX_ROWS' and keymap_certainty == 4:
+            elif value == 'MATRIX_ROWS' and keymap_certainty == 4:
                 keymap_certainty = 5
-            elif line[1] == 'MATRIX_COLS' and keymap_certainty == 5:
+            elif value == 'MATRIX_COLS' and keymap_certainty == 5:
                 keymap_certainty = 6
-        elif line[0] is Token.Keyword:
-            if line[1] == 'const' and keymap_certainty == 0:
+        elif kind == 'keyword':
+            if value == 'const' and keymap_certainty == 0:
                 keymap_certainty = 1
-        elif line[0] is Token.Keyword.Type:
-            if line[1] == 'uint16_t' and keymap_certainty == 1:
+        elif kind == 'type':
+            if value == 'uint16_t' and keymap_certainty == 1:
                 keymap_certainty = 2
-        elif line[0] is Token.Punctuation:
-            if line[1] in opening_braces:
+        elif kind == 'punct':
+            if value in opening_braces:
                 brace_depth += 1
                 if is_keymap:
                     if is_layer:
                         # We found the beginning of a non-basic keycode
                         is_adv_kc = True
-                        layer['keycodes'][-1] += line[1]
-                    elif line[1] == '(' and brace_depth == 2:
+                        layer['keycodes'][-1] += value
+                    elif value == '(' and brace_depth == 2:
                         # We found the beginning of a layer
                         is_layer = True
-                elif line[1] == '{' and keymap_certainty == 6:
+                elif value == '{' and keymap_certainty == 6:
                     # We found the beginning of the keymaps array
                     is_keymap = True
-            elif line[1] in closing_braces:
+            elif value in closing_braces:
                 brace_depth -= 1
                 if is_keymap:
                     if is_adv_kc:
-                        layer['keycodes'][-1] += line[1]
+                        layer['keycodes'][-1] += value
                         if brace_depth == 2:
                             # We found the end of a non-basic keycode
                             is_adv_kc = False
-                    elif line[1] == ')' and brace_depth == 1:
+                    elif value == ')' and brace_depth == 1:
                         # We found the end of a layer
                         is_layer = False
                         layers.append(layer)
                         layer = dict(name=False, layout=False, keycodes=list())
-                    elif line[1] == '}' and brace_depth == 0:
+                    elif value == '}' and brace_depth == 0:
                         # We found the end of the keymaps array
                         is_keymap = False
                         keymap_certainty = 0
             elif is_adv_kc:
                 # Advanced keycodes can contain other punctuation
                 # e.g.: MT(MOD_LCTL | MOD_LSFT, KC_ESC)
-                layer['keycodes'][-1] += line[1]
+                layer['keycodes'][-1] += value
 
-        elif line[0] is Token.Literal.Number.Integer and is_keymap and not is_adv_kc:
+        elif kind == 'integer' and is_keymap and not is_adv_kc:
             # If the pre-processor finds the 'meaning' of the layer names,
             # they will be numbers
             if not layer['name']:
-                layer['name'] = line[1]
+                layer['name'] = value
 
         else:
             # We only care about
@@ -495,12 +672,12 @@ def _get_layers(keymap):  # noqa C901 : until someone has a good idea how to sim
             # are inside an advanced keycode
             # e.g.: MT(MOD_LCTL | MOD_LSFT, KC_ESC)
             if is_adv_kc:
-                layer['keycodes'][-1] += line[1]
+                layer['keycodes'][-1] += value
 
     return layers
 
 
-def parse_keymap_c(keymap_file, use_cpp=True):
+def parse_keymap_c(keymap_file, use_cpp=True, system_cpp=False):
     """ Parse a keymap.c file.
 
     Currently only cares about the keymaps array.
@@ -510,17 +687,19 @@ def parse_keymap_c(keymap_file, use_cpp=True):
 
         use_cpp: if True, pre-process the file with the C pre-processor
 
+        system_cpp: if True, always pre-process with 'cpp' instead of the built-in pre-processor
+
     Returns:
         a dictionary containing the parsed keymap
     """
     if keymap_file == '-':
         if use_cpp:
-            keymap_file = _c_preprocess(None, sys.stdin)
+            keymap_file = _preprocess_keymap_c(None, sys.stdin.read(), system_cpp)
         else:
             keymap_file = sys.stdin.read()
     else:
         if use_cpp:
-            keymap_file = _c_preprocess(keymap_file)
+            keymap_file = _preprocess_keymap_c(Path(keymap_file), system_cpp=system_cpp)
         else:
             keymap_file = keymap_file.read_text(encoding='utf-8')
 
@@ -529,7 +708,7 @@ def parse_keymap_c(keymap_file, use_cpp=True):
     return keymap
 
 
-def c2json(keyboard, keymap, keymap_file, use_cpp=True):
+def c2json(keyboard, keymap, keymap_file, use_cpp=True, system_cpp=False):
     """ Convert keymap.c to keymap.json
 
     Args:
@@ -543,10 +722,12 @@ def c2json(keyboard, keymap, keymap_file, use_cpp=True):
 
         use_cpp: if True, pre-process the file with the C pre-processor
 
+        system_cpp: if True, always pre-process with 'cpp' instead of the built-in pre-processor
+
     Returns:
         a dictionary in keymap.json format
     """
-    keymap_json = parse_keymap_c(keymap_file, use_cpp)
+    keymap_json = parse_keymap_c(keymap_file, use_cpp, system_cpp)
 
     dirty_layers = keymap_json.pop('layers', None)
     keymap_json['layers'] = list()
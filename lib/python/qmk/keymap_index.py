@@ -0,0 +1,156 @@
+"""An index of every keymap under `keyboards/` and `layouts/community/`, so that keymap lookups do not need to touch the disk.
+
+The index is stored in `.build/keymap_index.json`. It is built from the keymap folders found by `qmk.keyboard_index`, and is rebuilt whenever the keyboard index is rebuilt or the mtime of any keymap directory changes.
+"""
+import json
+import os
+from pathlib import Path
+
+from qmk.cache import cache_enabled, library_digest, write_json_atomic
+from qmk.constants import BUILD_DIR, QMK_FIRMWARE
+from qmk.keyboard import rules_mk
+from qmk.keyboard_index import KEYBOARD_INDEX, keyboard_index
+
+KEYMAP_INDEX = 'keymap_index'
+KEYMAP_INDEX_FILE = Path(BUILD_DIR) / 'keymap_index.json'
+KEYMAP_INDEX_VERSION = 1
+
+# The index for this process, loaded or built the first time it is needed
+_keymap_index = None
+
+
+def _scan_keymap(keymap_dir, layout=None):
+    """Returns the mtime of `keymap_dir` and its index entry.
+    """
+    with os.scandir(QMK_FIRMWARE / keymap_dir) as entries:
+        files = sorted(entry.name for entry in entries if entry.is_file())
+
+    if 'keymap.json' in files:
+        keymap_type = 'json'
+    elif 'keymap.c' in files:
+        keymap_type = 'c'
+    else:
+        keymap_type = None
+
+    keymap = {
+        'name': keymap_dir.rsplit('/', 1)[-1],
+        'type': keymap_type,
+        'files': files,
+        'layout': layout,
+    }
+
+    return os.stat(QMK_FIRMWARE / keymap_dir).st_mtime_ns, keymap
+
+
+def _build_keymap_index():
+    """Scan every keymap directory and return a new index.
+    """
+    kb_index = keyboard_index()
+    index = {'version': KEYMAP_INDEX_VERSION, 'library': library_digest(), 'keyboard_index': kb_index['generation'], 'directories': {}, 'keymaps': {}, 'community': {}, 'layouts': {}}
+
+    for folder, names in kb_index['keymaps'].items():
+        for name in names:
+            keymap_dir = f'keyboards/{folder}/keymaps/{name}'
+            index['directories'][keymap_dir], index['keymaps'][keymap_dir] = _scan_keymap(keymap_dir)
+
+    community_dir = QMK_FIRMWARE / 'layouts' / 'community'
+
+    if community_dir.is_dir():
+        index['directories']['layouts/community'] = os.stat(community_dir).st_mtime_ns
+
+        with os.scandir(community_dir) as layouts:
+            for layout in layouts:
+                if not layout.is_dir():
+                    continue
+
+                layout_dir = f'layouts/community/{layout.name}'
+                index['directories'][layout_dir] = layout.stat().st_mtime_ns
+                index['community'][layout.name] = []
+
+                with os.scandir(layout.path) as keymaps:
+                    for keymap in sorted(keymaps, key=lambda entry: entry.name):
+                        if keymap.is_dir():
+                            keymap_dir = f'{layout_dir}/{keymap.name}'
+                            index['directories'][keymap_dir], index['keymaps'][keymap_dir] = _scan_keymap(keymap_dir, layout.name)
+                            index['community'][layout.name].append(keymap.name)
+
+    # Record which community layouts each keyboard supports, or None when it has no rules.mk data at all
+    for keyboard in kb_index['keyboards']:
+        rules = rules_mk(keyboard)
+        index['layouts'][keyboard] = rules.get('LAYOUTS', '').split() if rules else None
+
+    return index
+
+
+def _index_is_current(index):
+    """Returns True if no keymap directory has changed since `index` was built.
+    """
+    if index.get('version') != KEYMAP_INDEX_VERSION or index.get('library') != library_digest() or index.get('keyboard_index') != keyboard_index()['generation']:
+        return False
+
+    # We avoid pathlib here because this is performance critical code.
+    qmk_firmware = str(QMK_FIRMWARE)
+
+    for directory, mtime in index['directories'].items():
+        try:
+            if os.stat(os.path.join(qmk_firmware, directory)).st_mtime_ns != mtime:
+                return False
+
+        except OSError:
+            return False
+
+    return True
+
+
+def keymap_index():
+    """Returns the keymap index, loading it from `.build` or rebuilding it when a keymap has changed.
+
+    The returned dictionary is shared and must not be modified. It has these keys:
+
+        keymaps: maps every keymap directory to its `name`, `type` ('c', 'json' or None), regular `files` and community `layout`
+        community: maps each community layout to the names of its keymaps
+        layouts: maps every keyboard in the keyboard index to the community layouts it supports, or None if it has no rules.mk data
+    """
+    global _keymap_index
+
+    use_cache = cache_enabled(KEYMAP_INDEX) and cache_enabled(KEYBOARD_INDEX)
+
+    if _keymap_index is None:
+        if use_cache:
+            try:
+                _keymap_index = json.loads(KEYMAP_INDEX_FILE.read_text(encoding='utf-8'))
+
+            except (OSError, ValueError):
+                pass
+
+        if _keymap_index is None or not _index_is_current(_keymap_index):
+            _keymap_index = _build_keymap_index()
+
+            if use_cache and _keymap_index['keymaps']:
+                write_json_atomic(KEYMAP_INDEX_FILE, _keymap_index)
+
+    return _keymap_index
+
+
+def keymap_dirs(keyboard):
+    """Returns every directory that could hold a keymap for `keyboard`, which must be a folder in the keyboard index.
+
+    Directories in the keyboard's own folders come first, from `keyboards/` downwards, followed by the community layouts it supports.
+    """
+    layouts = keymap_index()['layouts'][keyboard]
+    folder_keymaps = keyboard_index()['keymaps']
+    community = keymap_index()['community']
+    keymap_dirs = []
+    parent = ''
+
+    if layouts is None:
+        return keymap_dirs
+
+    for part in keyboard.split('/'):
+        parent = f'{parent}/{part}' if parent else part
+        keymap_dirs.extend(f'keyboards/{parent}/keymaps/{name}' for name in folder_keymaps.get(parent, []))
+
+    for layout in layouts:
+        keymap_dirs.extend(f'layouts/community/{layout}/{name}' for name in community.get(layout, []))
+
+    return keymap_dirs
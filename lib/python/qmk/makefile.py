@@ -2,21 +2,18 @@
 """
 from pathlib import Path
 
+from qmk.cache import memoize_file
 
-def parse_rules_mk_file(file, rules_mk=None):
-    """Turn a rules.mk file into a dictionary.
 
-    Args:
-        file: path to the rules.mk file
-        rules_mk: already parsed rules.mk the new file should be merged with
+@memoize_file('rules_mk_files')
+def _rules_mk_assignments(file):
+    """Returns the `(operator, key, value)` assignments in a rules.mk file, in the order they appear.
 
-    Returns:
-        a dictionary with the file's content
+    The result is cached for as long as the file is unchanged, so it must not be modified.
     """
-    if not rules_mk:
-        rules_mk = {}
-
+    assignments = []
     file = Path(file)
+
     if file.exists():
         rules_mk_lines = file.read_text().split("\n")
 
@@ -33,19 +30,45 @@ def parse_rules_mk_file(file, rules_mk=None):
                 # Append
                 if '+=' in line:
                     key, value = line.split('+=', 1)
-                    if key.strip() not in rules_mk:
-                        rules_mk[key.strip()] = value.strip()
-                    else:
-                        rules_mk[key.strip()] += ' ' + value.strip()
+                    assignments.append(('+=', key.strip(), value.strip()))
                 # Set if absent
                 elif "?=" in line:
                     key, value = line.split('?=', 1)
-                    if key.strip() not in rules_mk:
-                        rules_mk[key.strip()] = value.strip()
+                    assignments.append(('?=', key.strip(), value.strip()))
                 else:
                     if ":=" in line:
                         line.replace(":", "")
                     key, value = line.split('=', 1)
-                    rules_mk[key.strip()] = value.strip()
+                    assignments.append(('=', key.strip(), value.strip()))
+
+    return assignments
+
+
+def parse_rules_mk_file(file, rules_mk=None):
+    """Turn a rules.mk file into a dictionary.
+
+    Args:
+        file: path to the rules.mk file
+        rules_mk: already parsed rules.mk the new file should be merged with
+
+    Returns:
+        a dictionary with the file's content
+    """
+    if not rules_mk:
+        rules_mk = {}
+
+    for operator, key, value in _rules_mk_assignments(file):
+        if operator == '+=':
+            if key not in rules_mk:
+                rules_mk[key] = value
+            else:
+                rules_mk[key] += ' ' + value
+
+        elif operator == '?=':
+            if key not in rules_mk:
+                rules_mk[key] = value
+
+        else:
+            rules_mk[key] = value
 
     return rules_mk
@@ -7,12 +7,18 @@ from pathlib import Path
 
 from qmk.constants import MAX_KEYBOARD_SUBFOLDERS, QMK_FIRMWARE
 from qmk.errors import NoSuchKeyboardError
+from qmk.keyboard_index import indexed_name, keyboard_index
 
 
 def is_keyboard(keyboard_name):
     """Returns True if `keyboard_name` is a keyboard we can compile.
     """
     if keyboard_name:
+        indexed_keyboard = indexed_name(keyboard_name)
+
+        if indexed_keyboard:
+            return indexed_keyboard in keyboard_index()['keyboards']
+
         keyboard_path = QMK_FIRMWARE / 'keyboards' / keyboard_name
         rules_mk = keyboard_path / 'rules.mk'
 
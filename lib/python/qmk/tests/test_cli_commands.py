@@ -1,4 +1,7 @@
+import json
+import os
 import platform
+import re
 from subprocess import DEVNULL
 
 from milc import cli
@@ -31,6 +34,37 @@ def check_returncode(result, expected=[0]):
     assert result.returncode in expected
 
 
+def check_imports(command, *args):
+    """Run a subcommand with `-X importtime` enabled and return the names of the modules it imported.
+    """
+    result = cli.run(['qmk', command, *args], stdin=DEVNULL, env={**os.environ, 'PYTHONPROFILEIMPORTTIME': '1'})
+    check_returncode(result)
+    import_times = {}
+
+    for line in result.stderr.split('\n'):
+        if line.startswith('import time:') and not line.endswith('imported package'):
+            self_time, cumulative_time, module = line[len('import time:'):].split('|')
+            import_times[module.strip()] = int(cumulative_time)
+
+    return import_times
+
+
+def test_import_time_hello():
+    imported = check_imports('hello')
+    assert 'qmk.cli.hello' in imported
+
+    for module in 'hid', 'usb.core', 'pygments', 'jsonschema', 'dotty_dict', 'hjson', 'qmk.cli.compile':
+        assert module not in imported
+
+
+def test_import_time_list_keyboards():
+    imported = check_imports('list-keyboards')
+    assert 'qmk.cli.list.keyboards' in imported
+
+    for module in 'hid', 'usb.core', 'pygments', 'jsonschema', 'dotty_dict', 'qmk.cli.hello':
+        assert module not in imported
+
+
 def test_cformat():
     result = check_subcommand('cformat', '-n', 'quantum/matrix.c')
     check_returncode(result)
@@ -130,6 +164,14 @@ def test_list_keymaps_vendor_kb_rev():
     assert 'default' and 'via' in result.stdout
 
 
+def test_list_keymaps_all():
+    result = check_subcommand('list-keymaps', '--all')
+    check_returncode(result)
+    records = {(record['keyboard'], record['keymap']): record for record in map(json.loads, result.stdout.splitlines())}
+    assert records['handwired/pytest/basic', 'default_json'] == {'keyboard': 'handwired/pytest/basic', 'keymap': 'default_json', 'path': 'keyboards/handwired/pytest/basic/keymaps/default_json', 'type': 'json', 'files': ['keymap.json'], 'layout': None}
+    assert records['handwired/pytest/has_community', 'test']['layout'] == 'ortho_1x1'
+
+
 def test_list_keymaps_no_keyboard_found():
     result = check_subcommand('list-keymaps', '-kb', 'asdfghjkl')
     check_returncode(result, [2])
@@ -217,6 +259,45 @@ def test_c2json_nocpp_stdin():
     assert result.stdout.strip() == '{"keyboard": "handwired/pytest/has_template", "documentation": "This file is a keymap.json file for handwired/pytest/has_template", "keymap": "default", "layout": "LAYOUT", "layers": [["KC_ENTER"]]}'
 
 
+def test_c2json_glob():
+    result = check_subcommand("c2json", "--glob", "keyboards/handwired/pytest/has_template/keymaps/*")
+    check_returncode(result)
+    records = [json.loads(line) for line in result.stdout.splitlines() if line.startswith('{')]
+    assert [record['keymap'] for record in records] == ['default', 'nocpp']
+    assert records[0]['result'] == {"keyboard": "handwired/pytest/has_template", "documentation": "This file is a keymap.json file for handwired/pytest/has_template", "keymap": "default", "layout": "LAYOUT_ortho_1x1", "layers": [["KC_A"]]}
+    assert records[1]['error'].startswith('CppError: ')
+
+
+def test_multibuild_merge(tmp_path):
+    build = {'run': '1', 'keyboard': 'handwired/pytest/basic', 'keymap': 'default', 'start': 100.0, 'seconds': 10.0, 'returncode': 0, 'warnings': 0, 'errors': 0, 'size': 1000}
+    cached_build = {**build, 'keymap': 'default_json', 'start': 200.0, 'seconds': 0.0, 'cached': True}
+    plan = {'targets': 3, 'plan': '0123'}
+    (tmp_path / 'shard1.jsonl').write_text(json.dumps({**plan, 'shard': '1/2'}) + '\n' + json.dumps({**build, 'shard': '1/2'}) + '\n' + json.dumps({**cached_build, 'shard': '1/2'}) + '\n')
+    (tmp_path / 'shard2.jsonl').write_text(json.dumps({**plan, 'shard': '2/2'}) + '\n' + json.dumps({**build, 'run': '2', 'keyboard': 'handwired/pytest/has_template', 'returncode': 2, 'shard': '2/2'}) + '\n')
+
+    result = check_subcommand('multibuild-merge', '-o', str(tmp_path / 'merged.jsonl'), str(tmp_path / 'shard1.jsonl'), str(tmp_path / 'shard2.jsonl'))
+    check_returncode(result, [1])
+    assert 'Merged 2 shards: 3 targets, 1 failed.' in result.stdout
+    assert '1 cached,    0 failed,     0.2 minutes wall time,      0.2 minutes of builds' in result.stdout
+    assert 'Build handwired/pytest/has_template:default failed with exit status 2.' in result.stdout
+    assert [json.loads(line)['run'] for line in (tmp_path / 'merged.jsonl').read_text().splitlines()] == ['1', '1', '1']
+
+
+def test_multibuild_merge_incomplete(tmp_path):
+    build = {'run': '1', 'keyboard': 'handwired/pytest/basic', 'keymap': 'default', 'start': 100.0, 'seconds': 10.0, 'returncode': 0, 'warnings': 0, 'errors': 0, 'size': 1000, 'shard': '1/2'}
+    (tmp_path / 'shard1.jsonl').write_text(json.dumps({'shard': '1/2', 'targets': 2, 'plan': '0123'}) + '\n' + json.dumps(build) + '\n')
+    (tmp_path / 'shard2.jsonl').write_text(json.dumps({'shard': '2/2', 'targets': 2, 'plan': '0123'}) + '\n')
+    (tmp_path / 'other.jsonl').write_text(json.dumps({'shard': '2/2', 'targets': 2, 'plan': '4567'}) + '\n')
+
+    result = check_subcommand('multibuild-merge', str(tmp_path / 'shard1.jsonl'), str(tmp_path / 'shard2.jsonl'))
+    check_returncode(result, [1])
+    assert 'Only 1 of the 2 planned targets have results.' in result.stdout
+
+    result = check_subcommand('multibuild-merge', str(tmp_path / 'shard1.jsonl'), str(tmp_path / 'other.jsonl'))
+    check_returncode(result, [1])
+    assert 'The shards were split from different plans' in result.stdout
+
+
 def test_clean():
     result = check_subcommand('clean', '-a')
     check_returncode(result)
@@ -228,6 +309,24 @@ def test_generate_api():
     check_returncode(result)
 
 
+def test_generate_api_parallel(tmp_path):
+    keyboards = ['-kb', 'handwired/pytest/basic', '-kb', 'handwired/pytest/has_template', '-kb', 'handwired/pytest/has_community']
+    outputs = {}
+
+    for name, parallel in (('serial', '1'), ('parallel', '2')):
+        output_dir = tmp_path / name
+        result = check_subcommand('generate-api', '--no-cache', '-o', str(output_dir), '-j', parallel, *keyboards)
+        check_returncode(result)
+        assert 'Processed 3 keyboards' in result.stdout
+
+        # Each run has its own timestamp, everything else must match byte for byte
+        outputs[name] = {path.relative_to(output_dir).as_posix(): re.sub(rb'"last_updated": "[^"]*"', b'', path.read_bytes()) for path in output_dir.rglob('*') if path.is_file()}
+
+    assert 'v1/keyboards/handwired/pytest/basic/info.json' in outputs['serial']
+    assert 'v1/keyboards.json' in outputs['serial']
+    assert outputs['parallel'] == outputs['serial']
+
+
 def test_generate_rgb_breathe_table():
     result = check_subcommand("generate-rgb-breathe-table", "-c", "1.2", "-m", "127")
     check_returncode(result)
@@ -264,6 +363,22 @@ def test_generate_layouts():
     assert '#define LAYOUT_custom(k0A) {' in result.stdout
 
 
+def test_generate_all(tmp_path):
+    result = check_subcommand('generate-all', '-kb', 'handwired/pytest/basic', '-o', str(tmp_path), '-q')
+    check_returncode(result)
+    assert result.stdout.strip().endswith('rules.mk')
+
+    assert 'MCU ?= atmega32u4' in (tmp_path / 'rules.mk').read_text()
+    assert '#   define MATRIX_COL_PINS { F4 }' in (tmp_path / 'info_config.h').read_text()
+    assert '#include "quantum.h"' in (tmp_path / 'default_keyboard.h').read_text()
+    assert '#define LAYOUT_custom(k0A) {' in (tmp_path / 'layouts.h').read_text()
+
+    # Files whose content did not change keep their mtime, so make does not rebuild what depends on them
+    mtimes = {path.name: path.stat().st_mtime_ns for path in tmp_path.iterdir()}
+    check_returncode(check_subcommand('generate-all', '-kb', 'handwired/pytest/basic', '-o', str(tmp_path), '-q'))
+    assert {path.name: path.stat().st_mtime_ns for path in tmp_path.iterdir()} == mtimes
+
+
 def test_format_json_keyboard():
     result = check_subcommand('format-json', '--format', 'keyboard', 'lib/python/qmk/tests/minimal_info.json')
     check_returncode(result)
@@ -0,0 +1,69 @@
+import os
+from pathlib import Path
+
+import qmk.build_cache
+import qmk.cache
+from qmk.build_cache import cached_build, evict_firmware_cache, firmware_fingerprint, restore_firmware, store_build
+
+
+def _use_cache_dir(monkeypatch, cache_dir):
+    monkeypatch.setattr(qmk.cache, 'CACHE_DIR', cache_dir)
+    monkeypatch.setattr(qmk.build_cache, 'FIRMWARE_CACHE_DIR', cache_dir / 'firmware')
+
+
+def test_firmware_fingerprint():
+    keymap_dir = Path('keyboards/handwired/pytest/basic/keymaps/default')
+
+    assert firmware_fingerprint('handwired/pytest/basic', 'default', keymap_dir) == firmware_fingerprint('handwired/pytest/basic', 'default', keymap_dir.resolve())
+    assert firmware_fingerprint('handwired/pytest/basic', 'default', keymap_dir) != firmware_fingerprint('handwired/pytest/has_template', 'default', keymap_dir)
+
+
+def test_store_build(tmp_path, monkeypatch):
+    _use_cache_dir(monkeypatch, tmp_path / 'cache')
+    firmware = tmp_path / 'handwired_pytest_basic_default.hex'
+    firmware.write_text(':00000001FF\n')
+
+    store_build('0123', {'returncode': 0, 'warnings': 1}, firmware)
+    store_build('4567', {'returncode': 2, 'warnings': 0}, build_log='[ERRORS]\n')
+
+    assert cached_build('0123') == {'returncode': 0, 'warnings': 1, 'artifact': '.hex', 'log': None}
+    assert cached_build('4567') == {'returncode': 2, 'warnings': 0, 'artifact': None, 'log': '[ERRORS]\n'}
+    assert (tmp_path / 'cache' / 'firmware' / '0123.hex').read_text() == ':00000001FF\n'
+    assert cached_build('89ab') is None
+
+
+def test_evict_firmware_cache(tmp_path, monkeypatch):
+    _use_cache_dir(monkeypatch, tmp_path / 'cache')
+    firmware_cache_dir = tmp_path / 'cache' / 'firmware'
+    firmware = tmp_path / 'firmware.bin'
+    firmware.write_bytes(bytes(1000))
+
+    for age, fingerprint in enumerate(('new', 'old')):
+        store_build(fingerprint, {'returncode': 0}, firmware)
+
+        for path in firmware_cache_dir.glob(f'{fingerprint}.*'):
+            os.utime(path, (1000 - age, 1000 - age))
+
+    assert evict_firmware_cache(4000) == 0
+    assert evict_firmware_cache(1500) == 1
+    assert sorted(path.name for path in firmware_cache_dir.iterdir()) == ['new.bin', 'new.json']
+
+
+def test_cached_build_missing_firmware(tmp_path, monkeypatch):
+    _use_cache_dir(monkeypatch, tmp_path / 'cache')
+    firmware_cache_dir = tmp_path / 'cache' / 'firmware'
+    firmware = tmp_path / 'firmware.hex'
+    firmware.write_text(':00000001FF\n')
+
+    store_build('0123', {'returncode': 0}, firmware)
+    (firmware_cache_dir / '0123.hex').unlink()
+
+    assert cached_build('0123') is None
+    assert list(firmware_cache_dir.iterdir()) == []
+
+
+def test_restore_firmware_missing(tmp_path, monkeypatch):
+    _use_cache_dir(monkeypatch, tmp_path / 'cache')
+
+    assert not restore_firmware('0123', {'artifact': '.hex'}, 'handwired/pytest/basic', 'default')
+    assert restore_firmware('4567', {'artifact': None}, 'handwired/pytest/basic', 'default')
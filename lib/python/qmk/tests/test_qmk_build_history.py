@@ -0,0 +1,63 @@
+import os
+
+import qmk.build_history
+from qmk.build_history import flaky_targets, load_build_history, parse_build_log, record_builds, regressed_targets, slowest_targets
+from qmk.cli.multibuild import _collect_build
+
+
+def _build(run, keyboard, seconds, returncode=0):
+    return {'run': run, 'keyboard': keyboard, 'keymap': 'default', 'seconds': seconds, 'returncode': returncode, 'warnings': 0, 'errors': 0, 'size': None}
+
+
+def test_parse_build_log():
+    build_log = 'Compiling: quantum/quantum.c [WARNINGS]\nCompiling: quantum/keymap.c [OK]\n\n   text\t   data\t    bss\t    dec\t    hex\tfilename\n      0\t  22434\t      0\t  22434\t   57a2\t.build/planck_rev6_default.hex\n'
+
+    assert parse_build_log(build_log) == {'warnings': 1, 'errors': 0, 'size': 22434}
+    assert parse_build_log('Compiling: quantum/quantum.c [ERRORS]\n') == {'warnings': 0, 'errors': 1, 'size': None}
+
+
+def test_record_builds(tmp_path, monkeypatch):
+    monkeypatch.setattr(qmk.build_history, 'BUILD_HISTORY_FILE', tmp_path / 'multibuild_history.jsonl')
+    monkeypatch.setattr(qmk.build_history, 'BUILD_HISTORY_RUNS', 2)
+
+    for run in '1', '2', '3':
+        record_builds([_build(run, 'planck/rev6', 10.0)])
+
+    assert [build['run'] for build in load_build_history()] == ['2', '3']
+
+
+def test_report_targets():
+    history = [
+        _build('1', 'a', 10.0),
+        _build('1', 'b', 20.0),
+        _build('1', 'c', 5.0),
+        _build('2', 'a', 30.0),
+        _build('2', 'b', 20.0),
+        _build('2', 'c', 5.0, returncode=2),
+        _build('3', 'a', 30.0),
+        _build('3', 'b', 21.0),
+        _build('3', 'c', 5.0),
+    ]
+
+    assert slowest_targets(history, 2) == [(('a', 'default'), 30.0, 3), (('b', 'default'), 20.0, 3)]
+    assert regressed_targets(history, 10) == [(('a', 'default'), 20.0, 30.0), (('b', 'default'), 20.0, 21.0)]
+    assert flaky_targets(history, 10) == [(('c', 'default'), 2, 1, 3)]
+
+
+def test_collect_build(tmp_path):
+    pid = os.getpid()
+
+    for target, returncode in ('a_default', '0'), ('b_default', '2'), ('c_default', '130'), ('d_default', None):
+        (tmp_path / f'build.start.{pid}.{target}').touch()
+        (tmp_path / f'build.log.{pid}.{target}').write_text('Compiling: quantum/quantum.c [OK]\n')
+
+        if returncode is not None:
+            (tmp_path / f'build.returncode.{pid}.{target}').write_text(returncode + '\n')
+
+    assert _collect_build(tmp_path, '1', 'a', 'default')['returncode'] == 0
+    assert _collect_build(tmp_path, '1', 'b', 'default')['returncode'] == 2
+
+    # Builds killed by a signal, or interrupted before make exited, did not finish
+    assert _collect_build(tmp_path, '1', 'c', 'default') is None
+    assert _collect_build(tmp_path, '1', 'd', 'default') is None
+    assert list(tmp_path.iterdir()) == []
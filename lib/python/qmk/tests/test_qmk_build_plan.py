@@ -0,0 +1,50 @@
+from qmk.build_plan import DEFAULT_BUILD_SECONDS, longest_first, plan_digest, predict_durations, predict_schedule, shard_targets
+
+
+def test_predict_durations():
+    history = [
+        {
+            'run': '1',
+            'keyboard': 'planck/rev6',
+            'keymap': 'default',
+            'seconds': 50.0,
+            'returncode': 0
+        },
+        {
+            'run': '1',
+            'keyboard': 'handwired/pytest/basic',
+            'keymap': 'default',
+            'seconds': 5.0,
+            'returncode': 2
+        },
+    ]
+    targets = [('planck/rev6', 'default'), ('planck/rev6', 'test'), ('handwired/pytest/basic', 'default')]
+
+    assert predict_durations(targets, history) == {
+        ('planck/rev6', 'default'): 50.0,
+        ('planck/rev6', 'test'): 50.0,
+        ('handwired/pytest/basic', 'default'): DEFAULT_BUILD_SECONDS['avr'],
+    }
+
+
+def test_shard_targets():
+    durations = {'a': 10.0, 'b': 7.0, 'c': 5.0, 'd': 4.0, 'e': 3.0}
+
+    assert shard_targets(durations, 2) == [['a', 'd'], ['b', 'c', 'e']]
+    assert shard_targets(durations, 6)[5] == []
+
+
+def test_predict_schedule():
+    durations = {'a': 1.0, 'b': 1.0, 'c': 1.0, 'd': 1.0, 'e': 5.0}
+
+    assert longest_first(durations) == ['e', 'a', 'b', 'c', 'd']
+    assert predict_schedule(durations, sorted(durations), 2) == (7.0, ['a', 'c', 'e'])
+    assert predict_schedule(durations, longest_first(durations), 2) == (5.0, ['e'])
+
+
+def test_plan_digest():
+    durations = {('a', 'default'): 10.0, ('b', 'default'): 20.0}
+
+    assert plan_digest(durations) == plan_digest(dict(reversed(list(durations.items()))))
+    assert plan_digest(durations) != plan_digest({**durations, ('b', 'default'): 21.0})
+    assert plan_digest(durations) != plan_digest({('a', 'default'): 10.0})
@@ -0,0 +1,49 @@
+import pytest
+
+from qmk.c_keymap_lexer import iter_keymap_tokens
+from qmk.errors import CLexerUnsupportedError
+from qmk.keymap import _get_layers, _parse_layers, _pygments_tokens
+
+keymap_c = '''#include QMK_KEYBOARD_H
+
+enum layers { _BASE, _FN };
+
+// Base layer
+const uint16_t PROGMEM keymaps[][MATRIX_ROWS][MATRIX_COLS] = {
+    [_BASE] = LAYOUT(KC_A, LT(_FN, KC_B), 0x1F),
+#if 0
+    [2] = LAYOUT(KC_C, KC_D, KC_E),
+#endif
+    [_FN] = LAYOUT(KC_TRNS, /* mod */ LCTL(KC_C), -1)
+};
+
+void keyboard_post_init_user(void) {}
+'''
+
+
+def test_iter_keymap_tokens():
+    tokens = [token for token in iter_keymap_tokens(keymap_c) if token[0] != 'other']
+
+    assert tokens[:8] == [('punct', '{'), ('punct', '}'), ('keyword', 'const'), ('type', 'uint16_t'), ('name', 'PROGMEM'), ('name', 'keymaps'), ('punct', '['), ('punct', ']')]
+    assert ('integer', '-1') in tokens
+    assert ('name', 'KC_C') in tokens
+    assert ('name', 'KC_D') not in tokens
+    assert ('name', 'keyboard_post_init_user') not in tokens
+
+
+def test_get_layers_matches_pygments():
+    layers = _get_layers(keymap_c)
+
+    assert layers == _parse_layers(_pygments_tokens(keymap_c))
+    assert [layer['name'] for layer in layers] == ['_BASE', '_FN']
+    assert layers[1]['keycodes'] == ['KC_TRNS', 'LCTL(KC_C)']
+
+
+def test_get_layers_unsupported():
+    # Unbalanced brackets keep the array open, so the function below would have to be lexed like pygments does
+    keymap_with_function = 'const uint16_t PROGMEM keymaps[][MATRIX_ROWS][MATRIX_COLS] = {\n    [0] = LAYOUT(KC_A}\n};\nbool g(void) { return true; }\n'
+
+    with pytest.raises(CLexerUnsupportedError):
+        list(iter_keymap_tokens(keymap_with_function))
+
+    assert _get_layers(keymap_with_function) == _parse_layers(_pygments_tokens(keymap_with_function))
@@ -0,0 +1,73 @@
+import pytest
+
+from qmk.c_parse import config_h_dependency, evaluate_c_condition, parse_config_h_file
+
+
+def test_parse_config_h_file_conditionals(tmp_path):
+    config_h_file = tmp_path / 'config.h'
+    config_h_file.write_text('#define LEDS 4\n#ifdef RGBLIGHT_ENABLE\n#    define RGBLED_NUM LEDS\n#else\n#    define NO_RGB\n#endif\n#if LEDS * 2 > 6 && !defined(NO_DEBUG)\n#    define DOUBLED\n#elif 1\n#    define NOT_DOUBLED\n#endif\n')
+
+    assert parse_config_h_file(config_h_file, predefined={'RGBLIGHT_ENABLE': '1'}) == {'LEDS': '4', 'RGBLED_NUM': 'LEDS', 'DOUBLED': True}
+    assert parse_config_h_file(config_h_file, predefined={'RGBLIGHT_ENABLE': False}) == {'LEDS': '4', 'NO_RGB': True, 'DOUBLED': True}
+
+
+def test_parse_config_h_file_undecided(tmp_path):
+    config_h_file = tmp_path / 'config.h'
+    config_h_file.write_text('#ifdef RGB_MATRIX_ENABLE\n#    define DRIVER_LED_TOTAL 12\n#else\n#    define RGBLED_NUM 12\n#endif\n#ifdef NOT_DEFINED\n#    define SKIPPED\n#endif\n')
+
+    assert parse_config_h_file(config_h_file) == {'DRIVER_LED_TOTAL': '12', 'RGBLED_NUM': '12'}
+
+
+def test_parse_config_h_file_include(tmp_path):
+    (tmp_path / 'rev1').mkdir()
+    (tmp_path / 'serial_config.h').write_text('#define SOFT_SERIAL_PIN D0\n#include "rev1/config.h"\n')
+    (tmp_path / 'rev1' / 'config.h').write_text('#pragma once\n#include "../serial_config.h"\n#define MATRIX_ROWS 4\n')
+    config_h_file = tmp_path / 'config.h'
+    config_h_file.write_text('#include "serial_config.h"\n#include "config_common.h"\n')
+
+    assert parse_config_h_file(config_h_file) == {}
+    assert parse_config_h_file(config_h_file, include_dirs=[tmp_path, tmp_path / 'rev1']) == {'SOFT_SERIAL_PIN': 'D0', 'MATRIX_ROWS': '4'}
+
+
+def test_parse_config_h_file_dependencies(tmp_path):
+    (tmp_path / 'rev1').mkdir()
+    (tmp_path / 'rev1' / 'config.h').write_text('#define MATRIX_ROWS 4\n')
+    config_h_file = tmp_path / 'config.h'
+    config_h_file.write_text('#define LEDS 4\n#if defined(KEYBOARD_test_rev1) && LEDS\n#    include "rev1/config.h"\n#endif\n')
+    predefined = {'KEYBOARD_test': '1', 'KEYBOARD_test_rev1': '1'}
+    include_dirs = [tmp_path, tmp_path / 'rev1']
+    dependencies = {}
+
+    assert parse_config_h_file(config_h_file, predefined=predefined, include_dirs=include_dirs, dependencies=dependencies) == {'LEDS': '4', 'MATRIX_ROWS': '4'}
+    assert {dependency: config_h_dependency(dependency, predefined, include_dirs) for dependency in dependencies} == dependencies
+    assert [dependency[:2] for dependency in dependencies] == [('macro', 'KEYBOARD_test_rev1'), ('include', 'rev1/config.h')]
+    assert config_h_dependency(('macro', 'KEYBOARD_test_rev1', None), {'KEYBOARD_test': '1'}) != dependencies[('macro', 'KEYBOARD_test_rev1', None)]
+    assert config_h_dependency(('include', 'rev1/config.h', str(tmp_path)), predefined, [tmp_path]) is None
+
+
+@pytest.mark.parametrize(
+    'expression, expected', [
+        ('4 & 1 == 0', False),
+        ('2 == 2 == 1', True),
+        ('3 > 2 > 1', False),
+        ('-3/2 == -1', True),
+        ('-3 % 2 == -1', True),
+        ('!0 == 2', False),
+        ('2 + 3 * 4 == 14', True),
+        ('1 ? 0 : 1', False),
+        ('0 && 1/0', False),
+        ('1 || 1/0', True),
+        ('-1 < 0u', False),
+        ('0xFFFFFFFFFFFFFFFF == -1', True),
+        ('010 == 8', True),
+        ('1UL << 5 == 32', True),
+        ('1/0', None),
+        ('1 << 64', None),
+        ('1.5', None),
+        ('08', None),
+        ('1 +', None),
+        ('(1', None),
+    ]
+)
+def test_evaluate_c_condition(expression, expected):
+    assert evaluate_c_condition(expression) is expected
@@ -0,0 +1,26 @@
+import pytest
+
+from qmk.c_preprocessor import preprocess
+from qmk.errors import CppUnsupportedError
+
+
+def test_preprocess_macros():
+    keymap_c = '#define LAYOUT(k0, k1) { k0, k1 }\n#define STR(x) #x\n#define CAT(a, b) a ## b\n#define EMPTY\nconst char *s = STR(a  "b");\nint CAT(x, 1) = 2;\nint keys[] = LAYOUT(KC_A,\n    KC_B);\n'
+
+    assert preprocess(keymap_c) == '# 1 "<stdin>"\n\n\n\n\nconst char *s = "a \\"b\\"";\nint x1 = 2;\nint keys[] = { KC_A, KC_B }\n         ;\n'
+
+
+def test_preprocess_include_conditionals(tmp_path):
+    (tmp_path / 'layers.h').write_text('#define MAX 3\n')
+    keymap_c = tmp_path / 'keymap.c'
+    keymap_c.write_text('#include "layers.h"\n#if defined(FOO) || MAX > 2\nint big;\n#else\nint small;\n#endif\n')
+
+    assert preprocess(keymap_c.read_text(), keymap_c) == f'# 1 "{keymap_c}"\n# 1 "{tmp_path}/layers.h" 1\n# 2 "{keymap_c}" 2\n\nint big;\n'
+
+
+def test_preprocess_unsupported():
+    with pytest.raises(CppUnsupportedError):
+        preprocess('#include <stdio.h>\n')
+
+    with pytest.raises(CppUnsupportedError):
+        preprocess('int line = __LINE__;\n')
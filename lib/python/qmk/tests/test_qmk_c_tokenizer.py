@@ -0,0 +1,35 @@
+from qmk.c_tokenizer import iter_directives
+
+
+def test_iter_directives():
+    directives = list(iter_directives('#pragma once\n\nint x; // #define NOT_THIS\n  #   define FOO 1 /* one */\n#undef BAR\n'))
+
+    assert [(d.directive, d.name, d.value, d.line, d.column) for d in directives] == [
+        ('pragma', None, 'once', 1, 1),
+        ('define', 'FOO', '1', 4, 3),
+        ('undef', 'BAR', '', 5, 1),
+    ]
+
+
+def test_iter_directives_continuation():
+    define, = iter_directives('/* a\n * comment\n */\n#define LAYOUT( \\\n    k00, k01 \\\n) { \\\n    { k00, k01 } \\\n}\nint y;\n')
+
+    assert define.line == 4
+    assert define.name == 'LAYOUT'
+    assert define.full_name == 'LAYOUT(     k00, k01 )'
+    assert ''.join(define.params.split()) == 'k00,k01'
+    assert ''.join(define.value.split()) == '{{k00,k01}}'
+
+
+def test_iter_directives_comments_and_literals():
+    text = '/*\n#define IN_COMMENT\n*/\n#define STR "/* not a comment */" // trailing\nconst char *s = "#define IN_STRING";\n#define EMPTY\n'
+    directives = list(iter_directives(text))
+
+    assert [(d.name, d.value, d.line) for d in directives] == [('STR', '"/* not a comment */"', 4), ('EMPTY', '', 6)]
+
+
+def test_iter_directives_incomplete():
+    define, = iter_directives('#define\n')
+
+    assert define.directive == 'define'
+    assert define.name is None
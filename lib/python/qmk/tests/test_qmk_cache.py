@@ -0,0 +1,19 @@
+import os
+
+import qmk.cache
+from qmk.cache import cache_get, cache_put, evict_cache
+
+
+def test_evict_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(qmk.cache, 'CACHE_DIR', tmp_path)
+    namespace_dir = tmp_path / 'test_evict'
+
+    for age, key in enumerate(('new', 'old', 'used')):
+        cache_put('test_evict', key, {'data': 'x' * 1000})
+        os.utime(namespace_dir / f'{key}.json', (1000 - age, 1000 - age))
+
+    assert cache_get('test_evict', 'used') == {'data': 'x' * 1000}
+    assert evict_cache('test_evict', 4000) == 0
+    assert evict_cache('test_evict', 2500) == 1
+    assert sorted(path.name for path in namespace_dir.iterdir()) == ['new.json', 'used.json']
+    assert evict_cache('test_missing', 0) == 0
@@ -0,0 +1,35 @@
+import json
+
+from qmk.cli.generate.api import KeyboardsJSONWriter
+from qmk.info import info_json
+from qmk.json_encoders import InfoJSONEncoder
+
+
+def check_keyboards_json(tmp_path, kb_all):
+    keyboards_file = tmp_path / 'keyboards.json'
+    writer = KeyboardsJSONWriter(keyboards_file, '2021-01-01 00:00:00 GMT')
+
+    for keyboard_name in sorted(kb_all):
+        writer.write(keyboard_name, kb_all[keyboard_name])
+
+    writer.commit()
+
+    assert keyboards_file.read_text() == json.dumps({'last_updated': '2021-01-01 00:00:00 GMT', 'keyboards': kb_all}, cls=InfoJSONEncoder)
+    assert list(tmp_path.iterdir()) == [keyboards_file]
+
+
+def test_keyboards_json_writer(tmp_path):
+    check_keyboards_json(tmp_path, {keyboard: info_json(keyboard) for keyboard in ('handwired/pytest/has_template', 'handwired/pytest/basic')})
+
+
+def test_keyboards_json_writer_empty(tmp_path):
+    check_keyboards_json(tmp_path, {})
+
+
+def test_keyboards_json_writer_discard(tmp_path):
+    keyboards_file = tmp_path / 'keyboards.json'
+    writer = KeyboardsJSONWriter(keyboards_file, '2021-01-01 00:00:00 GMT')
+    writer.write('handwired/pytest/basic', info_json('handwired/pytest/basic'))
+    writer.discard()
+
+    assert not any(tmp_path.iterdir())
@@ -0,0 +1,16 @@
+import qmk.cache
+import qmk.info
+
+
+def test_info_json_digest_stable():
+    assert qmk.info.info_json_digest('handwired/pytest/basic') == qmk.info.info_json_digest('handwired/pytest/basic')
+    assert qmk.info.info_json_digest('handwired/pytest/basic') != qmk.info.info_json_digest('handwired/pytest/has_template')
+
+
+def test_info_json_cache_hit():
+    fresh = qmk.info._build_info_json('handwired/pytest/basic')
+    qmk.info.info_json('handwired/pytest/basic')
+    hits = qmk.cache.cache_stats.get(qmk.info.INFO_JSON_CACHE, {}).get('hits', 0)
+
+    assert qmk.info.info_json('handwired/pytest/basic') == fresh
+    assert qmk.cache.cache_stats[qmk.info.INFO_JSON_CACHE]['hits'] == hits + 1
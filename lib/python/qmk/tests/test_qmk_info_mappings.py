@@ -0,0 +1,47 @@
+import pytest
+
+from qmk.info_mappings import get_info_value, info_config_map, info_rules_map, set_info_value
+
+
+def mapping_entry(mapping, key):
+    return next(entry for entry in mapping if entry[0] == key)
+
+
+def test_mappings_compiled_once():
+    assert info_config_map() is info_config_map()
+    assert info_rules_map() is info_rules_map()
+
+
+def test_info_config_converters():
+    _, info_key, info_path, to_json, to_c, _ = mapping_entry(info_config_map(), 'RGBLED_SPLIT')
+
+    assert info_key == 'rgblight.split_count'
+    assert info_path == ('rgblight', 'split_count')
+    assert to_json('{ 6, 6 }') == [6, 6]
+    assert to_c('RGBLED_SPLIT', [6, 6]) == ['', '#ifndef RGBLED_SPLIT', '#   define RGBLED_SPLIT { 6, 6 }', '#endif // RGBLED_SPLIT']
+    assert mapping_entry(info_config_map(), 'PRODUCT_ID')[3]('0xabcd') == '0xABCD'
+    assert mapping_entry(info_config_map(), 'PRODUCT')[3] is None
+
+
+def test_info_rules_converters():
+    _, _, _, to_json, to_c, warn_duplicate = mapping_entry(info_rules_map(), 'MCU')
+
+    assert to_json('atmega32u4') == 'atmega32u4'
+    assert to_c('MCU', 'atmega32u4') == 'MCU ?= atmega32u4'
+    assert warn_duplicate is False
+    assert mapping_entry(info_rules_map(), 'LAYOUTS')[3]('ortho_4x4  ortho_4x12') == ['ortho_4x4', 'ortho_4x12']
+
+
+def test_info_value_paths():
+    info_data = {'usb': {'vid': '0xFEED'}, 'rgblight': None}
+
+    assert get_info_value(info_data, ('usb', 'vid')) == '0xFEED'
+    assert get_info_value(info_data, ('rgblight', 'pin')) is None
+
+    with pytest.raises(KeyError):
+        get_info_value(info_data, ('usb', 'pid'))
+
+    set_info_value(info_data, ('rgblight', 'pin'), 'B0')
+    set_info_value(info_data, ('usb', 'pid'), '0x0000')
+
+    assert info_data == {'usb': {'vid': '0xFEED', 'pid': '0x0000'}, 'rgblight': {'pin': 'B0'}}
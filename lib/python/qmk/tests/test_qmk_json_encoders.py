@@ -0,0 +1,43 @@
+import json
+from decimal import Decimal
+from pathlib import Path
+
+from qmk.json_encoders import InfoJSONEncoder, KeymapJSONEncoder
+
+TESTS_DIR = Path(__file__).parent
+
+
+def check_golden(golden_file, encoder):
+    """The golden files were written by the encoder, so encoding what they contain must reproduce them byte for byte.
+    """
+    golden = (TESTS_DIR / golden_file).read_text(encoding='utf-8')
+
+    assert json.dumps(json.loads(golden), cls=encoder) + '\n' == golden
+
+
+def test_info_json_golden():
+    check_golden('golden_keyboards.json', InfoJSONEncoder)
+
+
+def test_keymap_json_golden():
+    check_golden('golden_keymap.json', KeymapJSONEncoder)
+
+
+def test_info_json_fixture():
+    info_json = (TESTS_DIR / 'info.json').read_text(encoding='utf-8')
+
+    assert json.dumps(json.loads(info_json), cls=InfoJSONEncoder) == info_json
+
+
+def test_info_json_indent():
+    assert json.dumps({'a': [1, {'b': 2}]}, indent=2, cls=InfoJSONEncoder) == '{\n  "a": [\n    1,\n    {\n      "b": 2\n    }\n  ]\n}'
+
+
+def test_info_json_primitives():
+    assert json.dumps({'a': (1, 2.5, True, None), 'b': Decimal('2'), 'c': 'é'}, ensure_ascii=False, cls=InfoJSONEncoder) == '{\n    "a": [1, 2.5, true, null],\n    "b": 2,\n    "c": "é"\n}'
+
+
+def test_keymap_json_newline():
+    keymap_json = json.dumps({'layers': [['KC_A', 'JSON_NEWLINE', 'KC_B']]}, cls=KeymapJSONEncoder)
+
+    assert keymap_json == '{\n    "layers": [\n                [\n                        "KC_A"\n                        "KC_B"\n                ]\n    ]\n}'
@@ -0,0 +1,62 @@
+import traceback
+from pathlib import Path
+
+import jsonschema
+
+import qmk.cache
+import qmk.json_schema
+
+
+def test_compiled_validator_reused():
+    assert qmk.json_schema.compiled_validator('keyboard') is qmk.json_schema.compiled_validator('keyboard')
+
+
+def test_keyboard_validate_file_cached():
+    info_file = Path('keyboards/handwired/pytest/basic/info.json')
+    info_data = qmk.json_schema.json_load(info_file)
+
+    qmk.json_schema.keyboard_validate_file(info_file, info_data)
+    hits = qmk.cache.cache_stats['keyboard_validation']['hits']
+    qmk.json_schema.keyboard_validate_file(info_file, info_data)
+
+    assert qmk.cache.cache_stats['keyboard_validation']['hits'] == hits + 1
+
+
+def test_json_load_strict_matches_hjson():
+    info_file = Path('keyboards/handwired/pytest/basic/info.json')
+
+    assert qmk.json_schema.json_load(info_file) == qmk.json_schema.hjson.load(info_file.open(encoding='utf-8'))
+
+
+def test_json_load_cache_returns_copy():
+    aliases_file = Path('data/mappings/keyboard_aliases.json')
+    aliases = qmk.json_schema.json_load(aliases_file, cache=True)
+    aliases.clear()
+
+    assert qmk.json_schema.json_load(aliases_file, cache=True)
+
+
+def test_json_load_float_values(tmp_path):
+    json_file = tmp_path / 'numbers.json'
+    json_file.write_text('{"whole": 6.0, "fraction": 1.5, "huge": 1e400}')
+    numbers = qmk.json_schema.json_load(json_file)
+
+    assert numbers == {'whole': 6, 'fraction': 1.5, 'huge': float('inf')}
+    assert isinstance(numbers['whole'], int)
+
+
+def test_keyboard_validate_file_error_copied(tmp_path):
+    info_file = tmp_path / 'info.json'
+    info_file.write_text('{"keyboard_name": 1}')
+    errors = []
+
+    for _ in range(3):
+        try:
+            qmk.json_schema.keyboard_validate_file(info_file, qmk.json_schema.json_load(info_file))
+
+        except jsonschema.ValidationError as e:
+            errors.append(e)
+
+    assert len({id(error) for error in errors}) == 3
+    assert errors[1].message == errors[2].message == errors[0].message
+    assert len(traceback.extract_tb(errors[2].__traceback__)) == len(traceback.extract_tb(errors[1].__traceback__))
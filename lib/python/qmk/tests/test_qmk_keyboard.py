@@ -0,0 +1,61 @@
+import qmk.cache
+import qmk.keyboard
+import qmk.keyboard_index
+
+
+def test_config_h_chain_reused():
+    qmk.keyboard.config_h('handwired/pytest/basic')
+    hits = qmk.cache.cache_stats['config_h_chains']['hits']
+    config = qmk.keyboard.config_h('handwired/pytest/basic')
+
+    assert config['MATRIX_ROWS'] == '1'
+    assert qmk.cache.cache_stats['config_h_chains']['hits'] > hits
+
+
+def test_config_h_chain_shared_by_siblings():
+    qmk.keyboard._config_h_chains.clear()
+    qmk.keyboard.config_h('handwired/pytest/basic')
+    hits = qmk.cache.cache_stats['config_h_chains']['hits']
+    qmk.keyboard.config_h('handwired/pytest/has_template')
+
+    # keyboards/handwired/config.h and keyboards/handwired/pytest/config.h only depend on macros the two keyboards share
+    assert qmk.cache.cache_stats['config_h_chains']['hits'] == hits + 2
+
+
+def test_rules_mk_chain_shared_by_siblings():
+    qmk.keyboard._rules_mk_chains.clear()
+    qmk.keyboard.rules_mk('handwired/pytest/basic')
+    hits = qmk.cache.cache_stats['rules_mk_chains']['hits']
+    qmk.keyboard.rules_mk('handwired/pytest/has_template')
+
+    # keyboards/handwired/rules.mk and keyboards/handwired/pytest/rules.mk are shared
+    assert qmk.cache.cache_stats['rules_mk_chains']['hits'] == hits + 2
+
+
+def test_rules_mk_appends_once():
+    assert qmk.keyboard.rules_mk('xw60')['HAPTIC_ENABLE'] == 'SOLENOID'
+
+
+def test_rules_mk_returns_copy():
+    rules = qmk.keyboard.rules_mk('handwired/pytest/basic')
+    rules['TEST_ONLY_RULE'] = 'yes'
+
+    assert 'TEST_ONLY_RULE' not in qmk.keyboard.rules_mk('handwired/pytest/basic')
+
+
+def test_keyboard_index():
+    keyboard = qmk.keyboard_index.keyboard_index()['keyboards']['handwired/pytest/basic']
+
+    assert keyboard['folder'] == 'handwired/pytest/basic'
+    assert keyboard['rules_mk'] == ['keyboards/handwired/pytest/basic/rules.mk']
+    assert 'keyboards/handwired/pytest/basic/keymaps/default_json' in keyboard['keymaps']
+    assert 'handwired/pytest/basic' in qmk.keyboard.list_keyboards()
+
+
+def test_config_h_predefined():
+    predefined = qmk.keyboard.config_h_predefined('handwired/pytest/basic')
+
+    assert predefined['KEYBOARD_handwired_pytest_basic'] == '1'
+    assert predefined['KEYBOARD_handwired'] == '1'
+    assert predefined['__AVR__'] == '1'
+    assert predefined['__arm__'] is False
@@ -0,0 +1,43 @@
+import pytest
+
+from qmk.errors import FilterSyntaxError
+from qmk.keyboard_filter import parse_filter
+
+attributes = {
+    'keyboard': 'planck/rev6',
+    'MCU': 'STM32F303',
+    'SPLIT_KEYBOARD': 'no',
+    'features.rgb_matrix': True,
+    'matrix_size.rows': 8,
+    'usb.vid': '0x03A8',
+    'layouts': ['LAYOUT_ortho_4x12', 'LAYOUT_planck_mit'],
+}
+
+
+@pytest.mark.parametrize(
+    'text, expected', [
+        ('MCU in (STM32F303, RP2040) and features.rgb_matrix', True),
+        ('MCU not in (STM32F303, RP2040)', False),
+        ('mcu_missing or MCU=stm32f3*', True),
+        ('SPLIT_KEYBOARD=yes', False),
+        ('SPLIT_KEYBOARD = off', True),
+        ('not SPLIT_KEYBOARD', True),
+        ('features.rgb_matrix = yes', True),
+        ('matrix_size.rows >= 8 and matrix_size.rows < 10', True),
+        ('usb.vid == 936', True),
+        ('layouts = "*_mit"', True),
+        ('planck/*', True),
+        ('keyboard = preonic/*', False),
+        ('BOOTLOADER = stm32-dfu', False),
+        ('BOOTLOADER != stm32-dfu', True),
+        ('not (MCU = RP2040 or features.rgb_matrix)', False),
+    ]
+)
+def test_parse_filter(text, expected):
+    assert parse_filter(text)(attributes) is expected
+
+
+@pytest.mark.parametrize('text', ['', 'MCU in (', 'MCU = ', 'MCU STM32F303', 'MCU ! RP2040', '(MCU = RP2040', 'and'])
+def test_parse_filter_syntax_error(text):
+    with pytest.raises(FilterSyntaxError):
+        parse_filter(text)
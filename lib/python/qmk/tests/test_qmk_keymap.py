@@ -1,4 +1,7 @@
+from pathlib import Path
+
 import qmk.keymap
+import qmk.keymap_index
 
 
 def test_template_c_pytest_basic():
@@ -37,3 +40,20 @@ def test_parse_keymap_c():
 
 
 # FIXME(skullydazed): Add a test for qmk.keymap.write that mocks up an FD.
+
+
+def test_keymap_index():
+    keymap = qmk.keymap_index.keymap_index()['keymaps']['keyboards/handwired/pytest/basic/keymaps/default_json']
+
+    assert keymap['type'] == 'json'
+    assert 'keyboards/handwired/pytest/basic/keymaps/default' in qmk.keymap_index.keymap_dirs('handwired/pytest/basic')
+
+
+def test_locate_keymaps():
+    assert qmk.keymap.locate_keymaps('handwired/pytest/has_template', ['default*']) == {
+        'default': Path('keyboards/handwired/pytest/has_template/keymaps/default/keymap.c'),
+        'default_json': Path('keyboards/handwired/pytest/has_template/keymaps/default_json/keymap.json'),
+    }
+    assert qmk.keymap.locate_keymaps('handwired/pytest/has_community', ['*']) == {'test': Path('layouts/community/ortho_1x1/test/keymap.c')}
+    assert qmk.keymap.locate_keymaps('handwired/pytest/has_community', ['*'], community=False) == {}
+    assert qmk.keymap.locate_keymaps('handwired/pytest/has_community', ['test'], community=False) == {'test': Path('layouts/community/ortho_1x1/test/keymap.c')}